@@ -0,0 +1,153 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from llm_service.app.batching import BatchScheduler
+from llm_service.app.executor import DeadlineExceededError, InferenceExecutor
+
+
+class StubModel:
+    """run_batch stand-in that records every batch and echoes its prompts."""
+
+    def __init__(self):
+        self.batches = []
+        # Cleared to hold the inference worker inside the current batch
+        self.running = threading.Event()
+        self.running.set()
+
+    def run_batch(self, prompts, prefixes):
+        self.running.wait(5)
+        self.batches.append(list(prompts))
+        return [f"reply to {prompt}" for prompt in prompts]
+
+
+def make_scheduler(model, executor, **kwargs):
+    kwargs.setdefault("max_wait_ms", 50)
+    return BatchScheduler(model.run_batch, lambda prompt: len(prompt.split()), 16, executor, **kwargs)
+
+
+def test_concurrent_requests_share_one_batch():
+    model, executor = StubModel(), InferenceExecutor(max_workers=1)
+
+    async def scenario():
+        scheduler = make_scheduler(model, executor, max_batch_size=4)
+        results = await asyncio.gather(*(scheduler.submit(f"prompt {i}") for i in range(4)))
+        await scheduler.aclose()
+        return results, scheduler.stats()
+
+    try:
+        results, stats = asyncio.run(scenario())
+    finally:
+        executor.shutdown()
+    assert [result for result, _, _ in results] == [f"reply to prompt {i}" for i in range(4)]
+    assert model.batches == [[f"prompt {i}" for i in range(4)]]
+    assert stats["batches"] == 1 and stats["avg_batch_size"] == 4
+
+
+def test_batches_are_split_by_size_and_padded_tokens():
+    model, executor = StubModel(), InferenceExecutor(max_workers=1)
+
+    async def scenario():
+        # Two 4-token prompts plus 16 new tokens each fill the 40-token budget
+        scheduler = make_scheduler(model, executor, max_batch_size=8, max_batch_tokens=40)
+        await asyncio.gather(*(scheduler.submit(f"a b c {i}") for i in range(5)))
+        await scheduler.aclose()
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        executor.shutdown()
+    assert [len(batch) for batch in model.batches] == [2, 2, 1]
+
+
+def test_batches_run_concurrently_on_each_inference_worker():
+    executor = InferenceExecutor(max_workers=2)
+    # Both batches have to be generating at once to get past the barrier
+    both_running = threading.Barrier(2, timeout=5)
+
+    def run_batch(prompts, prefixes):
+        both_running.wait()
+        return [f"reply to {prompt}" for prompt in prompts]
+
+    async def scenario():
+        scheduler = BatchScheduler(run_batch, len, 16, executor, max_batch_size=1, max_wait_ms=0)
+        results = await asyncio.gather(scheduler.submit("a"), scheduler.submit("b"))
+        await scheduler.aclose()
+        return results
+
+    try:
+        results = asyncio.run(scenario())
+    finally:
+        executor.shutdown()
+    assert [result for result, _, _ in results] == ["reply to a", "reply to b"]
+
+
+def test_failed_batch_fails_every_request_in_it():
+    executor = InferenceExecutor(max_workers=1)
+
+    def run_batch(prompts, prefixes):
+        raise RuntimeError("out of memory")
+
+    async def scenario():
+        scheduler = BatchScheduler(run_batch, len, 16, executor, max_wait_ms=50)
+        results = await asyncio.gather(scheduler.submit("a"), scheduler.submit("b"), return_exceptions=True)
+        await scheduler.aclose()
+        return results, scheduler.stats()
+
+    try:
+        results, stats = asyncio.run(scenario())
+    finally:
+        executor.shutdown()
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert stats["failed"] == 2
+
+
+def test_waiting_requests_are_batched_by_priority():
+    model, executor = StubModel(), InferenceExecutor(max_workers=1)
+
+    async def scenario():
+        scheduler = make_scheduler(model, executor, max_batch_size=1, max_wait_ms=0)
+        model.running.clear()
+        first = asyncio.ensure_future(scheduler.submit("first"))
+        await asyncio.sleep(0.05)
+        # Queued while the first batch holds the worker
+        waiting = [
+            asyncio.ensure_future(scheduler.submit(prompt, priority=priority))
+            for prompt, priority in (("summary", "background"), ("practice", "practice"), ("exam", "exam"))
+        ]
+        await asyncio.sleep(0.01)
+        model.running.set()
+        await asyncio.gather(first, *waiting)
+        await scheduler.aclose()
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        executor.shutdown()
+    assert model.batches == [["first"], ["exam"], ["practice"], ["summary"]]
+
+
+def test_request_past_its_deadline_is_not_generated():
+    model, executor = StubModel(), InferenceExecutor(max_workers=1)
+
+    async def scenario():
+        scheduler = make_scheduler(model, executor, max_batch_size=1, max_wait_ms=0)
+        model.running.clear()
+        first = asyncio.ensure_future(scheduler.submit("first"))
+        await asyncio.sleep(0.05)
+        late = asyncio.ensure_future(scheduler.submit("late", priority="exam", deadline=time.monotonic() + 0.01))
+        await asyncio.sleep(0.05)
+        model.running.set()
+        await first
+        with pytest.raises(DeadlineExceededError):
+            await late
+        await scheduler.aclose()
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        executor.shutdown()
+    assert model.batches == [["first"]]
+    assert executor.stats()["classes"]["exam"]["expired"] == 1
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# Services are imported as main_service.app and llm_service.app, since both packages are named app
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
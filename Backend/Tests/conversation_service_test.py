@@ -0,0 +1,61 @@
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+from main_service.app import conversation_service
+from main_service.app.conversation_service import ConversationService
+
+
+def make_service(statuses):
+    """ConversationService whose database answers with `statuses` in turn, recording each POST."""
+    posts = []
+
+    def database(request):
+        posts.append(request.url.path)
+        return httpx.Response(statuses[min(len(posts), len(statuses)) - 1], json={"id": 1})
+
+    clients = SimpleNamespace(database=httpx.AsyncClient(transport=httpx.MockTransport(database)))
+    return ConversationService("http://llm", "http://database", service_clients=clients), posts
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(conversation_service, "PERSIST_RETRY_BACKOFF", 0)
+
+
+def test_unavailable_database_is_retried():
+    service, posts = make_service([503, 503, 200])
+    response = asyncio.run(service._post_with_retries("http://database/test-results/bulk", {}, retries=3))
+    assert response.status_code == 200
+    assert len(posts) == 3
+
+
+def test_bad_gateway_is_not_retried():
+    # The write may already have been committed behind the gateway
+    service, posts = make_service([502, 200])
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(service._post_with_retries("http://database/test-results/bulk", {}, retries=3))
+    assert len(posts) == 1
+
+
+def test_negative_retries_still_post_once():
+    service, posts = make_service([200])
+    response = asyncio.run(service._post_with_retries("http://database/test-results/bulk", {}, retries=-1))
+    assert response.status_code == 200
+    assert len(posts) == 1
+
+
+def test_connection_errors_are_retried_until_retries_run_out():
+    attempts = []
+
+    def database(request):
+        attempts.append(1)
+        raise httpx.ConnectError("refused")
+
+    clients = SimpleNamespace(database=httpx.AsyncClient(transport=httpx.MockTransport(database)))
+    service = ConversationService("http://llm", "http://database", service_clients=clients)
+    with pytest.raises(httpx.ConnectError):
+        asyncio.run(service._post_with_retries("http://database/test-results/bulk", {}, retries=2))
+    assert len(attempts) == 3
@@ -0,0 +1,105 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from llm_service.app.executor import DeadlineExceededError, InferenceExecutor, QueueFullError
+
+
+@pytest.fixture
+def executor():
+    executor = InferenceExecutor(max_workers=1, max_queue=2)
+    yield executor
+    executor.shutdown()
+
+
+def block_worker(executor, release):
+    """Occupy the single worker until `release` is set, so later calls queue."""
+    blocker = executor.submit(release.wait, 5)
+    while not blocker.running():
+        time.sleep(0.001)
+    return blocker
+
+
+def test_calls_run_on_a_worker_thread_off_the_event_loop(executor):
+    async def scenario():
+        loop_thread = threading.current_thread()
+        result, queued, running = await executor.run(lambda: threading.current_thread())
+        return loop_thread, result, queued, running
+
+    loop_thread, worker_thread, queued, running = asyncio.run(scenario())
+    assert worker_thread is not loop_thread
+    assert worker_thread.name == "inference_0"
+    assert queued >= 0 and running >= 0
+
+
+def test_event_loop_stays_responsive_during_a_call(executor):
+    release = threading.Event()
+
+    async def scenario():
+        call = asyncio.ensure_future(executor.run(release.wait, 5))
+        # Other coroutines keep running while the worker is blocked in the call
+        await asyncio.sleep(0.05)
+        still_running = not call.done()
+        release.set()
+        await call
+        return still_running
+
+    assert asyncio.run(scenario())
+
+
+def test_admission_rejects_past_the_queue_limit(executor):
+    with executor.admit("exam"), executor.admit("practice"):
+        with pytest.raises(QueueFullError) as rejected:
+            executor.acquire("exam")
+        assert rejected.value.retry_after >= 1
+        assert executor.stats()["rejected"] == 1
+    # Slots are given back when the requests finish
+    with executor.admit("exam"):
+        assert executor.stats()["outstanding"] == 1
+    assert executor.stats()["outstanding"] == 0
+
+
+def test_failed_call_releases_the_worker(executor):
+    def fail():
+        raise ValueError("bad prompt")
+
+    async def scenario():
+        with pytest.raises(ValueError):
+            await executor.run(fail)
+        result, _, _ = await executor.run(lambda: "next")
+        return result
+
+    assert asyncio.run(scenario()) == "next"
+
+
+def test_queued_calls_run_by_priority_then_deadline(executor):
+    release = threading.Event()
+    order = []
+    blocker = block_worker(executor, release)
+    now = time.monotonic()
+    calls = [
+        executor.submit(order.append, "background", priority="background"),
+        executor.submit(order.append, "practice", priority="practice"),
+        executor.submit(order.append, "late exam", priority="exam", deadline=now + 60),
+        executor.submit(order.append, "early exam", priority="exam", deadline=now + 30),
+    ]
+    release.set()
+    for call in [blocker] + calls:
+        call.result(5)
+    assert order == ["early exam", "late exam", "practice", "background"]
+
+
+def test_call_past_its_deadline_is_dropped_without_running(executor):
+    release = threading.Event()
+    ran = []
+    blocker = block_worker(executor, release)
+    expired = executor.submit(ran.append, "expired", priority="exam", deadline=time.monotonic() + 0.01)
+    time.sleep(0.05)
+    release.set()
+    blocker.result(5)
+    with pytest.raises(DeadlineExceededError):
+        expired.result(5)
+    assert ran == []
+    assert executor.stats()["classes"]["exam"]["expired"] == 1
@@ -0,0 +1,156 @@
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+from main_service.app.llm_router import LLMRouter
+
+URLS = ["http://llm-a", "http://llm-b", "http://llm-c"]
+
+
+def make_router(handler=None, **kwargs):
+    handler = handler or (lambda request: httpx.Response(200))
+    clients = SimpleNamespace(llm=httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    return LLMRouter(URLS, clients, **kwargs)
+
+
+def replica(router, url):
+    return next(replica for replica in router.replicas if replica.url == url)
+
+
+async def fail_requests(router, count, error=None):
+    for _ in range(count):
+        try:
+            async with router.route() as attempt:
+                if error is not None:
+                    raise error
+                attempt.status_code = 500
+        except httpx.TransportError:
+            pass
+
+
+def test_picks_the_replica_with_fewest_requests_in_flight():
+    router = make_router()
+    replica(router, "http://llm-a").in_flight = 3
+    replica(router, "http://llm-b").in_flight = 1
+    replica(router, "http://llm-c").in_flight = 2
+    assert router.pick().url == "http://llm-b"
+
+
+def test_requests_are_in_flight_until_the_route_block_exits():
+    router = make_router()
+
+    async def scenario():
+        async with router.route() as first, router.route() as second, router.route() as third:
+            return {attempt.url for attempt in (first, second, third)}, [r.in_flight for r in router.replicas]
+
+    urls, in_flight = asyncio.run(scenario())
+    # Each request went to an idle replica
+    assert urls == set(URLS) and in_flight == [1, 1, 1]
+    assert [r.in_flight for r in router.replicas] == [0, 0, 0]
+
+
+def test_affinity_sticks_until_its_replica_is_overloaded():
+    router = make_router(affinity_max_extra=2)
+    home = router.pick("session")
+    assert router.pick("session") is home
+    home.in_flight = 2
+    assert router.pick("session") is home
+    home.in_flight = 3
+    moved = router.pick("session")
+    assert moved is not home
+    assert router.pick("session") is moved
+    assert router.stats()["affinity_entries"] == 1
+
+
+def test_affinity_entries_are_bounded():
+    router = make_router(affinity_max_entries=2)
+    for key in ("a", "b", "c"):
+        router.pick(key)
+    assert list(router._affinity) == ["b", "c"]
+
+
+@pytest.mark.parametrize("error", [
+    None,
+    httpx.ConnectError("refused"),
+    httpx.ConnectTimeout("unreachable"),
+    httpx.RemoteProtocolError("reset")
+])
+def test_replica_is_ejected_after_consecutive_failures(error):
+    router = make_router(eject_after=2)
+    bad = replica(router, "http://llm-a")
+    for other in router.replicas:
+        if other is not bad:
+            other.in_flight = 10
+
+    asyncio.run(fail_requests(router, 2, error))
+    assert bad.ejections == 1
+    assert router.stats()["replicas"]["http://llm-a"]["healthy"] is False
+    # The loaded but healthy replicas now take the traffic
+    assert router.pick() is not bad
+
+
+@pytest.mark.parametrize("error", [httpx.ReadTimeout("slow"), httpx.PoolTimeout("pool full")])
+def test_timeouts_do_not_eject_a_replica(error):
+    router = make_router(eject_after=1)
+
+    async def scenario():
+        with pytest.raises(httpx.TimeoutException):
+            async with router.route():
+                raise error
+
+    asyncio.run(scenario())
+    assert all(r.ejections == 0 and r.consecutive_failures == 0 for r in router.replicas)
+
+
+def test_busy_responses_do_not_count_against_a_replica():
+    router = make_router(eject_after=1)
+
+    async def scenario():
+        for status_code in (503, 504):
+            async with router.route() as attempt:
+                attempt.status_code = status_code
+
+    asyncio.run(scenario())
+    assert all(r.healthy(0) and r.ejections == 0 for r in router.replicas)
+    assert all(r.consecutive_failures == 0 for r in router.replicas)
+
+
+def test_health_probe_ejects_and_reinstates_replicas():
+    ready = {url: 200 for url in URLS}
+    probed = []
+
+    def handler(request):
+        url = f"{request.url.scheme}://{request.url.host}"
+        probed.append((url, request.url.path))
+        return httpx.Response(ready[url])
+
+    router = make_router(handler, eject_seconds=60)
+
+    async def scenario():
+        ready["http://llm-b"] = 503
+        await router.check_health()
+        ejected = router.stats()["replicas"]["http://llm-b"]["healthy"]
+        ready["http://llm-b"] = 200
+        await router.check_health()
+        return ejected
+
+    assert asyncio.run(scenario()) is False
+    assert all(path == "/ready" for _, path in probed)
+    assert router.stats()["replicas"]["http://llm-b"]["healthy"] is True
+    assert replica(router, "http://llm-b").ejections == 1
+
+
+def test_requests_still_route_when_every_replica_is_ejected():
+    router = make_router(eject_after=1, eject_seconds=60)
+
+    async def scenario():
+        await fail_requests(router, len(URLS))
+        async with router.route() as attempt:
+            attempt.status_code = 200
+            return attempt.url
+
+    assert asyncio.run(scenario()) in URLS
+    assert not any(r["healthy"] for r in router.stats()["replicas"].values())
+
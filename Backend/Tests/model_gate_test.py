@@ -0,0 +1,144 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from llm_service.app.executor import InferenceExecutor
+from llm_service.app.model_gate import ModelGate, ModelNotReadyError
+from llm_service.app.streaming import StreamSlot
+
+
+def ready_gate():
+    gate = ModelGate()
+    gate.ready = True
+    return gate
+
+
+def test_requests_are_rejected_until_the_first_model_loads():
+    gate = ModelGate()
+
+    async def scenario():
+        with pytest.raises(ModelNotReadyError):
+            await gate.enter()
+
+    asyncio.run(scenario())
+    assert gate.active == 0
+
+
+def test_swap_waits_for_requests_in_flight_and_holds_back_new_ones():
+    gate = ready_gate()
+    model = {"name": "old"}
+    events = []
+
+    async def request(name, finish):
+        async with gate.hold():
+            events.append(f"{name} uses {model['name']}")
+            await finish.wait()
+        events.append(f"{name} done")
+
+    async def swap():
+        async with gate.exclusive():
+            events.append("swap starts")
+            await asyncio.sleep(0.01)
+            model["name"] = "new"
+        events.append("swap done")
+
+    async def scenario():
+        first_done, second_done = asyncio.Event(), asyncio.Event()
+        first = asyncio.ensure_future(request("first", first_done))
+        await asyncio.sleep(0)
+        swapping = asyncio.ensure_future(swap())
+        await asyncio.sleep(0)
+        # Arrives while the swap is waiting for the first request
+        second = asyncio.ensure_future(request("second", second_done))
+        await asyncio.sleep(0.01)
+        waiting = list(events)
+        first_done.set()
+        second_done.set()
+        await asyncio.gather(first, swapping, second)
+        return waiting
+
+    waiting = asyncio.run(scenario())
+    assert waiting == ["first uses old"]
+    assert events == ["first uses old", "first done", "swap starts", "swap done", "second uses new", "second done"]
+    assert gate.active == 0
+
+
+def test_leave_from_a_worker_thread_lets_the_swap_proceed():
+    gate = ready_gate()
+
+    async def swap():
+        async with gate.exclusive():
+            pass
+
+    async def scenario():
+        await gate.enter()
+        thread = threading.Thread(target=gate.leave)
+        swapping = asyncio.ensure_future(swap())
+        await asyncio.sleep(0.01)
+        blocked = not swapping.done()
+        thread.start()
+        await asyncio.wait_for(swapping, 1)
+        thread.join()
+        return blocked
+
+    assert asyncio.run(scenario())
+    assert gate.active == 0
+
+
+def test_swap_waits_for_a_stream_generation_after_the_client_disconnects():
+    gate = ready_gate()
+    executor = InferenceExecutor(max_workers=1)
+    generating = threading.Event()
+    stopped = []
+
+    def generate(slot):
+        generating.set()
+        # Stands in for the stopping criteria checked after every token
+        while not slot.cancelled.wait(0.01):
+            pass
+        time.sleep(0.05)
+        stopped.append(time.monotonic())
+
+    async def scenario():
+        await gate.enter()
+        executor.acquire("exam")
+        slot = StreamSlot(executor, gate, "exam")
+        slot.submit(lambda: generate(slot))
+        await asyncio.to_thread(generating.wait, 1)
+        # The client goes away: the stream and the background task both close the slot
+        slot.close()
+        slot.close()
+        held = gate.active, executor.stats()["outstanding"]
+        async with gate.exclusive():
+            swapped = time.monotonic()
+        return held, swapped
+
+    try:
+        held, swapped = asyncio.run(scenario())
+    finally:
+        executor.shutdown()
+    assert held == (1, 1)
+    assert stopped and swapped >= stopped[0]
+    assert gate.active == 0 and executor.stats()["outstanding"] == 0
+
+
+def test_closing_a_stream_before_it_submits_releases_right_away():
+    gate = ready_gate()
+    executor = InferenceExecutor(max_workers=1)
+
+    async def scenario():
+        await gate.enter()
+        executor.acquire("exam")
+        slot = StreamSlot(executor, gate, "exam")
+        slot.close()
+        await asyncio.sleep(0)
+        return slot.submit(lambda: None)
+
+    try:
+        job = asyncio.run(scenario())
+    finally:
+        executor.shutdown()
+    assert job is None
+    assert gate.active == 0 and executor.stats()["outstanding"] == 0
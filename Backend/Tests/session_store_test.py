@@ -0,0 +1,219 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from fakeredis import FakeServer
+from fakeredis.aioredis import FakeRedis
+
+from main_service.app import conversation_service, session_store
+from main_service.app.conversation_service import ConversationService
+from main_service.app.session_store import SessionStore
+
+IDS = ("user", "test", "1")
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    server = FakeServer()
+    monkeypatch.setattr(
+        session_store, "Redis", lambda connection_pool: FakeRedis(server=server, decode_responses=True)
+    )
+
+
+@pytest.fixture
+def store(fake_redis):
+    return SessionStore("redis://localhost:6379")
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_init_test_creates_missing_sessions_and_keeps_existing_ones(store):
+    async def scenario():
+        await store.init_test("user", "test", {"list_question_ids": ["1"]}, {"1": {"hints_used": 0}})
+        await store.append_chat_messages(*IDS, [{"role": "user", "content": "hi"}], {"hints_used": 1})
+        # Reloading the test must not reset the session
+        await store.init_test("user", "test", {"list_question_ids": ["1", "2"]}, {
+            "1": {"hints_used": 0},
+            "2": {"hints_used": 0}
+        })
+        return await store.get_question_sessions("user", "test", ["1", "2", "3"])
+
+    first, second, missing = run(scenario())
+    assert first == {"hints_used": 1, "chat_history": [{"role": "user", "content": "hi"}]}
+    assert second == {"hints_used": 0, "chat_history": []}
+    assert missing is None
+
+
+def test_history_limit_and_summary_window(store):
+    async def scenario():
+        await store.init_test("user", "test", {}, {"1": {"hints_used": 0}})
+        await store.append_chat_messages(*IDS, [{"role": "user", "content": str(i)} for i in range(6)])
+        await store.save_summary(*IDS, "summary", 4)
+        return (
+            await store.get_question_session(*IDS, history_limit=3),
+            await store.get_question_session(*IDS, history_limit=3, after_summary=True),
+            await store.get_question_session(*IDS, history_limit=0),
+            await store.get_turns_to_summarize(*IDS, keep=1)
+        )
+
+    newest, unsummarized, no_chat, to_summarize = run(scenario())
+    assert [message["content"] for message in newest["chat_history"]] == ["3", "4", "5"]
+    assert [message["content"] for message in unsummarized["chat_history"]] == ["4", "5"]
+    assert no_chat["chat_history"] == [] and no_chat["summary"] == "summary"
+    assert to_summarize == ("summary", 4, [{"role": "user", "content": "4"}])
+    assert unsummarized["unsummarized_turns"] == 2
+
+
+def test_summary_triggers_on_turns_beyond_the_chat_context(fake_redis, monkeypatch):
+    # Only 2 turns are read for the prompt, yet more than 5 unsummarized turns trigger a summary
+    monkeypatch.setattr(conversation_service, "CHAT_CONTEXT_TURNS", 2)
+    monkeypatch.setattr(conversation_service, "SUMMARY_TRIGGER_TURNS", 5)
+
+    def llm(request):
+        return httpx.Response(200, json={"response": "reply"})
+
+    clients = SimpleNamespace(llm=httpx.AsyncClient(transport=httpx.MockTransport(llm)))
+    service = ConversationService("http://llm", "http://database", service_clients=clients)
+    summaries = []
+
+    async def update_summary(user_id, test_id, question_id):
+        summaries.append(question_id)
+
+    service._update_summary = update_summary
+
+    async def scenario():
+        await service.sessions.init_test("user", "test", {}, {"1": {"hints_used": 0}})
+        for turn in range(3):
+            await service.process_query(f"why {turn}?", "user", "code", 1, "question", "test", is_practice_exam=True)
+            await asyncio.sleep(0)
+        return len(summaries)
+
+    # The first two queries leave 2 and 4 turns, the third makes 6
+    assert run(scenario()) == 1
+
+
+def test_get_question_and_test_reads_both_in_one_pipeline(store):
+    async def scenario():
+        await store.init_test("user", "test", {"test_code": "code"}, {"1": {"hints_used": 0}})
+        await store.append_chat_messages(*IDS, [{"role": "user", "content": "hi"}])
+        calls = []
+        pipeline = store.redis.pipeline
+        store.redis.pipeline = lambda *args, **kwargs: calls.append(1) or pipeline(*args, **kwargs)
+        result = await store.get_question_and_test(*IDS, history_limit=5)
+        return result, len(calls)
+
+    (session, test), pipelines = run(scenario())
+    assert pipelines == 1
+    assert session["chat_history"] == [{"role": "user", "content": "hi"}]
+    assert test == {"test_code": "code"}
+
+
+def test_legacy_string_sessions_are_converted_on_reload(store):
+    async def scenario():
+        # Sessions written before the hash/list layout were JSON strings
+        legacy_key = store.legacy_session_key(*IDS)
+        await store.redis.set(legacy_key, json.dumps({"chat_history": [], "hints_used": 2}), ex=600)
+        await store.init_test("user", "test", {}, {"1": {"hints_used": 0}})
+        converted = await store.get_question_session(*IDS)
+        await store.append_chat_messages(*IDS, [{"role": "user", "content": "hi"}], {"hints_used": 3})
+        return (
+            converted,
+            await store.get_question_and_test(*IDS, history_limit=None),
+            await store.redis.exists(legacy_key),
+            await store.redis.ttl(store.session_key(*IDS))
+        )
+
+    converted, (session, _), legacy_exists, ttl = run(scenario())
+    assert converted == {"hints_used": 2, "chat_history": []}
+    assert session == {"hints_used": 3, "chat_history": [{"role": "user", "content": "hi"}]}
+    assert legacy_exists == 0
+    assert ttl > 0
+
+
+def test_legacy_sessions_are_graded_and_removed_by_finish_test(store, fake_redis):
+    posted = []
+
+    def database(request):
+        posted.append(json.loads(request.content))
+        return httpx.Response(200, json={"id": 5})
+
+    clients = SimpleNamespace(database=httpx.AsyncClient(transport=httpx.MockTransport(database)))
+    service = ConversationService("http://llm", "http://database", service_clients=clients)
+    chat = [{"role": "user", "content": "why?"}, {"role": "assistant", "content": "because"}]
+
+    async def scenario():
+        await store.save_test("user", "7", {"test_code": "code", "list_question_ids": ["1", "2"]})
+        for question_id, is_correct in (("1", True), ("2", False)):
+            await store.redis.set(store.legacy_session_key("user", "7", question_id), json.dumps({
+                "chat_history": chat,
+                "student_answer": "42",
+                "is_correct": is_correct,
+                "question_id": question_id,
+                "time_spent": 30
+            }))
+        # The first session is converted by a read, the second by finish_test itself
+        sessions = await store.get_question_sessions("user", "7", ["1"])
+        result = await service.finish_test("user", "7")
+        return sessions, result, await store.redis.keys("*")
+
+    sessions, result, keys = run(scenario())
+    assert sessions[0]["chat_history"] == chat and sessions[0]["is_correct"]
+    assert result["correct_questions"] == 1 and result["score"] == 50
+    question_results = posted[0]["question_results"]
+    assert [question["isCorrect"] for question in question_results] == [True, False]
+    assert [message["content"] for message in question_results[0]["chat_messages"]] == ["why?", "because"]
+    assert keys == []
+
+
+def test_summary_lock_is_only_released_by_its_holder(store):
+    async def scenario():
+        token = await store.acquire_summary_lock(*IDS)
+        assert token is not None
+        assert await store.acquire_summary_lock(*IDS) is None
+        # The lock expires and another update claims it
+        await store.redis.delete(store.summary_lock_key(*IDS))
+        other = await store.acquire_summary_lock(*IDS)
+        await store.release_summary_lock(*IDS, token)
+        held = await store.redis.get(store.summary_lock_key(*IDS))
+        await store.release_summary_lock(*IDS, other)
+        return other, held, await store.redis.exists(store.summary_lock_key(*IDS))
+
+    other, held, exists = run(scenario())
+    assert held == other
+    assert exists == 0
+
+
+def test_delete_test_removes_sessions_chat_and_test_data(store):
+    async def scenario():
+        await store.init_test("user", "test", {"test_code": "code"}, {"1": {"hints_used": 0}})
+        await store.append_chat_messages(*IDS, [{"role": "user", "content": "hi"}])
+        await store.delete_test("user", "test", ["1"], test_code="code")
+        return await store.redis.keys("*")
+
+    assert run(scenario()) == []
+
+
+def test_submit_answer_grades_from_the_session_without_the_database(fake_redis):
+    database_calls = []
+
+    def database(request):
+        database_calls.append(request.url.path)
+        return httpx.Response(500)
+
+    clients = SimpleNamespace(database=httpx.AsyncClient(transport=httpx.MockTransport(database)))
+    service = ConversationService("http://llm", "http://database", service_clients=clients)
+
+    async def scenario():
+        await service.start_test("user", 7, "code", [1, 2], 2, answers={1: "42", 2: "x"})
+        right = await service.submit_answer("user", "code", 1, 0, " 42 ")
+        wrong = await service.submit_answer("user", "code", 2, 1, "y")
+        return right, wrong
+
+    right, wrong = run(scenario())
+    assert right["is_correct"] and right["progress"] == 50
+    assert not wrong["is_correct"] and wrong["progress"] == 100
+    assert database_calls == []
@@ -0,0 +1,161 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import httpx
+import pytest
+import redis
+from fakeredis import FakeServer
+from fakeredis.aioredis import FakeRedis
+
+from main_service.app import test_cache as cache_module
+
+TEST = {"id": 7, "code": "code", "questions": []}
+
+
+class Database:
+    """database-service stand-in serving TEST by code and by id, optionally held until `release` is set."""
+
+    def __init__(self):
+        self.calls = []
+        self.release = asyncio.Event()
+        self.release.set()
+        self.version = 1
+
+    async def __call__(self, request):
+        self.calls.append(request.url.path)
+        version = self.version
+        await self.release.wait()
+        return httpx.Response(200, json=dict(TEST, version=version))
+
+
+@pytest.fixture
+def server(monkeypatch):
+    server = FakeServer()
+    monkeypatch.setattr(
+        cache_module, "Redis",
+        SimpleNamespace(from_url=lambda url, decode_responses: FakeRedis(server=server, decode_responses=True))
+    )
+    return server
+
+
+def make_cache(database, redis_url=None):
+    clients = SimpleNamespace(database=httpx.AsyncClient(transport=httpx.MockTransport(database)))
+    return cache_module.TestCache(clients, "http://database", redis_url=redis_url)
+
+
+def test_test_invalidated_during_its_load_is_not_cached(server):
+    database = Database()
+    cache = make_cache(database, "redis://localhost")
+
+    async def scenario():
+        database.release.clear()
+        loading = asyncio.ensure_future(cache.get_by_code("code"))
+        await asyncio.sleep(0.01)
+        # The test is edited while the old version is being fetched
+        await cache.invalidate(code="code")
+        database.version = 2
+        database.release.set()
+        stale = await loading
+        fresh = await cache.get_by_code("code")
+        return stale, fresh, await cache.redis.get(cache._code_key("code"))
+
+    stale, fresh, shared = asyncio.run(scenario())
+    assert stale["version"] == 1
+    assert fresh["version"] == 2
+    assert json.loads(shared)["version"] == 2
+    assert database.calls == ["/tests/by-code/code", "/tests/by-code/code"]
+
+
+def test_loads_started_after_an_invalidation_are_cached():
+    database = Database()
+    cache = make_cache(database)
+
+    async def scenario():
+        await cache.invalidate(code="code")
+        await cache.get_by_code("code")
+        await cache.get_by_code("code")
+
+    asyncio.run(scenario())
+    assert database.calls == ["/tests/by-code/code"]
+
+
+def test_invalidating_by_code_also_drops_the_id_entry():
+    database = Database()
+    cache = make_cache(database)
+
+    async def scenario():
+        await cache.get_by_code("code")
+        # Served from the entry cached under the test id as well
+        await cache.get_by_id(7)
+        await cache.invalidate(code="code")
+        await cache.get_by_id(7)
+
+    asyncio.run(scenario())
+    assert database.calls == ["/tests/by-code/code", "/tests/7"]
+    assert cache.stats()["invalidations"] == 2
+
+
+def test_invalidations_reach_other_replicas(server):
+    database = Database()
+    first, second = make_cache(database, "redis://localhost"), make_cache(database, "redis://localhost")
+
+    async def scenario():
+        await second.start()
+        await asyncio.sleep(0.01)
+        await second.get_by_code("code")
+        await first.invalidate(code="code")
+        await asyncio.sleep(0.01)
+        entries = second.stats()["entries"]
+        await second.aclose()
+        return entries
+
+    assert asyncio.run(scenario()) == 0
+
+
+def test_listener_resubscribes_and_drops_entries_after_a_failure(server, monkeypatch):
+    monkeypatch.setattr(cache_module, "INVALIDATION_RETRY_SECONDS", 0.01)
+    database = Database()
+    first, second = make_cache(database, "redis://localhost"), make_cache(database, "redis://localhost")
+    connection_lost = asyncio.Event()
+    subscriptions = []
+    pubsub = second.redis.pubsub
+
+    class DroppingPubSub:
+        async def subscribe(self, channel):
+            pass
+
+        async def listen(self):
+            await connection_lost.wait()
+            raise redis.ConnectionError("connection reset")
+            yield
+
+        async def aclose(self):
+            pass
+
+    def subscribe():
+        subscriptions.append(1)
+        return DroppingPubSub() if len(subscriptions) == 1 else pubsub()
+
+    second.redis.pubsub = subscribe
+
+    async def scenario():
+        await second.start()
+        await asyncio.sleep(0.01)
+        await second.get_by_code("code")
+        connection_lost.set()
+        await asyncio.sleep(0.1)
+        after_reconnect = second.stats()["entries"]
+        # Invalidations are received again on the new subscription
+        await second.get_by_code("code")
+        await first.invalidate(code="code")
+        await asyncio.sleep(0.01)
+        entries = second.stats()["entries"]
+        await second.aclose()
+        return after_reconnect, entries
+
+    after_reconnect, entries = asyncio.run(scenario())
+    assert len(subscriptions) == 2
+    # Invalidations published while disconnected were lost, so nothing cached survives
+    assert after_reconnect == 0
+    assert entries == 0
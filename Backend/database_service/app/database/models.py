@@ -38,6 +38,7 @@ class Test(Base):
     test_name = Column(String, index=True, nullable=True)
     code = Column(String, unique=True, index=True, nullable=False)
     isPracticeExam = Column(Boolean, default=False)
+    hiddenValueFastPath = Column(Boolean, default=False)
     questions = relationship("Question", secondary="test_questions", back_populates="tests")
 
 class TestQuestion(Base):
@@ -57,6 +58,8 @@ class Question(Base):
     hint_level = Column(String)
     subject = Column(String)
     topic = Column(String)
+    # Pregenerated Socratic hints, from the first nudge to the most specific
+    hint_ladder = Column(JSON, nullable=True)
     tests = relationship("Test", secondary="test_questions", back_populates="questions")
 
 class TestResult(Base):
@@ -1,4 +1,5 @@
 from fastapi import FastAPI, HTTPException, Depends, status
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
 from pydantic import BaseModel, Field, EmailStr
 from typing import List, Optional, Dict, Any, Union
@@ -25,6 +26,8 @@ class TestBase(OrmBaseModel):
     test_name: Optional[str] = None
     code: str
     isPracticeExam: Optional[bool] = False
+    # Answer hidden-value lookups from a template instead of the LLM
+    hiddenValueFastPath: Optional[bool] = False
 
 class TestCreate(TestBase):
     questions: List[Dict[str, Any]]
@@ -39,6 +42,9 @@ class QuestionBase(OrmBaseModel):
     subject: Optional[str] = None
     topic: Optional[str] = None
 
+class TestBulkCreate(TestBase):
+    questions: List[QuestionBase] = []
+
 class TestQuestionCreate(OrmBaseModel):
     test_id: int
     question_id: int
@@ -65,6 +71,13 @@ class ChatMessageBase(OrmBaseModel):
     content: str
     timestamp: Optional[datetime] = None
 
+class QuestionResultBulkCreate(QuestionResultBase):
+    chat_messages: List[ChatMessageBase] = []
+
+class TestResultBulkCreate(TestResultBase):
+    start_time: Optional[datetime] = None
+    question_results: List[QuestionResultBulkCreate] = []
+
 # Response models
 class ChatMessageResponse(ChatMessageBase):
     id: int
@@ -80,14 +93,34 @@ class TestResultResponse(TestResultBase):
     start_time: datetime
     question_results: List[QuestionResultResponse] = []
 
+class QuestionResultIdsResponse(BaseModel):
+    id: int
+    question_id: int
+    chat_message_ids: List[int] = []
+
+class TestResultBulkResponse(BaseModel):
+    id: int
+    question_results: List[QuestionResultIdsResponse] = []
+
+class ChatMessageBulkResponse(BaseModel):
+    question_result_id: int
+    chat_message_ids: List[int] = []
+
 class QuestionResponse(QuestionBase):
     id: int
+    # Pregenerated hints, from the first nudge to the most specific
+    hint_ladder: Optional[List[str]] = None
+
+class HintLadderUpdate(BaseModel):
+    # Question id -> hints, from the first nudge to the most specific
+    hint_ladders: Dict[int, List[str]]
 
 class TestResponse(TestBase):
     id: int
     test_name: str
     code: str
     isPracticeExam: bool = False
+    hiddenValueFastPath: bool = False
     questions: List[QuestionResponse] = []
 
 # Authentication endpoints
@@ -243,7 +276,12 @@ async def create_test(test: TestBase, db: Session = Depends(get_db)):
         print(f"Creating test with name: {test.test_name}, code: {test.code}, isPracticeExam: {test.isPracticeExam}")
         
         # Create the test
-        db_test = Test(test_name=test.test_name, code=test.code, isPracticeExam=test.isPracticeExam)
+        db_test = Test(
+            test_name=test.test_name,
+            code=test.code,
+            isPracticeExam=test.isPracticeExam,
+            hiddenValueFastPath=bool(test.hiddenValueFastPath)
+        )
         db.add(db_test)
         db.commit()
         db.refresh(db_test)
@@ -255,6 +293,55 @@ async def create_test(test: TestBase, db: Session = Depends(get_db)):
         print(f"Error creating test: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error creating test: {str(e)}")
 
+@app.post("/tests/bulk", response_model=TestResponse)
+async def create_test_bulk(test: TestBulkCreate, db: Session = Depends(get_db)):
+    """Create a test with all of its questions and test-question links in one transaction."""
+    if db.query(Test.id).filter(Test.code == test.code).first():
+        raise HTTPException(status_code=400, detail=f"Test with code {test.code} already exists")
+    
+    try:
+        test_id = db.scalar(
+            insert(Test).values(
+                test_name=test.test_name,
+                code=test.code,
+                isPracticeExam=test.isPracticeExam,
+                hiddenValueFastPath=bool(test.hiddenValueFastPath)
+            ).returning(Test.id)
+        )
+        
+        # Multi-row insert for the questions, ids come back in input order
+        question_ids = []
+        if test.questions:
+            question_ids = list(db.scalars(
+                insert(Question).returning(Question.id, sort_by_parameter_order=True),
+                [question.model_dump() for question in test.questions]
+            ))
+            db.execute(
+                insert(TestQuestion),
+                [
+                    {"test_id": test_id, "question_id": question_id, "position": position}
+                    for position, question_id in enumerate(question_ids)
+                ]
+            )
+        db.commit()
+        
+        print(f"Test created with ID: {test_id} and {len(question_ids)} questions")
+        return TestResponse(
+            id=test_id,
+            test_name=test.test_name,
+            code=test.code,
+            isPracticeExam=test.isPracticeExam,
+            hiddenValueFastPath=bool(test.hiddenValueFastPath),
+            questions=[
+                QuestionResponse(id=question_id, **question.model_dump())
+                for question_id, question in zip(question_ids, test.questions)
+            ]
+        )
+    except Exception as e:
+        db.rollback()
+        print(f"Error creating test: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error creating test: {str(e)}")
+
 @app.get("/tests/by-code/{code}", response_model=TestResponse)
 async def get_test_by_code(code: str, db: Session = Depends(get_db)):
     # Get the test and join with questions through TestQuestion
@@ -276,6 +363,7 @@ async def get_test_by_code(code: str, db: Session = Depends(get_db)):
         test_name=db_test.test_name,
         code=db_test.code,
         isPracticeExam=db_test.isPracticeExam,
+        hiddenValueFastPath=bool(db_test.hiddenValueFastPath),
         questions=[
             QuestionResponse(
                 id=q.id,
@@ -286,7 +374,8 @@ async def get_test_by_code(code: str, db: Session = Depends(get_db)):
                 teacher_instructions=q.teacher_instructions,
                 hint_level=q.hint_level,
                 subject=q.subject,
-                topic=q.topic
+                topic=q.topic,
+                hint_ladder=q.hint_ladder
             ) for q in questions
         ]
     )
@@ -311,6 +400,7 @@ async def get_test(test_id: int, db: Session = Depends(get_db)):
         test_name=db_test.test_name,
         code=db_test.code,
         isPracticeExam=db_test.isPracticeExam,
+        hiddenValueFastPath=bool(db_test.hiddenValueFastPath),
         questions=[
             QuestionResponse(
                 id=q.id,
@@ -321,7 +411,8 @@ async def get_test(test_id: int, db: Session = Depends(get_db)):
                 teacher_instructions=q.teacher_instructions,
                 hint_level=q.hint_level,
                 subject=q.subject,
-                topic=q.topic
+                topic=q.topic,
+                hint_ladder=q.hint_ladder
             ) for q in questions
         ]
     )
@@ -354,9 +445,58 @@ async def create_question(question: QuestionBase, db: Session = Depends(get_db))
         teacher_instructions=db_question.teacher_instructions,
         hint_level=db_question.hint_level,
         subject=db_question.subject,
-        topic=db_question.topic
+        topic=db_question.topic,
+        hint_ladder=db_question.hint_ladder
     )
 
+@app.get("/questions", response_model=List[QuestionResponse])
+async def get_questions(ids: str, db: Session = Depends(get_db)):
+    """Get several questions by a comma-separated list of IDs with a single query.
+
+    Questions are returned in the order of `ids`; unknown IDs are skipped.
+    """
+    try:
+        question_ids = [int(question_id) for question_id in ids.split(",") if question_id.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids must be a comma-separated list of integers")
+    if not question_ids:
+        return []
+
+    questions = db.query(Question).filter(Question.id.in_(set(question_ids))).all()
+    questions_by_id = {q.id: q for q in questions}
+
+    return [
+        QuestionResponse(
+            id=q.id,
+            public_question=q.public_question,
+            hidden_values=q.hidden_values,
+            answer=q.answer,
+            formula=q.formula,
+            teacher_instructions=q.teacher_instructions,
+            hint_level=q.hint_level,
+            subject=q.subject,
+            topic=q.topic,
+            hint_ladder=q.hint_ladder
+        ) for q in (questions_by_id.get(question_id) for question_id in question_ids) if q is not None
+    ]
+
+@app.put("/questions/hint-ladders")
+async def update_hint_ladders(update: HintLadderUpdate, db: Session = Depends(get_db)):
+    """Store the hint ladders of several questions in one transaction."""
+    questions = db.query(Question).filter(Question.id.in_(list(update.hint_ladders))).all()
+    missing = set(update.hint_ladders) - {q.id for q in questions}
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Questions not found: {sorted(missing)}")
+    try:
+        for q in questions:
+            q.hint_ladder = update.hint_ladders[q.id]
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        print(f"Error storing hint ladders: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error storing hint ladders: {str(e)}")
+    return {"updated": len(questions)}
+
 @app.get("/questions/{question_id}", response_model=QuestionResponse)
 async def get_question(question_id: int, db: Session = Depends(get_db)):
     db_question = db.query(Question).filter(Question.id == question_id).first()
@@ -373,7 +513,8 @@ async def get_question(question_id: int, db: Session = Depends(get_db)):
         teacher_instructions=db_question.teacher_instructions,
         hint_level=db_question.hint_level,
         subject=db_question.subject,
-        topic=db_question.topic
+        topic=db_question.topic,
+        hint_ladder=db_question.hint_ladder
     )
 
 # Test-Question relationship endpoints
@@ -420,7 +561,8 @@ async def get_test_questions(test_id: Optional[int] = None, db: Session = Depend
                 teacher_instructions=q.teacher_instructions,
                 hint_level=q.hint_level,
                 subject=q.subject,
-                topic=q.topic
+                topic=q.topic,
+                hint_ladder=q.hint_ladder
             ) for q in questions
         ]
     else:
@@ -458,6 +600,80 @@ async def create_test_result(result: TestResultBase, db: Session = Depends(get_d
     db.refresh(db_result)
     return db_result
 
+def _bulk_insert_chat_messages(db: Session, rows: List[Dict[str, Any]]) -> List[int]:
+    """Insert chat messages with one multi-row INSERT and return their ids in input order."""
+    if not rows:
+        return []
+    return list(db.scalars(
+        insert(ChatMessage).returning(ChatMessage.id, sort_by_parameter_order=True),
+        rows
+    ))
+
+@app.post("/test-results/bulk", response_model=TestResultBulkResponse)
+async def create_test_result_bulk(result: TestResultBulkCreate, db: Session = Depends(get_db)):
+    """Create a test result with all of its question results and chat messages in one transaction."""
+    try:
+        test_result_id = db.scalar(
+            insert(TestResult).values(
+                test_code=result.test_code,
+                username=result.username,
+                score=result.score,
+                total_questions=result.total_questions,
+                correct_questions=result.correct_questions,
+                start_time=result.start_time or datetime.now(),
+                end_time=result.end_time
+            ).returning(TestResult.id)
+        )
+        
+        # Multi-row insert for the question results, ids come back in input order
+        question_result_ids = []
+        if result.question_results:
+            question_result_ids = list(db.scalars(
+                insert(QuestionResult).returning(QuestionResult.id, sort_by_parameter_order=True),
+                [
+                    {
+                        "test_result_id": test_result_id,
+                        "question_id": question_result.question_id,
+                        "student_answer": question_result.student_answer,
+                        "isCorrect": question_result.isCorrect,
+                        "time_spent": question_result.time_spent,
+                        "start_time": question_result.start_time,
+                        "end_time": question_result.end_time or datetime.now()
+                    } for question_result in result.question_results
+                ]
+            ))
+        
+        # Multi-row insert for every chat message across all question results
+        message_ids = _bulk_insert_chat_messages(db, [
+            {
+                "question_result_id": question_result_id,
+                "sender": message.sender,
+                "content": message.content,
+                "timestamp": message.timestamp or datetime.now()
+            }
+            for question_result_id, question_result in zip(question_result_ids, result.question_results)
+            for message in question_result.chat_messages
+        ])
+        db.commit()
+        
+        # Regroup the flat message ids by question result
+        question_results = []
+        offset = 0
+        for question_result_id, question_result in zip(question_result_ids, result.question_results):
+            count = len(question_result.chat_messages)
+            question_results.append(QuestionResultIdsResponse(
+                id=question_result_id,
+                question_id=question_result.question_id,
+                chat_message_ids=message_ids[offset:offset + count]
+            ))
+            offset += count
+        
+        return TestResultBulkResponse(id=test_result_id, question_results=question_results)
+    except Exception as e:
+        db.rollback()
+        print(f"Error creating test result: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error creating test result: {str(e)}")
+
 @app.post("/test-results/{result_id}/questions/", response_model=QuestionResultResponse)
 async def add_question_result(result_id: int, question_result: QuestionResultBase, db: Session = Depends(get_db)):
     # Verify test result exists
@@ -501,6 +717,30 @@ async def add_chat_message(result_id: int, message: ChatMessageBase, db: Session
     
     return db_message
 
+@app.post("/question-results/{result_id}/messages/bulk", response_model=ChatMessageBulkResponse)
+async def add_chat_messages_bulk(result_id: int, messages: List[ChatMessageBase], db: Session = Depends(get_db)):
+    """Add several chat messages to a question result in one transaction."""
+    # Verify question result exists
+    question_result = db.query(QuestionResult).filter(QuestionResult.id == result_id).first()
+    if not question_result:
+        raise HTTPException(status_code=404, detail=f"Question result with id {result_id} not found")
+    
+    try:
+        message_ids = _bulk_insert_chat_messages(db, [
+            {
+                "question_result_id": result_id,
+                "sender": message.sender,
+                "content": message.content,
+                "timestamp": message.timestamp or datetime.now()
+            } for message in messages
+        ])
+        db.commit()
+        return ChatMessageBulkResponse(question_result_id=result_id, chat_message_ids=message_ids)
+    except Exception as e:
+        db.rollback()
+        print(f"Error adding chat messages: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error adding chat messages: {str(e)}")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8001) 
\ No newline at end of file
@@ -0,0 +1,137 @@
+import os
+from typing import Callable, Dict, Optional
+
+import torch
+from huggingface_hub import snapshot_download
+from transformers import pipeline, AutoModelForCausalLM, AutoTokenizer, Pipeline
+
+# transformers | cpu-int8 | auto (transformers on a GPU, cpu-int8 otherwise)
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "auto")
+# Small instruct model used by the CPU backend, falls back to MODEL_NAME when empty
+CPU_MODEL_NAME = os.getenv("CPU_MODEL_NAME", "Qwen/Qwen2.5-0.5B-Instruct")
+CPU_THREADS = int(os.getenv("CPU_THREADS", "0"))  # 0 keeps the torch default
+# Files needed to load a model from its safetensors weights, .bin and .pt weights are skipped
+SNAPSHOT_PATTERNS = ["*.safetensors", "*.safetensors.index.json", "*.json", "*.model", "*.txt", "*.tiktoken"]
+# Modelling code shipped with the model, only fetched when it is trusted
+REMOTE_CODE_PATTERNS = ["*.py"]
+
+
+def local_snapshot(model_name: str, cache_dir: str, hf_token: Optional[str], trust_remote_code: bool) -> str:
+    """Path of the model's safetensors snapshot in `cache_dir`, downloading it only if missing.
+
+    Loading from the local path skips the Hub round trips from_pretrained
+    makes on every start, and a model name that is already a directory is
+    used as is.
+    """
+    if os.path.isdir(model_name):
+        return model_name
+    patterns = SNAPSHOT_PATTERNS + REMOTE_CODE_PATTERNS if trust_remote_code else SNAPSHOT_PATTERNS
+    try:
+        return snapshot_download(
+            model_name, cache_dir=cache_dir, allow_patterns=patterns, local_files_only=True
+        )
+    except Exception:
+        print(f"{model_name} is not in {cache_dir} yet, downloading its safetensors weights...")
+        return snapshot_download(
+            model_name, cache_dir=cache_dir, allow_patterns=patterns, token=hf_token
+        )
+
+
+def _device_index(device: str) -> int:
+    """Parse the DEVICE setting ("0" for the first GPU, "-1" for CPU)."""
+    try:
+        return int(device)
+    except ValueError:
+        return -1 if device.strip().lower() == "cpu" else 0
+
+
+def load_transformers(
+    model_name: str, device: str, cache_dir: str, hf_token: Optional[str], trust_remote_code: bool
+) -> Pipeline:
+    """Hugging Face pipeline on the configured device, half precision on GPU.
+
+    Weights are memory-mapped from the local safetensors files rather than
+    read into RAM first.
+    """
+    device_index = _device_index(device)
+    on_gpu = device_index >= 0
+    return pipeline(
+        task="text-generation",
+        model=local_snapshot(model_name, cache_dir, hf_token, trust_remote_code),
+        device=device_index,
+        torch_dtype=torch.float16 if on_gpu else torch.float32,  # Use half precision to reduce memory usage
+        model_kwargs={
+            "low_cpu_mem_usage": True,
+            "use_safetensors": True,
+            "attn_implementation": "eager",
+        },
+        trust_remote_code=trust_remote_code
+    )
+
+
+def load_cpu_int8(
+    model_name: str, device: str, cache_dir: str, hf_token: Optional[str], trust_remote_code: bool
+) -> Pipeline:
+    """Hugging Face pipeline on CPU with int8 dynamic quantization of the linear layers.
+
+    Weights of every nn.Linear are stored as int8 and activations are quantized
+    on the fly, which cuts memory roughly 4x and speeds up the matrix
+    multiplications that dominate decoding on CPU.
+    """
+    if CPU_THREADS > 0:
+        torch.set_num_threads(CPU_THREADS)
+    model_path = local_snapshot(model_name, cache_dir, hf_token, trust_remote_code)
+    tokenizer = AutoTokenizer.from_pretrained(model_path, trust_remote_code=trust_remote_code)
+    model = AutoModelForCausalLM.from_pretrained(
+        model_path,
+        torch_dtype=torch.float32,
+        low_cpu_mem_usage=True,
+        use_safetensors=True,
+        trust_remote_code=trust_remote_code
+    )
+    model.eval()
+    model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return pipeline(task="text-generation", model=model, tokenizer=tokenizer, device=-1)
+
+
+# Backend name -> loader(model_name, device, cache_dir, hf_token, trust_remote_code)
+BACKENDS: Dict[str, Callable[[str, str, str, Optional[str], bool], Pipeline]] = {
+    "transformers": load_transformers,
+    "cpu-int8": load_cpu_int8,
+}
+
+
+def resolve_backend(backend: str, device: str) -> str:
+    """Pick the backend for "auto": transformers when a GPU is configured and present."""
+    if backend != "auto":
+        return backend
+    if _device_index(device) >= 0 and torch.cuda.is_available():
+        return "transformers"
+    return "cpu-int8"
+
+
+def configured_model_name(backend: str, model_name: str) -> str:
+    """The model a backend loads at startup: CPU_MODEL_NAME for the CPU backend when it is set."""
+    if backend == "cpu-int8" and CPU_MODEL_NAME:
+        return CPU_MODEL_NAME
+    return model_name
+
+
+def load_pipeline(
+    backend: str,
+    model_name: str,
+    device: str,
+    cache_dir: str,
+    hf_token: Optional[str] = None,
+    trust_remote_code: bool = True
+) -> Pipeline:
+    """Load a text-generation pipeline for `model_name` with the named backend.
+
+    Models configured through the environment may run modelling code from
+    their repository; pass `trust_remote_code=False` for any other model.
+    """
+    backend = resolve_backend(backend, device)
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend {backend!r}, expected one of: auto, {', '.join(BACKENDS)}")
+    print(f"Loading {model_name} with the {backend} backend...")
+    return BACKENDS[backend](model_name, device, cache_dir, hf_token, trust_remote_code)
@@ -0,0 +1,263 @@
+import asyncio
+import itertools
+import math
+import os
+import time
+from collections import Counter
+from typing import Callable, List, Optional, Dict, Any, Tuple
+
+from .executor import (
+    DEFAULT_PRIORITY, PRIORITY_CLASSES, DeadlineExceededError, InferenceExecutor, priority_rank
+)
+
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "8"))
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", "20"))
+BATCH_MAX_TOKENS = int(os.getenv("BATCH_MAX_TOKENS", "8192"))
+
+
+class _PendingRequest:
+    __slots__ = ("prompt", "prefix", "prompt_tokens", "future", "priority", "deadline", "enqueued_at")
+
+    def __init__(
+        self,
+        prompt: str,
+        prefix: Any,
+        prompt_tokens: int,
+        future: asyncio.Future,
+        priority: str,
+        deadline: Optional[float]
+    ):
+        self.prompt = prompt
+        self.prefix = prefix
+        self.prompt_tokens = prompt_tokens
+        self.future = future
+        self.priority = priority
+        self.deadline = deadline
+        self.enqueued_at = time.monotonic()
+
+    def expired(self, now: float) -> bool:
+        return self.deadline is not None and now > self.deadline
+
+
+class BatchScheduler:
+    """Collects concurrent generation requests into padded batches.
+
+    The first queued request opens a batch; requests arriving within
+    `max_wait_ms` join it until it holds `max_batch_size` prompts or its padded
+    size (batch size x (longest prompt + max_new_tokens)) would exceed
+    `max_batch_tokens`. The batch runs as one call to `run_batch` on the
+    inference executor; it gets the prompts and their prefixes (as passed to
+    `submit`) and must return one result per prompt, which `submit` returns.
+
+    Up to one batch per inference worker runs at a time. The next batch is
+    only collected once a worker is free, so requests keep queueing until
+    then and a late urgent request can still make the next batch.
+
+    Waiting requests are taken by priority class, earliest deadline first
+    within a class. Requests whose deadline passes before their batch starts
+    fail with DeadlineExceededError and are not generated for.
+    """
+
+    def __init__(
+        self,
+        run_batch: Callable[[List[str], List[Any]], List[Any]],
+        count_tokens: Callable[[str], int],
+        max_new_tokens: int,
+        executor: InferenceExecutor,
+        max_batch_size: int = BATCH_MAX_SIZE,
+        max_wait_ms: float = BATCH_MAX_WAIT_MS,
+        max_batch_tokens: int = BATCH_MAX_TOKENS
+    ):
+        self.run_batch = run_batch
+        self.count_tokens = count_tokens
+        self.max_new_tokens = max_new_tokens
+        self.executor = executor
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000
+        self.max_batch_tokens = max_batch_tokens
+        # Entries are (priority rank, deadline, sequence, request)
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._sequence = itertools.count()
+        # Request that did not fit the previous batch and opens the next one
+        self._carry: Optional[_PendingRequest] = None
+        self._worker: Optional[asyncio.Task] = None
+        # Free inference workers, and the batches running on the others
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._running = set()
+        self.batches = 0
+        self.completed = 0
+        self.failed = 0
+        self.batch_sizes = Counter()
+        self.queued_by_class = Counter()
+
+    async def start(self):
+        if self._worker is None:
+            self._queue = asyncio.PriorityQueue()
+            self._slots = asyncio.Semaphore(self.executor.max_workers)
+            self._worker = asyncio.create_task(self._run())
+
+    async def aclose(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            for task in self._running:
+                task.cancel()
+            await asyncio.gather(self._worker, *self._running, return_exceptions=True)
+            self._worker = None
+
+    async def submit(
+        self,
+        prompt: str,
+        prefix: Any = None,
+        priority: str = DEFAULT_PRIORITY,
+        deadline: Optional[float] = None,
+        prompt_tokens: Optional[int] = None
+    ) -> Tuple[Any, float, float]:
+        """Queue a prompt and wait for its generated result.
+
+        `deadline` is a time.monotonic() value after which the request is
+        dropped instead of generated, raising DeadlineExceededError. The prompt
+        is tokenized to size the batch unless `prompt_tokens` is given.
+        Returns (result, seconds queued, seconds generating). Time queued covers
+        waiting for the batch to fill and for a free inference worker.
+        """
+        await self.start()
+        if prompt_tokens is None:
+            prompt_tokens = await asyncio.to_thread(self.count_tokens, prompt)
+        request = _PendingRequest(
+            prompt,
+            prefix,
+            prompt_tokens,
+            asyncio.get_running_loop().create_future(),
+            PRIORITY_CLASSES[priority_rank(priority)],
+            deadline
+        )
+        self.queued_by_class[request.priority] += 1
+        self._queue.put_nowait((
+            priority_rank(priority),
+            deadline if deadline is not None else math.inf,
+            next(self._sequence),
+            request
+        ))
+        return await request.future
+
+    async def _next_request(self, timeout: Optional[float]) -> _PendingRequest:
+        if timeout is None:
+            entry = await self._queue.get()
+        elif timeout > 0:
+            entry = await asyncio.wait_for(self._queue.get(), timeout)
+        else:
+            entry = self._queue.get_nowait()
+        request = entry[-1]
+        self.queued_by_class[request.priority] -= 1
+        return request
+
+    def _padded_tokens(self, batch: List[_PendingRequest]) -> int:
+        longest = max(request.prompt_tokens for request in batch)
+        return len(batch) * (longest + self.max_new_tokens)
+
+    async def _collect(self) -> List[_PendingRequest]:
+        if self._carry is not None:
+            first, self._carry = self._carry, None
+        else:
+            first = await self._next_request(None)
+        batch = [first]
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            try:
+                # Once the window closed, still take anything already waiting
+                request = await self._next_request(timeout)
+            except (asyncio.TimeoutError, asyncio.QueueEmpty):
+                break
+            if self._padded_tokens(batch + [request]) > self.max_batch_tokens:
+                self._carry = request
+                break
+            batch.append(request)
+        return batch
+
+    def _drop_expired(self, batch: List[_PendingRequest]) -> List[_PendingRequest]:
+        now = time.monotonic()
+        kept = []
+        for request in batch:
+            if request.expired(now):
+                self.executor.record_expired(request.priority)
+                request.future.set_exception(DeadlineExceededError(
+                    f"Deadline passed {now - request.deadline:.1f}s before generation started"
+                ))
+            else:
+                kept.append(request)
+        return kept
+
+    async def _execute(self, batch: List[_PendingRequest]):
+        # Callers that gave up (e.g. client disconnected) are not generated for
+        batch = self._drop_expired([request for request in batch if not request.future.done()])
+        if not batch:
+            return
+        # The batch runs at the priority of its most urgent request and only
+        # expires once every request in it has
+        deadlines = [request.deadline for request in batch]
+        submitted = time.monotonic()
+        try:
+            results, queued, generation_time = await self.executor.run(
+                self.run_batch,
+                [request.prompt for request in batch],
+                [request.prefix for request in batch],
+                priority=min((request.priority for request in batch), key=priority_rank),
+                deadline=None if None in deadlines else max(deadlines)
+            )
+        except Exception as e:
+            self.failed += len(batch)
+            for request in batch:
+                if not request.future.done():
+                    request.future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.completed += len(batch)
+        self.batch_sizes[len(batch)] += 1
+        started = submitted + queued
+        for request, result in zip(batch, results):
+            if not request.future.done():
+                request.future.set_result((result, started - request.enqueued_at, generation_time))
+
+    async def _run_batch(self, batch: List[_PendingRequest]):
+        try:
+            await self._execute(batch)
+        except Exception as e:
+            print(f"Batch scheduler: unexpected error running batch: {e}")
+        finally:
+            self._slots.release()
+
+    async def _run(self):
+        while True:
+            await self._slots.acquire()
+            try:
+                batch = await self._collect()
+            except BaseException:
+                self._slots.release()
+                raise
+            task = asyncio.create_task(self._run_batch(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    def stats(self) -> Dict[str, Any]:
+        queued = self._queue.qsize() if self._queue is not None else 0
+        return {
+            "queue_depth": queued + (1 if self._carry is not None else 0),
+            "running_batches": len(self._running),
+            "queue_depth_by_class": {
+                priority: self.queued_by_class[priority]
+                + (1 if self._carry is not None and self._carry.priority == priority else 0)
+                for priority in PRIORITY_CLASSES
+            },
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "max_batch_tokens": self.max_batch_tokens,
+            "batches": self.batches,
+            "completed": self.completed,
+            "failed": self.failed,
+            "avg_batch_size": self.completed / self.batches if self.batches else 0.0,
+            "batch_sizes": dict(sorted(self.batch_sizes.items()))
+        }
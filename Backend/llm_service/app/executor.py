@@ -0,0 +1,278 @@
+import asyncio
+import bisect
+import itertools
+import math
+import os
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "1"))
+INFERENCE_MAX_QUEUE = int(os.getenv("INFERENCE_MAX_QUEUE", "64"))
+
+# Priority classes, highest first: timed exams, practice chat, background work such as summaries
+PRIORITY_CLASSES = ("exam", "practice", "background")
+DEFAULT_PRIORITY = "practice"
+# Upper bounds (ms) of the queue wait histogram buckets
+WAIT_BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+
+
+class QueueFullError(Exception):
+    """Raised when a request arrives while the inference queue is full."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Inference queue is full, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+class DeadlineExceededError(Exception):
+    """Raised for a request whose deadline passed before its generation started."""
+
+
+def priority_rank(priority: str) -> int:
+    """Position of a priority class, unknown classes are treated as the default."""
+    if priority not in PRIORITY_CLASSES:
+        priority = DEFAULT_PRIORITY
+    return PRIORITY_CLASSES.index(priority)
+
+
+class _Histogram:
+    __slots__ = ("bounds", "counts", "count", "total")
+
+    def __init__(self, bounds_ms: Tuple[float, ...] = WAIT_BUCKETS_MS):
+        self.bounds = bounds_ms
+        # One count per bucket plus the overflow bucket
+        self.counts = [0] * (len(bounds_ms) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, seconds: float):
+        self.counts[bisect.bisect_left(self.bounds, seconds * 1000)] += 1
+        self.count += 1
+        self.total += seconds
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Cumulative counts per upper bound, in the style of a Prometheus histogram."""
+        buckets, cumulative = {}, 0
+        for bound, count in zip(list(self.bounds) + ["+Inf"], self.counts):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+        return {"count": self.count, "sum_ms": self.total * 1000, "buckets_ms": buckets}
+
+
+class _Job:
+    __slots__ = ("fn", "args", "kwargs", "future", "priority", "deadline", "submitted")
+
+    def __init__(self, fn: Callable, args, kwargs, priority: str, deadline: Optional[float]):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.future: Future = Future()
+        self.priority = priority
+        self.deadline = deadline
+        self.submitted = time.monotonic()
+
+
+class _RunningAverage:
+    __slots__ = ("count", "total", "max")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value: float):
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def as_dict(self) -> Dict[str, float]:
+        return {"count": self.count, "avg_ms": self.mean * 1000, "max_ms": self.max * 1000}
+
+
+class InferenceExecutor:
+    """Dedicated worker threads for model calls, with bounded admission.
+
+    Model calls never run on the event loop or in the shared threadpool used by
+    FastAPI, so /health and request handling stay responsive during
+    generation. `admit()` bounds how many requests may be waiting for or
+    running inference at once; beyond that QueueFullError is raised with a
+    Retry-After estimate based on the observed cost per request.
+
+    Queued calls run by priority class (see PRIORITY_CLASSES), earliest
+    deadline first within a class. A call whose deadline has passed when a
+    worker picks it up fails with DeadlineExceededError without running.
+
+    Handlers report each request's queue wait and generation time with
+    `record_request`; with batching several requests share one model call.
+    """
+
+    def __init__(self, max_workers: int = INFERENCE_WORKERS, max_queue: int = INFERENCE_MAX_QUEUE):
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max_queue
+        # Entries are (priority rank, deadline, sequence, job), a job of None stops a worker
+        self._queue: "queue.PriorityQueue" = queue.PriorityQueue()
+        self._sequence = itertools.count()
+        self._workers: List[threading.Thread] = []
+        for i in range(self.max_workers):
+            worker = threading.Thread(target=self._work, name=f"inference_{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+        # Admission is also released from streaming generators running in other threads
+        self._lock = threading.Lock()
+        self.outstanding = 0
+        self.rejected = 0
+        # Seconds workers spent running model calls
+        self.busy_time = 0.0
+        self.queue_wait = _RunningAverage()
+        self.generation = _RunningAverage()
+        # Per priority class: requests admitted, calls waiting for a worker,
+        # requests dropped past their deadline and queue wait histograms
+        self.outstanding_by_class = Counter()
+        self.waiting_by_class = Counter()
+        self.expired_by_class = Counter()
+        self.queue_wait_by_class = {priority: _Histogram() for priority in PRIORITY_CLASSES}
+
+    def record_request(self, queue_wait: float, generation: float, priority: str = DEFAULT_PRIORITY):
+        with self._lock:
+            self.queue_wait.add(queue_wait)
+            self.generation.add(generation)
+            self.queue_wait_by_class[PRIORITY_CLASSES[priority_rank(priority)]].add(queue_wait)
+
+    def record_expired(self, priority: str = DEFAULT_PRIORITY, count: int = 1):
+        """Count requests dropped because their deadline passed before generation."""
+        with self._lock:
+            self.expired_by_class[PRIORITY_CLASSES[priority_rank(priority)]] += count
+
+    def retry_after(self) -> int:
+        """Seconds until a slot is likely to free up."""
+        completed = self.generation.count
+        per_request = self.busy_time / completed if completed else 1.0
+        return max(1, math.ceil(per_request * self.outstanding / self.max_workers))
+
+    def acquire(self, priority: str = DEFAULT_PRIORITY):
+        """Take a queue slot, or raise QueueFullError if none is free."""
+        with self._lock:
+            if self.outstanding >= self.max_queue:
+                self.rejected += 1
+                raise QueueFullError(self.retry_after())
+            self.outstanding += 1
+            self.outstanding_by_class[PRIORITY_CLASSES[priority_rank(priority)]] += 1
+
+    def release(self, priority: str = DEFAULT_PRIORITY):
+        with self._lock:
+            self.outstanding -= 1
+            self.outstanding_by_class[PRIORITY_CLASSES[priority_rank(priority)]] -= 1
+
+    @contextmanager
+    def admit(self, priority: str = DEFAULT_PRIORITY):
+        """Hold a queue slot for the duration of a request, or raise QueueFullError."""
+        self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release(priority)
+
+    def submit(
+        self,
+        fn: Callable,
+        *args,
+        priority: str = DEFAULT_PRIORITY,
+        deadline: Optional[float] = None,
+        **kwargs
+    ) -> "Future[Tuple[Any, float, float]]":
+        """Run `fn` on an inference worker once higher-priority calls have started.
+
+        `deadline` is a time.monotonic() value; if it has passed when a worker
+        picks the call up, the future fails with DeadlineExceededError. The
+        future otherwise resolves to (result, seconds queued, seconds running).
+        """
+        job = _Job(fn, args, kwargs, PRIORITY_CLASSES[priority_rank(priority)], deadline)
+        with self._lock:
+            self.waiting_by_class[job.priority] += 1
+        self._queue.put((
+            priority_rank(priority),
+            deadline if deadline is not None else math.inf,
+            next(self._sequence),
+            job
+        ))
+        return job.future
+
+    def _work(self):
+        while True:
+            job = self._queue.get()[-1]
+            if job is None:
+                return
+            with self._lock:
+                self.waiting_by_class[job.priority] -= 1
+            if not job.future.set_running_or_notify_cancel():
+                continue
+            started = time.monotonic()
+            if job.deadline is not None and started > job.deadline:
+                self.record_expired(job.priority)
+                job.future.set_exception(DeadlineExceededError(
+                    f"Deadline passed {started - job.deadline:.1f}s before generation started"
+                ))
+                continue
+            try:
+                result = job.fn(*job.args, **job.kwargs)
+            except BaseException as e:
+                job.future.set_exception(e)
+            else:
+                job.future.set_result((result, started - job.submitted, time.monotonic() - started))
+            finally:
+                with self._lock:
+                    self.busy_time += time.monotonic() - started
+
+    async def run(
+        self,
+        fn: Callable,
+        *args,
+        priority: str = DEFAULT_PRIORITY,
+        deadline: Optional[float] = None,
+        **kwargs
+    ) -> Tuple[Any, float, float]:
+        """Await `fn` on an inference worker, returning (result, seconds queued, seconds running)."""
+        return await asyncio.wrap_future(self.submit(fn, *args, priority=priority, deadline=deadline, **kwargs))
+
+    def shutdown(self):
+        """Cancel calls still waiting and stop the workers once their current call ends."""
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item[-1] is not None:
+                item[-1].future.cancel()
+        for _ in self._workers:
+            self._queue.put((len(PRIORITY_CLASSES), math.inf, next(self._sequence), None))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            by_class = {
+                priority: {
+                    "outstanding": self.outstanding_by_class[priority],
+                    "waiting": self.waiting_by_class[priority],
+                    "expired": self.expired_by_class[priority],
+                    "queue_wait": self.queue_wait_by_class[priority].as_dict()
+                }
+                for priority in PRIORITY_CLASSES
+            }
+        return {
+            "workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "outstanding": self.outstanding,
+            "rejected": self.rejected,
+            "busy_seconds": self.busy_time,
+            "queue_wait": self.queue_wait.as_dict(),
+            "generation": self.generation.as_dict(),
+            "classes": by_class
+        }
@@ -1,23 +1,57 @@
 # backend/ service/app/main.py
 
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from transformers import pipeline, AutoModelForCausalLM
+from fastapi import Depends, FastAPI, Header, HTTPException
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel, Field
+from starlette.background import BackgroundTask
+from transformers import (
+    pipeline, AutoModelForCausalLM, Pipeline, StoppingCriteria, StoppingCriteriaList, TextIteratorStreamer
+)
 import httpx
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Iterator, Tuple
 import os
+import json
+import queue
+import threading
 import time
 import asyncio
+import gc
+import hmac
 from pathlib import Path
 from dotenv import load_dotenv
 from huggingface_hub import login, InferenceClient
 import torch
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from .backends import BACKENDS, INFERENCE_BACKEND, configured_model_name, load_pipeline, resolve_backend
+from .batching import BatchScheduler
+from .executor import DeadlineExceededError, InferenceExecutor, QueueFullError
+from .metrics import (
+    CONTENT_TYPE_LATEST, PROMPT_BUILD_SECONDS, RETRIEVAL_SECONDS, FirstTokenTimer, GenerationResult,
+    generate_latest, observe_generation
+)
+from .model_gate import ModelGate, ModelNotReadyError
+from .prefix_cache import PrefixCache, PromptPrefix, PREFIX_CACHE_ENABLED, prefix_key
+from .semantic_cache import SemanticCache, SEMANTIC_CACHE_ENABLED
+from .streaming import StreamSlot
 
 
 # Load environment variables from .env file
 load_dotenv()
 
-app = FastAPI(title="LLM Microservice")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await batch_scheduler.start()
+    # Serve /health right away and load the model in the background, /ready reports when it is in
+    task = asyncio.create_task(load_initial_model())
+    model_tasks.add(task)
+    task.add_done_callback(model_tasks.discard)
+    yield
+    await batch_scheduler.aclose()
+    inference_executor.shutdown()
+    await vector_client.aclose()
+
+app = FastAPI(title="LLM Microservice", lifespan=lifespan)
 
 class LLMRequest(BaseModel):
     query: str
@@ -26,6 +60,34 @@ class LLMRequest(BaseModel):
 class LLMResponse(BaseModel):
     response: str
     isHiddenValueResponse: bool
+    # Time spent waiting for the model versus generating, when the model ran
+    queue_wait_ms: Optional[float] = None
+    generation_ms: Optional[float] = None
+
+class SummarizeRequest(BaseModel):
+    previous_summary: str = ""
+    # Chat turns to fold into the summary, oldest first
+    messages: List[Dict[str, str]]
+
+class SummarizeResponse(BaseModel):
+    summary: str
+    generation_ms: Optional[float] = None
+
+class HintQuestion(BaseModel):
+    question_id: int
+    public_question: str
+    teacher_instructions: Optional[str] = None
+
+# Upper bound on the hints per question a /hints request may ask for
+HINT_LADDER_MAX_LEVELS = int(os.getenv("HINT_LADDER_MAX_LEVELS", "5"))
+
+class HintLadderRequest(BaseModel):
+    questions: List[HintQuestion]
+    levels: Optional[int] = Field(None, ge=1, le=HINT_LADDER_MAX_LEVELS)
+
+class HintLadderResponse(BaseModel):
+    # Question id -> hints, from the first nudge to the most specific
+    hint_ladders: Dict[int, List[str]]
 
 # Try to authenticate with Hugging Face
 hf_token = os.getenv("HUGGING_FACE_HUB_TOKEN")
@@ -38,34 +100,114 @@ else:
 # Configuration from environment variables - ensure MODEL_NAME from .env is used
 MODEL_NAME = os.getenv("MODEL_NAME", "mistralai/Mistral-7B-Instruct-v0.2")
 VECTOR_SERVICE_URL = os.getenv("VECTOR_SERVICE_URL", "http://vector-service:8002")
+VECTOR_SERVICE_TIMEOUT = float(os.getenv("VECTOR_SERVICE_TIMEOUT", "10"))
+VECTOR_MAX_CONNECTIONS = int(os.getenv("VECTOR_MAX_CONNECTIONS", "50"))
 MODEL_CACHE_DIR = os.getenv("MODEL_CACHE_DIR", "./model_cache")  # Using local directory
 MAX_LENGTH = int(os.getenv("MAX_LENGTH", "2048"))
 TEMPERATURE = float(os.getenv("TEMPERATURE", "0.8"))
 DEVICE = os.getenv("DEVICE", "0")  # Use "0" for first GPU, "-1" for CPU
 MAX_RESPONSE_LENGTH = int(os.getenv("MAX_RESPONSE_LENGTH", "200"))  # Increased from 180 to 500
+# Upper bound on prompt tokens spent on earlier chat turns, within MAX_LENGTH
+HISTORY_MAX_TOKENS = int(os.getenv("HISTORY_MAX_TOKENS", "1024"))
+# Truncating a message to fewer tokens than this is not worth it, it is dropped instead
+HISTORY_MIN_TRUNCATED_TOKENS = 32
+# Allowance for the chat template's role markers around each message
+TEMPLATE_TOKENS_PER_MESSAGE = 8
+TOKEN_COUNT_CACHE_SIZE = int(os.getenv("TOKEN_COUNT_CACHE_SIZE", "8192"))
 
-# Create cache directory if it doesn't exist
-print(f"Loading {MODEL_NAME} model using pipeline...")
-try:
-    # Initialize the pipeline with optimized settings
-    llm_pipeline = pipeline(
-        task="text-generation",
-        model=MODEL_NAME,
-        device=0,
-        torch_dtype=torch.float16,  # Use half precision to reduce memory usage
-        model_kwargs={
-            "cache_dir": MODEL_CACHE_DIR,
-            "low_cpu_mem_usage": True,
-            "use_auth_token": hf_token,
-            "attn_implementation": "eager",  # Use flash attention on CUDA
-        },
-        trust_remote_code=True 
-    )
-    print(f"{MODEL_NAME} model loaded successfully!")
-except Exception as e:
-    print(f"Error loading model: {e}")
-    print(f"Full error details: {repr(e)}")
-    raise
+# Responses to hidden-value questions, reused for near-identical queries
+semantic_cache = SemanticCache() if SEMANTIC_CACHE_ENABLED else None
+
+# Pooled keep-alive connections to vector-service shared by all requests
+vector_client = httpx.AsyncClient(
+    timeout=VECTOR_SERVICE_TIMEOUT,
+    limits=httpx.Limits(max_connections=VECTOR_MAX_CONNECTIONS, max_keepalive_connections=VECTOR_MAX_CONNECTIONS)
+)
+
+# The model is loaded after startup by load_initial_model and can be replaced through /admin/model
+inference_backend = resolve_backend(INFERENCE_BACKEND, DEVICE)
+llm_pipeline: Optional[Pipeline] = None
+loaded_model_name = configured_model_name(inference_backend, MODEL_NAME)
+# Key/value states of conversation prefixes shared across chat turns
+prefix_cache: Optional[PrefixCache] = None
+# Held by every request using the model, so a swap waits for them instead of dropping them
+model_gate = ModelGate()
+# Serializes the initial load and swaps, each loads one model next to the one serving
+model_load_lock = asyncio.Lock()
+model_tasks = set()
+# Progress of the initial load and of the latest swap
+model_status = {
+    "status": "loading",
+    "model": loaded_model_name,
+    "backend": inference_backend,
+    "loading": loaded_model_name,
+    "error": None
+}
+# Token required by the /admin endpoints in the X-Admin-Token header, unset disables them
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+# Comma-separated models /admin/model may swap in, besides the configured one
+SWAP_MODEL_ALLOWLIST = {name.strip() for name in os.getenv("SWAP_MODEL_ALLOWLIST", "").split(",") if name.strip()}
+# Seconds clients are told to wait before retrying while the model loads
+MODEL_LOADING_RETRY_AFTER = int(os.getenv("MODEL_LOADING_RETRY_AFTER", "10"))
+
+def load_model(
+    model_name: str, backend: str, trust_remote_code: bool = True
+) -> Tuple[Pipeline, Optional[PrefixCache]]:
+    """Load a pipeline and its prefix cache, run off the event loop while the current model keeps serving."""
+    new_pipeline = load_pipeline(backend, model_name, DEVICE, MODEL_CACHE_DIR, hf_token, trust_remote_code)
+    # Batched generation pads prompts on the left so every sequence ends where generation starts
+    if new_pipeline.tokenizer.pad_token is None:
+        new_pipeline.tokenizer.pad_token = new_pipeline.tokenizer.eos_token
+    new_pipeline.tokenizer.padding_side = "left"
+    new_prefix_cache = PrefixCache(new_pipeline.model, new_pipeline.tokenizer) if PREFIX_CACHE_ENABLED else None
+    return new_pipeline, new_prefix_cache
+
+def install_model(model_name: str, backend: str, new_pipeline: Pipeline, new_prefix_cache: Optional[PrefixCache]):
+    """Make a loaded model the one serving requests. Callers hold the gate exclusively once requests are served."""
+    global llm_pipeline, prefix_cache, loaded_model_name, inference_backend
+    llm_pipeline, prefix_cache = new_pipeline, new_prefix_cache
+    loaded_model_name, inference_backend = model_name, backend
+    # Cached token counts belong to the previous tokenizer
+    count_text_tokens.cache_clear()
+    model_gate.ready = True
+    model_status.update(status="ready", model=model_name, backend=backend, loading=None, error=None)
+    print(f"{model_name} model loaded successfully!")
+
+async def load_initial_model():
+    async with model_load_lock:
+        try:
+            loaded = await asyncio.to_thread(load_model, loaded_model_name, inference_backend)
+        except Exception as e:
+            print(f"Error loading model: {e}")
+            print(f"Full error details: {repr(e)}")
+            model_status.update(status="failed", error=str(e))
+            return
+        install_model(loaded_model_name, inference_backend, *loaded)
+
+async def swap_model(model_name: str, backend: str):
+    """Load `model_name` next to the serving model, then swap it in between requests.
+
+    Requests keep being served by the old model while the new one loads.
+    For the swap itself, new requests wait at the gate until the requests
+    in progress finish, so none is dropped. Memory for both models is needed
+    until the old one is released. Models swapped in never run code from
+    their repository.
+    """
+    try:
+        try:
+            loaded = await asyncio.to_thread(load_model, model_name, backend, False)
+        except Exception as e:
+            print(f"Error loading model {model_name}: {e}")
+            model_status.update(status="ready" if model_gate.ready else "failed", loading=None, error=str(e))
+            return
+        async with model_gate.exclusive():
+            install_model(model_name, backend, *loaded)
+        # The old model has no references left once the requests using it are done
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+    finally:
+        model_load_lock.release()
 
 
 def format_prompt(system_prompt: str, query: str) -> str:
@@ -75,66 +217,86 @@ def format_prompt(system_prompt: str, query: str) -> str:
  here is the student's question:
 {query} [/INST]"""
 
-async def get_hidden_values(problem_id: str, query: str) -> Optional[str]:
-    """Search for hidden values specific to this problem."""
-    print("attempting to get hidden values from vector service")
+async def retrieve_context(problem_id: str, query: str) -> Tuple[Optional[str], str, Optional[List[float]]]:
+    """Fetch the hidden-value match and topic context for a query in one vector-service call.
+    
+    Returns (hidden value or None, formatted teaching materials or "", query
+    embedding when the semantic cache needs it).
+    """
+    print("retrieving context from vector service")
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{VECTOR_SERVICE_URL}/search_hidden_values",
-                json={
-                    "query": query,
-                    "problem_id": problem_id,
-                }
-            )
-            response.raise_for_status()
-            data = response.json()
-            does_exist = data.get("has_hidden_values")
-            if does_exist:
-                # If we found hidden values, format them for the LLM
-                return data["hidden_value"]
-            return None
-            
+        response = await vector_client.post(
+            f"{VECTOR_SERVICE_URL}/retrieve_context",
+            json={
+                "query": query,
+                "problem_id": problem_id,
+                "materials_limit": 3,
+                "return_embedding": semantic_cache is not None
+            }
+        )
+        response.raise_for_status()
+        data = response.json()
     except Exception as e:
         print('--------------------------------')
-        print(f"Error fetching hidden values: {e}")
-        return None
+        print(f"Error retrieving context: {e}")
+        return None, "", None
+    
+    hidden_value = data["hidden_value"] if data.get("has_hidden_values") else None
+    
+    # Format the teaching materials
+    topic_context = ""
+    if data.get("materials"):
+        topic_context = "\nRelevant Teaching Materials:\n"
+        for material in data["materials"]:
+            topic_context += f"- {material['content']}\n"
+    return hidden_value, topic_context, data.get("query_embedding")
 
-async def get_topic_context(problem_id: str, query: str) -> str:
-    """Get relevant topic information for the problem."""
-    try:
-        async with httpx.AsyncClient() as client:
-            # First get the problem topic
-            topic_response = await client.get(
-                f"{VECTOR_SERVICE_URL}/problems/{problem_id}/topic"
-            )
-            topic_response.raise_for_status()
-            topic_data = topic_response.json()
-            
-            # Then search for relevant materials using both query and topic
-            context_response = await client.post(
-                f"{VECTOR_SERVICE_URL}/search_materials",
-                json={
-                    "query": query,
-                    "topic": topic_data["topic"],
-                    "problem_id": problem_id,
-                    "limit": 3
-                }
-            )
-            context_response.raise_for_status()
-            context_data = context_response.json()
-            
-            # Format the teaching materials
-            context = "\nRelevant Teaching Materials:\n"
-            for material in context_data["results"]:
-                context += f"- {material['content']}\n"
-                
-            return ""
-            
-    except Exception as e:
-        print('--------------------------------')
-        print(f"Error fetching topic context: {e}")
-        return ""
+@lru_cache(maxsize=TOKEN_COUNT_CACHE_SIZE)
+def count_text_tokens(text: str) -> int:
+    """Token count of a piece of text, cached so chat history is not re-tokenized every turn."""
+    return len(llm_pipeline.tokenizer(text, add_special_tokens=False)["input_ids"])
+
+def history_budget(system_content: str, user_content: str) -> int:
+    """Tokens left for chat history once the system prompt, current turn and response are reserved."""
+    reserved = (
+        count_text_tokens(system_content)
+        + count_text_tokens(user_content)
+        + 2 * TEMPLATE_TOKENS_PER_MESSAGE
+        + MAX_RESPONSE_LENGTH
+    )
+    return max(0, min(HISTORY_MAX_TOKENS, MAX_LENGTH - reserved))
+
+def fit_history(history: List[Dict[str, str]], budget: int) -> List[Dict[str, str]]:
+    """Keep the newest messages that fit in `budget` tokens.
+    
+    Messages are taken newest first. The first one that does not fit is
+    truncated to the remaining budget (if enough is left to be useful) and
+    everything older is dropped.
+    """
+    kept = []
+    for message in reversed(history):
+        cost = count_text_tokens(message["content"]) + TEMPLATE_TOKENS_PER_MESSAGE
+        if cost <= budget:
+            kept.append(message)
+            budget -= cost
+            continue
+        available = budget - TEMPLATE_TOKENS_PER_MESSAGE
+        if available >= HISTORY_MIN_TRUNCATED_TOKENS:
+            token_ids = llm_pipeline.tokenizer(message["content"], add_special_tokens=False)["input_ids"]
+            content = llm_pipeline.tokenizer.decode(token_ids[:available - 1], skip_special_tokens=True)
+            kept.append({"role": message["role"], "content": content + "..."})
+        break
+    kept.reverse()
+    # Start the window on a student turn so roles keep alternating
+    while kept and kept[0]["role"] != "user":
+        kept.pop(0)
+    return kept
+
+def fit_history_to_prompt(
+    history: List[Dict[str, str]], system_content: str, user_content: str
+) -> List[Dict[str, str]]:
+    """fit_history with the budget the prompt leaves; it tokenizes, so run it off the event loop."""
+    return fit_history(history, history_budget(system_content, user_content))
 
 def format_chat_history(chat_history):
     """Convert chat history to structured message format."""
@@ -150,144 +312,649 @@ def format_chat_history(chat_history):
                 })
     return messages
 
-@app.post("/generate", response_model=LLMResponse)
-async def generate_text(request: LLMRequest):
-    try:
-        problem_id = f"{request.context.get('test_id')}_{request.context.get('question_id')}"
-        
-        # Get chat history from context
-        chat_history = request.context.get("chat_history", [])
-        
-        # Check if this is a practice exam or a regular test
-        is_practice_exam = request.context.get("isPracticeExam", False)
-        public_question = request.context.get("public_question", "")
-            
-        # First check if this is a request for hidden values
+# Sampling settings shared by the blocking and streaming endpoints
+GENERATION_KWARGS = dict(
+    do_sample=True,
+    temperature=TEMPERATURE,
+    max_new_tokens=MAX_RESPONSE_LENGTH,
+    num_return_sequences=1,
+    early_stopping=False,
+    use_cache=True
+)
+
+def generation_kwargs() -> Dict:
+    """Sampling settings with the loaded tokenizer's pad token, which batched prompts are left-padded with."""
+    return dict(GENERATION_KWARGS, pad_token_id=llm_pipeline.tokenizer.pad_token_id)
+# Seconds the stream waits for the next token before giving up
+STREAM_TOKEN_TIMEOUT = float(os.getenv("STREAM_TOKEN_TIMEOUT", "60"))
+
+def count_prompt_tokens(prompt: str) -> int:
+    return len(llm_pipeline.tokenizer(prompt, add_special_tokens=False)["input_ids"])
+
+def current_model() -> str:
+    """Model label for metrics."""
+    return loaded_model_name
+
+def run_batch(prompts: List[str], prefixes: List[Optional[PromptPrefix]]) -> List[GenerationResult]:
+    """Generate a response for every prompt with one padded batched call.
+    
+    A batch of one reuses the cached key/value states of its prompt prefix.
+    """
+    texts = None
+    timer = FirstTokenTimer()
+    if len(prompts) == 1 and prefixes[0] is not None and prefix_cache is not None:
         try:
-            hidden_value = await get_hidden_values(problem_id, request.query)
-            print("hidden value successfully retrieved: ", hidden_value)
+            texts = [prefix_cache.generate(
+                prompts[0], prefixes[0], stopping_criteria=StoppingCriteriaList([timer]), **generation_kwargs()
+            )]
         except Exception as e:
-            print(f"No hidden values found for this problem")
-            hidden_value = None
-        
-        # For regular tests, enforce strict limitations
-        if not is_practice_exam and not hidden_value:
-            return LLMResponse(
-                response="I can only help with understanding hidden values for this test question. Please rephrase your question to ask about a specific hidden value.",
-                isHiddenValueResponse=False
-            )
-                
-        # Get topic context if no hidden values found
-        topic_context = "" if hidden_value else await get_topic_context(problem_id, request.query)
-        
-        # Create system message based on context
-        if hidden_value:
-            system_message = "You are a helpful teaching assistant. The student is asking about a hidden value in the problem. Since they specifically asked for it, you can provide the hidden value from the context. Be clear and informative."
-            is_hidden_value_response = True
-        elif is_practice_exam:
-            system_message = "You are a helpful teaching assistant using Socratic questioning. If the student appears to be stuck on this problem, ask them a question that will help guide their thinking. DO NOT provide direct answers. Review the chat history to avoid repeating questions."
-            is_hidden_value_response = False
+            print(f"Prefix cache generation failed, running without it: {e}")
+            timer = FirstTokenTimer()
+    if texts is None:
+        outputs = llm_pipeline(
+            prompts,
+            batch_size=len(prompts),
+            return_full_text=False,
+            stopping_criteria=StoppingCriteriaList([timer]),
+            **generation_kwargs()
+        )
+        texts = [output[0]["generated_text"] for output in outputs]
+    return [GenerationResult(text, count_prompt_tokens(text), timer.first_token) for text in texts]
+
+# All model calls run on dedicated inference workers, off the event loop
+inference_executor = InferenceExecutor()
+# Concurrent /generate requests share batched model calls
+batch_scheduler = BatchScheduler(
+    run_batch,
+    count_prompt_tokens,
+    max_new_tokens=MAX_RESPONSE_LENGTH,
+    executor=inference_executor
+)
+
+def queue_full_response(e: QueueFullError) -> HTTPException:
+    return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+def model_not_ready_response(e: ModelNotReadyError) -> HTTPException:
+    return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(MODEL_LOADING_RETRY_AFTER)})
+
+async def use_model():
+    """Hold the model gate for the whole request, so a swap never happens under it."""
+    try:
+        await model_gate.enter()
+    except ModelNotReadyError as e:
+        raise model_not_ready_response(e)
+    try:
+        yield
+    finally:
+        model_gate.leave()
+
+def request_priority(request: LLMRequest) -> str:
+    """Timed exams are served before practice chat."""
+    return "practice" if request.context.get("isPracticeExam", False) else "exam"
+
+def request_deadline(request: LLMRequest) -> Optional[float]:
+    """Monotonic deadline from the time budget (`deadline_ms`) the caller sent, counted from now."""
+    deadline_ms = request.context.get("deadline_ms")
+    if deadline_ms is None:
+        return None
+    return time.monotonic() + float(deadline_ms) / 1000
+
+class PreparedPrompt(BaseModel):
+    prompt: str = ""
+    uses_chat_template: bool = False
+    isHiddenValueResponse: bool = False
+    # Shared leading part of the prompt whose key/value states can be cached
+    prefix_key: Optional[str] = None
+    prefix_text: Optional[str] = None
+    # Where to store the generated response in the semantic cache, if cacheable
+    cache_bucket: Optional[Tuple[str, str, str]] = None
+    query_embedding: Optional[List[float]] = None
+    # Set when the request is answered without running the model
+    canned_response: Optional[str] = None
+    # Metrics labels and prompt size
+    mode: str = "socratic"
+    prompt_tokens: Optional[int] = None
+
+# Hidden-value answers served from the template instead of the model
+fast_path_stats = {"responses": 0}
+
+def format_hidden_value_response(hidden_value: str) -> str:
+    """Restate a hidden value returned by vector-service, e.g. "mass = 5kg"."""
+    return f"Here is the value you asked for: {hidden_value.strip()}"
+
+async def prepare_prompt(request: LLMRequest) -> PreparedPrompt:
+    """Look up hidden values and topic context and build the model prompt for a request."""
+    problem_id = f"{request.context.get('test_id')}_{request.context.get('question_id')}"
+    
+    # Get chat history from context, earlier turns only
+    chat_history = request.context.get("conversation_history", request.context.get("chat_history", []))
+    
+    # Check if this is a practice exam or a regular test
+    is_practice_exam = request.context.get("isPracticeExam", False)
+    public_question = request.context.get("public_question", "")
+    # Rolling summary of the turns before chat_history, in long practice sessions
+    conversation_summary = request.context.get("conversation_summary") if is_practice_exam else None
         
-        # Create context message
-        context_message = f"Problem: {public_question}\n\n"
-        if hidden_value:
-            context_message += f"Hidden value: {hidden_value}\n\n"
-        elif topic_context:
-            context_message += f"Helpful information: {topic_context}\n\n"
+    # Hidden value and teaching materials come from one retrieval call
+    retrieval_started = time.perf_counter()
+    hidden_value, topic_context, query_embedding = await retrieve_context(problem_id, request.query)
+    mode = "hidden_value" if hidden_value else "socratic"
+    RETRIEVAL_SECONDS.labels(mode, current_model()).observe(time.perf_counter() - retrieval_started)
+    print("hidden value successfully retrieved: ", hidden_value)
+    build_started = time.perf_counter()
+    
+    # Tests with the fast path enabled answer hidden-value hits without the model
+    if hidden_value and request.context.get("hiddenValueFastPath", False):
+        fast_path_stats["responses"] += 1
+        return PreparedPrompt(
+            canned_response=format_hidden_value_response(hidden_value),
+            isHiddenValueResponse=True
+        )
+    
+    # For regular tests, enforce strict limitations
+    if not is_practice_exam and not hidden_value:
+        return PreparedPrompt(
+            canned_response="I can only help with understanding hidden values for this test question. Please rephrase your question to ask about a specific hidden value."
+        )
+    
+    # Hidden-value answers do not depend on the chat history, so reuse one given to a near-identical query
+    cache_bucket = None
+    if hidden_value and semantic_cache is not None and query_embedding:
+        cache_bucket = SemanticCache.bucket(problem_id, "hidden_value", hidden_value)
+        cached_response = semantic_cache.lookup(cache_bucket, query_embedding)
+        if cached_response is not None:
+            print("semantic cache hit")
+            return PreparedPrompt(canned_response=cached_response, isHiddenValueResponse=True)
+            
+    # Create system message based on context
+    if hidden_value:
+        system_message = "You are a helpful teaching assistant. The student is asking about a hidden value in the problem. Since they specifically asked for it, you can provide the hidden value from the context. Be clear and informative."
+        is_hidden_value_response = True
+    elif is_practice_exam:
+        system_message = "You are a helpful teaching assistant using Socratic questioning. If the student appears to be stuck on this problem, ask them a question that will help guide their thinking. DO NOT provide direct answers. Review the chat history to avoid repeating questions."
+        is_hidden_value_response = False
+    
+    # Create context message, split into the problem and what was retrieved for this query
+    turn_context = ""
+    if hidden_value:
+        turn_context = f"Hidden value: {hidden_value}\n\n"
+    elif topic_context:
+        turn_context = f"Helpful information: {topic_context}\n\n"
+    summary_context = f"\n\nConversation so far: {conversation_summary}" if conversation_summary else ""
+    context_message = f"Problem: {public_question}{summary_context}\n\n" + turn_context
+    
+    # Check if tokenizer supports chat templates
+    if hasattr(llm_pipeline.tokenizer, "apply_chat_template"):
+        # The problem goes in the system message so every turn shares the same prompt prefix
+        system_content = f"{system_message}\n\nProblem: {public_question}{summary_context}"
+        user_content = turn_context + f"Student question: {request.query}"
         
-        # Format chat history as messages
-        formatted_history = format_chat_history(chat_history)
+        # Format chat history as messages, keeping the newest turns that fit the token budget
+        formatted_history = await asyncio.to_thread(
+            fit_history_to_prompt, format_chat_history(chat_history), system_content, user_content
+        )
         
-        # Create the complete messages list
         messages = [
-            {"role": "system", "content": system_message},
+            {"role": "system", "content": system_content},
         ]
         
         # Add formatted history if available
         if formatted_history:
             messages.extend(formatted_history)
         
-        # Add the current context and query
-        messages.append({"role": "user", "content": context_message + f"Student question: {request.query}"})
+        # Add the per-query context and the query
+        messages.append({"role": "user", "content": user_content})
+        
+        # Use the model's native chat template
+        print("using chat template")
+        chat_text = await asyncio.to_thread(
+            llm_pipeline.tokenizer.apply_chat_template,
+            messages,
+            tokenize=False,
+            add_generation_prompt=True
+        )
+        print("chat text: \n", chat_text)
+        # Everything up to the end of the system content is identical across turns
+        prefix_end = chat_text.find(system_content)
+        prefix_text = chat_text[:prefix_end + len(system_content)] if prefix_end >= 0 else None
+        prompt_tokens = await asyncio.to_thread(count_prompt_tokens, chat_text)
+        PROMPT_BUILD_SECONDS.labels(mode, current_model()).observe(time.perf_counter() - build_started)
+        return PreparedPrompt(
+            prompt=chat_text,
+            mode=mode,
+            prompt_tokens=prompt_tokens,
+            uses_chat_template=True,
+            isHiddenValueResponse=is_hidden_value_response,
+            prefix_key=prefix_key(problem_id, "hidden_value" if hidden_value else "practice", system_content) if prefix_text else None,
+            prefix_text=prefix_text,
+            cache_bucket=cache_bucket,
+            query_embedding=query_embedding if cache_bucket else None
+        )
+    
+    # Fallback to traditional prompt format
+    print("using traditional prompt format")
+    system_prompt = f"{system_message}\n\n{context_message}"
+    
+    # Include the chat history that fits the token budget in the system prompt
+    formatted_history = await asyncio.to_thread(
+        fit_history_to_prompt, format_chat_history(chat_history), system_prompt, request.query
+    )
+    if formatted_history:
+        history_summary = "Previous conversation:\n"
+        for msg in formatted_history:
+            sender = "Student" if msg["role"] == "user" else "Assistant"
+            history_summary += f"{sender}: {msg['content']}\n"
+        system_prompt += f"\n\n{history_summary}"
+    
+    prompt = format_prompt(system_prompt, request.query)
+    prompt_tokens = await asyncio.to_thread(count_prompt_tokens, prompt)
+    PROMPT_BUILD_SECONDS.labels(mode, current_model()).observe(time.perf_counter() - build_started)
+    return PreparedPrompt(
+        prompt=prompt,
+        mode=mode,
+        prompt_tokens=prompt_tokens,
+        isHiddenValueResponse=is_hidden_value_response,
+        cache_bucket=cache_bucket,
+        query_embedding=query_embedding if cache_bucket else None
+    )
+
+def prepared_prefix(prepared: PreparedPrompt) -> Optional[PromptPrefix]:
+    if prepared.prefix_key is None or prepared.prefix_text is None:
+        return None
+    return PromptPrefix(prepared.prefix_key, prepared.prefix_text)
+
+def remember_response(prepared: PreparedPrompt, response: str, generation_time: float):
+    """Store a generated response in the semantic cache when the prompt is cacheable."""
+    if semantic_cache is not None and prepared.cache_bucket is not None and prepared.query_embedding:
+        semantic_cache.store(tuple(prepared.cache_bucket), prepared.query_embedding, response, generation_time)
+
+def clean_generated_text(prepared: PreparedPrompt, generated_text: str) -> str:
+    """Strip prompt-format markers from the generated text."""
+    # Parse the response based on format
+    if prepared.uses_chat_template or "[/INST]" in prepared.prompt:
+        return generated_text.strip()
+    assistant_response = generated_text.split("<|assistant|>")[-1].strip()
+    if "<|endoftext|>" in assistant_response:
+        assistant_response = assistant_response.split("<|endoftext|>")[0].strip()
+    return assistant_response
+
+@app.post("/generate", response_model=LLMResponse, dependencies=[Depends(use_model)])
+async def generate_text(request: LLMRequest):
+    priority, deadline = request_priority(request), request_deadline(request)
+    try:
+        prepared = await prepare_prompt(request)
+        if prepared.canned_response is not None:
+            return LLMResponse(response=prepared.canned_response, isHiddenValueResponse=prepared.isHiddenValueResponse)
         
         print(f"Processing query with structured chat format...")
         
-        try:
-            # Check if tokenizer supports chat templates
-            if hasattr(llm_pipeline.tokenizer, "apply_chat_template"):
-                # Use the model's native chat template
-                print("using chat template")
-                chat_text = llm_pipeline.tokenizer.apply_chat_template(
-                    messages,
-                    tokenize=False,
-                    add_generation_prompt=True
+        queue_wait = generation_time = None
+        with inference_executor.admit(priority):
+            try:
+                # Generate response using the formatted text, batched with concurrent requests
+                result, queue_wait, generation_time = await batch_scheduler.submit(
+                    prepared.prompt,
+                    prefix=prepared_prefix(prepared),
+                    priority=priority,
+                    deadline=deadline,
+                    prompt_tokens=prepared.prompt_tokens
                 )
-                print("chat text: \n", chat_text)
-                # Generate response using the formatted text
-                response = llm_pipeline(
-                    chat_text,
-                    do_sample=True,
-                    temperature=TEMPERATURE,
-                    max_new_tokens=MAX_RESPONSE_LENGTH,
-                    pad_token_id=0,
-                    num_return_sequences=1,
-                    early_stopping=False,
-                    use_cache=True,
-                    return_full_text=False
+                inference_executor.record_request(queue_wait, generation_time, slot.priority)
+                observe_generation(
+                    prepared.mode, current_model(), prepared.prompt_tokens, queue_wait, generation_time, result
                 )
+                assistant_response = clean_generated_text(prepared, result.text)
+                remember_response(prepared, assistant_response, generation_time)
+                    
+            except DeadlineExceededError:
+                raise
+            except Exception as e:
+                print(f"LLM generation error: {e}")
+                assistant_response = "I'm sorry, I encountered an error while processing your request."
                 
-                assistant_response = response[0]["generated_text"].strip()
+        return LLMResponse(
+            response=assistant_response,
+            isHiddenValueResponse=prepared.isHiddenValueResponse,
+            queue_wait_ms=queue_wait * 1000 if queue_wait is not None else None,
+            generation_ms=generation_time * 1000 if generation_time is not None else None
+        )
+            
+    except QueueFullError as e:
+        raise queue_full_response(e)
+    except DeadlineExceededError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except Exception as e:
+        print(f"LLM service: An error occurred while generating the response: {e}")
+        print(f"Full error details: {repr(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+SUMMARY_SYSTEM_PROMPT = (
+    "You keep a running summary of a tutoring conversation between a student and a Socratic teaching assistant. "
+    "Update the summary with the new messages. Keep what the student has tried, understood and is still stuck on, "
+    "and the hints already given. Reply with the updated summary only, in a few sentences."
+)
+
+def format_summary_prompt(request: SummarizeRequest) -> str:
+    """Build the prompt that extends `previous_summary` with the new messages only."""
+    transcript = "\n".join(
+        f"{'Student' if msg.get('role') == 'user' else 'Assistant'}: {msg.get('content', '')}"
+        for msg in request.messages
+    )
+    content = f"Current summary: {request.previous_summary or '(none)'}\n\nNew messages:\n{transcript}"
+    if hasattr(llm_pipeline.tokenizer, "apply_chat_template"):
+        return llm_pipeline.tokenizer.apply_chat_template(
+            [{"role": "system", "content": SUMMARY_SYSTEM_PROMPT}, {"role": "user", "content": content}],
+            tokenize=False,
+            add_generation_prompt=True
+        )
+    return format_prompt(SUMMARY_SYSTEM_PROMPT, content)
+
+@app.post("/summarize", response_model=SummarizeResponse, dependencies=[Depends(use_model)])
+async def summarize(request: SummarizeRequest):
+    """Fold chat turns into a conversation summary, called in the background by main-service."""
+    if not request.messages:
+        return SummarizeResponse(summary=request.previous_summary)
+    try:
+        prompt = await asyncio.to_thread(format_summary_prompt, request)
+        with inference_executor.admit("background"):
+            result, queue_wait, generation_time = await batch_scheduler.submit(prompt, priority="background")
+            inference_executor.record_request(queue_wait, generation_time, "background")
+        observe_generation("summary", current_model(), None, queue_wait, generation_time, result)
+        summary = result.text.strip()
+        if not summary:
+            raise ValueError("Model returned an empty summary")
+        return SummarizeResponse(summary=summary, generation_ms=generation_time * 1000)
+    except QueueFullError as e:
+        raise queue_full_response(e)
+    except Exception as e:
+        print(f"LLM service: An error occurred while summarizing the conversation: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Number of hints generated per question for the hint bank
+HINT_LADDER_LEVELS = int(os.getenv("HINT_LADDER_LEVELS", "3"))
+HINT_SYSTEM_PROMPT = (
+    "You are a helpful teaching assistant using Socratic questioning. "
+    "Write a single hint for a student who is stuck on the problem. DO NOT provide the answer "
+    "or the final numeric result. Reply with the hint only."
+)
+# What a hint adds at each rung of the ladder, spread over the configured number of levels
+HINT_LEVEL_GUIDANCE = [
+    "Ask one guiding question that points the student to the concept the problem is about.",
+    "Ask a question that leads the student to the principle or formula that applies.",
+    "Suggest the first step of the method as a question, without carrying it out.",
+]
+
+def format_hint_prompt(question: HintQuestion, level: int, levels: int) -> str:
+    guidance = HINT_LEVEL_GUIDANCE[round(level * (len(HINT_LEVEL_GUIDANCE) - 1) / max(1, levels - 1))]
+    content = f"Problem: {question.public_question}\n\n"
+    if question.teacher_instructions:
+        content += f"Teacher instructions: {question.teacher_instructions}\n\n"
+    content += f"Write hint {level + 1} of {levels}, each more specific than the last. {guidance}"
+    if hasattr(llm_pipeline.tokenizer, "apply_chat_template"):
+        return llm_pipeline.tokenizer.apply_chat_template(
+            [{"role": "system", "content": HINT_SYSTEM_PROMPT}, {"role": "user", "content": content}],
+            tokenize=False,
+            add_generation_prompt=True
+        )
+    return format_prompt(HINT_SYSTEM_PROMPT, content)
+
+@app.post("/hints", response_model=HintLadderResponse)
+async def generate_hint_ladders(request: HintLadderRequest):
+    """Generate a ladder of graded hints for every question, for main-service's hint bank.
+    
+    Prompts are queued a batch at a time so the batch scheduler runs them as
+    batched model calls, at background priority. Each batch takes its own
+    queue slot and holds the model gate, so a job never holds either for
+    its whole length.
+    """
+    levels = request.levels or HINT_LADDER_LEVELS
+    jobs = [(question, level) for question in request.questions for level in range(levels)]
+    
+    async def generate(question: HintQuestion, level: int) -> str:
+        prompt = await asyncio.to_thread(format_hint_prompt, question, level, levels)
+        result, queue_wait, generation_time = await batch_scheduler.submit(prompt, priority="background")
+        inference_executor.record_request(queue_wait, generation_time, "background")
+        observe_generation("hint_bank", current_model(), None, queue_wait, generation_time, result)
+        return result.text.strip()
+    
+    hints = []
+    try:
+        for start in range(0, len(jobs), batch_scheduler.max_batch_size):
+            batch = jobs[start:start + batch_scheduler.max_batch_size]
+            with inference_executor.admit("background"):
+                async with model_gate.hold():
+                    hints.extend(await asyncio.gather(*(generate(question, level) for question, level in batch)))
+    except QueueFullError as e:
+        raise queue_full_response(e)
+    except ModelNotReadyError as e:
+        raise model_not_ready_response(e)
+    except Exception as e:
+        print(f"LLM service: An error occurred while generating hints: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    hint_ladders = {question.question_id: [] for question in request.questions}
+    for (question, _), hint in zip(jobs, hints):
+        hint_ladders[question.question_id].append(hint)
+    return HintLadderResponse(hint_ladders=hint_ladders)
+
+def sse_event(data: Dict, event: Optional[str] = None) -> str:
+    """Format a server-sent event carrying a JSON payload."""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+class StopWhenSet(StoppingCriteria):
+    """Stops generation once `event` is set, checked after every decoding step."""
+    
+    def __init__(self, event: threading.Event):
+        self.event = event
+    
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        return torch.full((input_ids.shape[0],), self.event.is_set(), dtype=torch.bool, device=input_ids.device)
+
+def stream_tokens(prepared: PreparedPrompt, deadline: Optional[float], slot: StreamSlot) -> Iterator[str]:
+    """Run generation on the inference executor and yield its text as server-sent events.
+    
+    Each chunk is sent as a `data` event with a `token` field. The stream ends
+    with a `done` event carrying the full response and timings, or an `error`
+    event. `slot` holds the model gate and an executor slot; closing it when
+    the stream ends stops a generation the client is no longer reading.
+    """
+    streamer = TextIteratorStreamer(
+        llm_pipeline.tokenizer,
+        skip_prompt=True,
+        skip_special_tokens=True,
+        timeout=STREAM_TOKEN_TIMEOUT
+    )
+    errors = []
+    started = threading.Event()
+    generation_started = []
+    
+    prefix = prepared_prefix(prepared)
+    stopping_criteria = StoppingCriteriaList([StopWhenSet(slot.cancelled)])
+    
+    def run_generation():
+        generation_started.append(time.monotonic())
+        started.set()
+        try:
+            if prefix is not None and prefix_cache is not None:
+                prefix_cache.generate(
+                    prepared.prompt, prefix, streamer=streamer, stopping_criteria=stopping_criteria,
+                    **generation_kwargs()
+                )
             else:
-                # Fallback to traditional prompt format
-                print("using traditional prompt format")
-                system_prompt = f"{system_message}\n\n{context_message}"
-                
-                # Include chat history summary in the system prompt
-                if chat_history:
-                    history_summary = "Previous conversation:\n"
-                    for msg in chat_history[-3:]:  # Only include last 3 messages
-                        sender = "Student" if msg.get("sender") == "user" else "Assistant"
-                        history_summary += f"{sender}: {msg.get('content', '')}\n"
-                    system_prompt += f"\n\n{history_summary}"
-                
-                full_prompt = format_prompt(system_prompt, request.query)
-                
-                response = llm_pipeline(
-                    full_prompt,
-                    do_sample=True,
-                    temperature=TEMPERATURE,
-                    max_new_tokens=MAX_RESPONSE_LENGTH,
-                    pad_token_id=0,
-                    num_return_sequences=1,
-                    early_stopping=False,
-                    use_cache=True,
-                    return_full_text=False
+                llm_pipeline(
+                    prepared.prompt, streamer=streamer, return_full_text=False, stopping_criteria=stopping_criteria,
+                    **generation_kwargs()
                 )
-                
-                generated_text = response[0]["generated_text"]
-                
-                # Parse the response based on format
-                if "[/INST]" in full_prompt:
-                    assistant_response = generated_text.strip()
-                else:
-                    assistant_response = generated_text.split("<|assistant|>")[-1].strip()
-                    if "<|endoftext|>" in assistant_response:
-                        assistant_response = assistant_response.split("<|endoftext|>")[0].strip()
-                
         except Exception as e:
             print(f"LLM generation error: {e}")
-            assistant_response = "I'm sorry, I encountered an error while processing your request."
-                
-        return LLMResponse(response=assistant_response, isHiddenValueResponse=is_hidden_value_response)
-            
+            errors.append(e)
+            # Unblock the consumer waiting on the next token
+            streamer.end()
+    
+    chunks = []
+    first_token = None
+    try:
+        job = slot.submit(run_generation, deadline)
+        if job is None:
+            return
+        # A job dropped past its deadline never starts
+        job.add_done_callback(lambda _: started.set())
+        # The token timeout only applies once the job has left the queue
+        started.wait()
+        if job.done() and not job.cancelled() and isinstance(job.exception(), DeadlineExceededError):
+            yield sse_event({"detail": str(job.exception()), "status_code": 504}, event="error")
+            return
+        try:
+            for text in streamer:
+                if text:
+                    if first_token is None:
+                        first_token = time.monotonic() - generation_started[0]
+                    chunks.append(text)
+                    yield sse_event({"token": text})
+        except queue.Empty:
+            errors.append(TimeoutError(f"No token generated for {STREAM_TOKEN_TIMEOUT}s"))
+        
+        if errors:
+            yield sse_event({"detail": str(errors[0])}, event="error")
+            return
+        _, queue_wait, generation_time = job.result()
+        inference_executor.record_request(queue_wait, generation_time, slot.priority)
+        generated_text = "".join(chunks)
+        observe_generation(
+            prepared.mode, current_model(), prepared.prompt_tokens, queue_wait, generation_time,
+            GenerationResult(generated_text, count_prompt_tokens(generated_text), first_token)
+        )
+        response = clean_generated_text(prepared, generated_text)
+        remember_response(prepared, response, generation_time)
+        yield sse_event(
+            {
+                "response": response,
+                "isHiddenValueResponse": prepared.isHiddenValueResponse,
+                "queue_wait_ms": queue_wait * 1000,
+                "generation_ms": generation_time * 1000
+            },
+            event="done"
+        )
+    finally:
+        slot.close()
+
+@app.post("/generate/stream")
+async def generate_text_stream(request: LLMRequest):
+    """Stream the response to a query as server-sent events while it is being generated."""
+    priority, deadline = request_priority(request), request_deadline(request)
+    # Held until the generation finishes, or the stream ends before it starts
+    try:
+        await model_gate.enter()
+    except ModelNotReadyError as e:
+        raise model_not_ready_response(e)
+    try:
+        prepared = await prepare_prompt(request)
     except Exception as e:
-        print(f"LLM service: An error occurred while generating the response: {e}")
-        print(f"Full error details: {repr(e)}")
+        model_gate.leave()
+        print(f"LLM service: An error occurred while preparing the prompt: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+    
+    background = None
+    if prepared.canned_response is not None:
+        model_gate.leave()
+        events = iter([
+            sse_event({"token": prepared.canned_response}),
+            sse_event(
+                {"response": prepared.canned_response, "isHiddenValueResponse": prepared.isHiddenValueResponse},
+                event="done"
+            )
+        ])
+    else:
+        try:
+            inference_executor.acquire(priority)
+        except QueueFullError as e:
+            model_gate.leave()
+            raise queue_full_response(e)
+        slot = StreamSlot(inference_executor, model_gate, priority)
+        # Also runs when the client disconnects before the body is iterated
+        background = BackgroundTask(slot.close)
+        # The generator blocks on the streamer, StreamingResponse runs it in the threadpool
+        events = stream_tokens(prepared, deadline, slot)
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=background
+    )
+
+@app.get("/stats")
+async def stats():
+    """Report batching and inference queue statistics."""
+    return {
+        "backend": inference_backend,
+        "model": loaded_model_name,
+        "model_status": model_status,
+        "batching": batch_scheduler.stats(),
+        "inference": inference_executor.stats(),
+        "prefix_cache": prefix_cache.stats() if prefix_cache is not None else None,
+        "hidden_value_fast_path": fast_path_stats,
+        "semantic_cache": semantic_cache.stats() if semantic_cache is not None else None
+    }
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics: retrieval, prompt size, queue wait, time to first token and decode speed."""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
 
 # Add health check endpoint
 @app.get("/health")
 async def health_check():
-    """Health check endpoint."""
+    """Liveness: the process is up, whether or not the model has loaded."""
     return {"status": "healthy"}
 
+@app.get("/ready")
+async def readiness_check():
+    """Readiness: 200 once a model is loaded and serving, 503 while it loads or if loading failed."""
+    if not model_gate.ready:
+        return JSONResponse(
+            status_code=503,
+            content=model_status,
+            headers={"Retry-After": str(MODEL_LOADING_RETRY_AFTER)}
+        )
+    return model_status
+
+class ModelSwapRequest(BaseModel):
+    model_name: str
+    # Inference backend for the new model, the configured one when unset
+    backend: Optional[str] = None
+
+def check_admin_token(x_admin_token: Optional[str] = Header(None)):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Admin endpoints are disabled, set ADMIN_TOKEN to enable them")
+    if x_admin_token is None or not hmac.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+def swappable_models() -> set:
+    return SWAP_MODEL_ALLOWLIST | {MODEL_NAME, configured_model_name(inference_backend, MODEL_NAME)}
+
+@app.get("/admin/model", dependencies=[Depends(check_admin_token)])
+async def get_model_status():
+    return model_status
+
+@app.post("/admin/model", status_code=202, dependencies=[Depends(check_admin_token)])
+async def replace_model(request: ModelSwapRequest):
+    """Load a model next to the serving one and swap it in once loaded, without dropping requests.
+    
+    Returns right away; poll GET /admin/model for progress.
+    """
+    if request.model_name not in swappable_models():
+        raise HTTPException(status_code=403, detail=f"{request.model_name} is not in SWAP_MODEL_ALLOWLIST")
+    backend = resolve_backend(request.backend or INFERENCE_BACKEND, DEVICE)
+    if backend not in BACKENDS:
+        raise HTTPException(status_code=400, detail=f"Unknown inference backend {backend!r}")
+    if model_load_lock.locked():
+        raise HTTPException(status_code=409, detail=f"{model_status['loading']} is still loading")
+    # Taken without yielding, so a concurrent call sees it; released by swap_model
+    await model_load_lock.acquire()
+    model_status.update(loading=request.model_name, error=None)
+    task = asyncio.create_task(swap_model(request.model_name, backend))
+    model_tasks.add(task)
+    task.add_done_callback(model_tasks.discard)
+    return model_status
+
@@ -0,0 +1,100 @@
+import time
+from typing import NamedTuple, Optional
+
+import torch
+from prometheus_client import CONTENT_TYPE_LATEST, Histogram, generate_latest
+from transformers import StoppingCriteria
+
+# Every series is labelled by request mode (hidden_value, socratic, summary, hint_bank) and model
+LABELS = ("mode", "model")
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+RETRIEVAL_SECONDS = Histogram(
+    "llm_retrieval_seconds",
+    "Time to fetch hidden values and teaching materials from vector-service",
+    LABELS,
+    buckets=LATENCY_BUCKETS
+)
+PROMPT_BUILD_SECONDS = Histogram(
+    "llm_prompt_build_seconds",
+    "Time to fit the chat history and apply the chat template, excluding retrieval",
+    LABELS,
+    buckets=LATENCY_BUCKETS
+)
+PROMPT_TOKENS = Histogram(
+    "llm_prompt_tokens",
+    "Prompt size in tokens",
+    LABELS,
+    buckets=(64, 128, 256, 512, 768, 1024, 1536, 2048, 3072, 4096, 8192)
+)
+QUEUE_WAIT_SECONDS = Histogram(
+    "llm_queue_wait_seconds",
+    "Time from submission until the model call started, including batch collection",
+    LABELS,
+    buckets=LATENCY_BUCKETS
+)
+TIME_TO_FIRST_TOKEN_SECONDS = Histogram(
+    "llm_time_to_first_token_seconds",
+    "Time from submission until the first new token, queue wait plus prefill",
+    LABELS,
+    buckets=LATENCY_BUCKETS
+)
+DECODE_TOKENS_PER_SECOND = Histogram(
+    "llm_decode_tokens_per_second",
+    "Tokens generated per second after the first token",
+    LABELS,
+    buckets=(1, 2, 5, 10, 20, 30, 50, 75, 100, 150, 200, 400)
+)
+GENERATION_SECONDS = Histogram(
+    "llm_generation_seconds",
+    "Duration of the model call, prefill and decode",
+    LABELS,
+    buckets=LATENCY_BUCKETS
+)
+
+
+class GenerationResult(NamedTuple):
+    """Text generated for one prompt, with what the model call measured."""
+    text: str
+    new_tokens: int
+    # Seconds from the start of the model call to the first new token, None if not observed
+    first_token: Optional[float] = None
+
+
+class FirstTokenTimer(StoppingCriteria):
+    """Records when the first new token was generated, without stopping generation.
+
+    Stopping criteria are checked after every decoding step, so the first
+    call marks the end of prefill for every sequence in the batch.
+    """
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.first_token: Optional[float] = None
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        if self.first_token is None:
+            self.first_token = time.monotonic() - self.started
+        return torch.zeros(input_ids.shape[0], dtype=torch.bool, device=input_ids.device)
+
+
+def observe_generation(
+    mode: str,
+    model: str,
+    prompt_tokens: Optional[int],
+    queue_wait: float,
+    generation_time: float,
+    result: GenerationResult
+):
+    """Record the metrics of one generated response."""
+    labels = (mode, model)
+    if prompt_tokens is not None:
+        PROMPT_TOKENS.labels(*labels).observe(prompt_tokens)
+    QUEUE_WAIT_SECONDS.labels(*labels).observe(queue_wait)
+    GENERATION_SECONDS.labels(*labels).observe(generation_time)
+    if result.first_token is not None:
+        TIME_TO_FIRST_TOKEN_SECONDS.labels(*labels).observe(queue_wait + result.first_token)
+        decode_time = generation_time - result.first_token
+        if result.new_tokens > 1 and decode_time > 0:
+            DECODE_TOKENS_PER_SECOND.labels(*labels).observe((result.new_tokens - 1) / decode_time)
+
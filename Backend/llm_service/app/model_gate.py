@@ -0,0 +1,73 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Optional
+
+
+class ModelNotReadyError(Exception):
+    """Raised for a request that arrives before the first model has loaded."""
+
+
+class ModelGate:
+    """Tracks the requests using the loaded model so it can be replaced between them.
+
+    Every request holds the gate from building its prompt until its response is
+    complete, so it sees one model throughout. `exclusive()` stops new
+    requests at the gate, waits for the ones in progress to finish, and lets
+    the waiting requests through once the model has been replaced. Nothing is
+    rejected during a swap; requests only wait for it.
+
+    State is only changed on the event loop; streaming responses leave the
+    gate from a worker thread through call_soon_threadsafe.
+    """
+
+    def __init__(self):
+        self.ready = False
+        self.active = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._open: Optional[asyncio.Event] = None
+        self._idle: Optional[asyncio.Event] = None
+
+    def _events(self):
+        if self._open is None:
+            self._loop = asyncio.get_running_loop()
+            self._open = asyncio.Event()
+            self._open.set()
+            self._idle = asyncio.Event()
+            self._idle.set()
+
+    async def enter(self):
+        """Wait out a swap in progress and hold the gate, or raise ModelNotReadyError."""
+        if not self.ready:
+            raise ModelNotReadyError("Model is still loading")
+        self._events()
+        await self._open.wait()
+        self.active += 1
+        self._idle.clear()
+
+    def _release(self):
+        self.active -= 1
+        if self.active == 0:
+            self._idle.set()
+
+    def leave(self):
+        """Release the gate, from the event loop or any other thread."""
+        self._loop.call_soon_threadsafe(self._release)
+
+    @asynccontextmanager
+    async def hold(self):
+        await self.enter()
+        try:
+            yield
+        finally:
+            self.leave()
+
+    @asynccontextmanager
+    async def exclusive(self):
+        """Hold back new requests and wait until none is using the model."""
+        self._events()
+        self._open.clear()
+        try:
+            await self._idle.wait()
+            yield
+        finally:
+            self._open.set()
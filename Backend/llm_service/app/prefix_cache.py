@@ -0,0 +1,158 @@
+import copy
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, NamedTuple, Optional
+
+import torch
+from transformers import DynamicCache
+
+PREFIX_CACHE_ENABLED = os.getenv("PREFIX_CACHE_ENABLED", "true").strip().lower() in ("1", "true", "yes", "on")
+PREFIX_CACHE_MAX_MB = float(os.getenv("PREFIX_CACHE_MAX_MB", "512"))
+# Shorter shared prefixes are not worth a cache copy
+PREFIX_CACHE_MIN_TOKENS = int(os.getenv("PREFIX_CACHE_MIN_TOKENS", "32"))
+
+
+class PromptPrefix(NamedTuple):
+    """Leading part of a prompt shared by every turn of a conversation."""
+    key: str
+    text: str
+
+
+def prefix_key(problem_id: str, mode: str, system_prompt: str) -> str:
+    digest = hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()[:16]
+    return f"{problem_id}:{mode}:{digest}"
+
+
+def _cache_nbytes(cache) -> int:
+    # The cache layout changed across transformers releases
+    if hasattr(cache, "layers"):
+        tensors = [t for layer in cache.layers for t in (layer.keys, layer.values) if t is not None]
+    else:
+        tensors = list(cache.key_cache) + list(cache.value_cache)
+    return sum(t.numel() * t.element_size() for t in tensors)
+
+
+class _Entry:
+    __slots__ = ("input_ids", "cache", "nbytes")
+
+    def __init__(self, input_ids: torch.Tensor, cache, nbytes: int):
+        self.input_ids = input_ids
+        self.cache = cache
+        self.nbytes = nbytes
+
+
+class PrefixCache:
+    """LRU cache of key/value states for prompt prefixes, bounded by memory.
+
+    A Socratic conversation re-sends the same system prompt and problem text on
+    every turn. The first turn computes the key/value states of that prefix
+    once; later turns copy them and only prefill the tokens after it. Entries
+    are evicted least recently used first once their tensors exceed
+    `max_bytes`.
+
+    Used from the inference workers only, for single-sequence generation.
+    """
+
+    def __init__(
+        self,
+        model,
+        tokenizer,
+        max_bytes: int = int(PREFIX_CACHE_MAX_MB * 1024 * 1024),
+        min_prefix_tokens: int = PREFIX_CACHE_MIN_TOKENS
+    ):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_bytes = max_bytes
+        self.min_prefix_tokens = min_prefix_tokens
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.reused_tokens = 0
+        self.prefilled_tokens = 0
+
+    def _build(self, prefix: PromptPrefix) -> _Entry:
+        input_ids = self.tokenizer(prefix.text, return_tensors="pt")["input_ids"].to(self.model.device)
+        with torch.no_grad():
+            cache = self.model(input_ids=input_ids, past_key_values=DynamicCache(), use_cache=True).past_key_values
+        return _Entry(input_ids[0], cache, _cache_nbytes(cache))
+
+    def _get(self, prefix: PromptPrefix) -> _Entry:
+        with self._lock:
+            entry = self._entries.get(prefix.key)
+            if entry is not None:
+                self._entries.move_to_end(prefix.key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        entry = self._build(prefix)
+        with self._lock:
+            if entry.nbytes > self.max_bytes:
+                return entry
+            previous = self._entries.pop(prefix.key, None)
+            if previous is not None:
+                self.nbytes -= previous.nbytes
+            self._entries[prefix.key] = entry
+            self.nbytes += entry.nbytes
+            while self.nbytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+                self.evictions += 1
+        return entry
+
+    def generate(self, prompt: str, prefix: PromptPrefix, streamer=None, **generation_kwargs) -> str:
+        """Generate a response for `prompt`, reusing the cached states of `prefix`.
+
+        The prefix only needs to match the prompt up to some token; states past
+        the first differing token are dropped. Returns the decoded new text.
+        """
+        inputs = self.tokenizer(prompt, return_tensors="pt").to(self.model.device)
+        input_ids = inputs["input_ids"]
+        prompt_length = input_ids.shape[1]
+
+        past_key_values = None
+        entry = self._get(prefix)
+        length = min(len(entry.input_ids), prompt_length)
+        mismatch = (entry.input_ids[:length] != input_ids[0, :length]).nonzero()
+        shared = int(mismatch[0]) if len(mismatch) else length
+        # generate needs at least one uncached token to start from
+        shared = min(shared, prompt_length - 1)
+        if shared >= self.min_prefix_tokens:
+            past_key_values = copy.deepcopy(entry.cache)
+            if shared < len(entry.input_ids):
+                past_key_values.crop(shared)
+        else:
+            shared = 0
+
+        with self._lock:
+            self.reused_tokens += shared
+            self.prefilled_tokens += prompt_length - shared
+
+        with torch.no_grad():
+            output = self.model.generate(
+                **inputs,
+                past_key_values=past_key_values,
+                streamer=streamer,
+                **generation_kwargs
+            )
+        return self.tokenizer.decode(output[0, prompt_length:], skip_special_tokens=True)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            prompt_tokens = self.reused_tokens + self.prefilled_tokens
+            return {
+                "entries": len(self._entries),
+                "bytes": self.nbytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "reused_tokens": self.reused_tokens,
+                "prefilled_tokens": self.prefilled_tokens,
+                "reuse_rate": self.reused_tokens / prompt_tokens if prompt_tokens else 0.0
+            }
@@ -0,0 +1,121 @@
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "true").strip().lower() in ("1", "true", "yes", "on")
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", "3600"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "2048"))
+
+
+class _Entry:
+    __slots__ = ("bucket", "embedding", "response", "generation_time", "expires_at")
+
+    def __init__(self, bucket: Tuple, embedding: np.ndarray, response: str, generation_time: float, expires_at: float):
+        self.bucket = bucket
+        self.embedding = embedding
+        self.response = response
+        self.generation_time = generation_time
+        self.expires_at = expires_at
+
+
+def _normalize(embedding: List[float]) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class SemanticCache:
+    """Cache of generated responses looked up by query-embedding similarity.
+
+    Entries are grouped in buckets (problem id, mode and the retrieved hidden
+    value), so a response is only reused for the same problem with the same
+    retrieved context. Within a bucket the stored query most similar to the
+    new one is returned if its cosine similarity reaches `threshold`.
+    Entries expire after `ttl` seconds and the least recently used are
+    evicted beyond `max_entries`.
+    """
+
+    def __init__(
+        self,
+        threshold: float = SEMANTIC_CACHE_THRESHOLD,
+        ttl: float = SEMANTIC_CACHE_TTL,
+        max_entries: int = SEMANTIC_CACHE_MAX_ENTRIES
+    ):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._buckets: Dict[Tuple, List[int]] = {}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.saved_generation_time = 0.0
+
+    @staticmethod
+    def bucket(problem_id: str, mode: str, hidden_value: Optional[str]) -> Tuple:
+        return (problem_id, mode, hidden_value or "")
+
+    def _remove(self, entry_id: int):
+        entry = self._entries.pop(entry_id)
+        ids = self._buckets[entry.bucket]
+        ids.remove(entry_id)
+        if not ids:
+            del self._buckets[entry.bucket]
+
+    def lookup(self, bucket: Tuple, embedding: List[float]) -> Optional[str]:
+        """Return the cached response for the most similar stored query, if similar enough."""
+        query = _normalize(embedding)
+        now = time.monotonic()
+        with self._lock:
+            best_id, best_similarity = None, self.threshold
+            for entry_id in list(self._buckets.get(bucket, ())):
+                entry = self._entries[entry_id]
+                if entry.expires_at < now:
+                    self._remove(entry_id)
+                    continue
+                similarity = float(np.dot(query, entry.embedding))
+                if similarity >= best_similarity:
+                    best_id, best_similarity = entry_id, similarity
+
+            if best_id is None:
+                self.misses += 1
+                return None
+            entry = self._entries[best_id]
+            self._entries.move_to_end(best_id)
+            self.hits += 1
+            self.saved_generation_time += entry.generation_time
+            return entry.response
+
+    def store(self, bucket: Tuple, embedding: List[float], response: str, generation_time: float):
+        with self._lock:
+            entry_id = next(self._ids)
+            self._entries[entry_id] = _Entry(
+                bucket, _normalize(embedding), response, generation_time, time.monotonic() + self.ttl
+            )
+            self._buckets.setdefault(bucket, []).append(entry_id)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "threshold": self.threshold,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "saved_generation_seconds": self.saved_generation_time
+            }
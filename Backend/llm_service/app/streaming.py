@@ -0,0 +1,54 @@
+import threading
+from concurrent.futures import Future
+from typing import Callable, Optional
+
+from .executor import DEFAULT_PRIORITY, InferenceExecutor
+from .model_gate import ModelGate
+
+
+class StreamSlot:
+    """The executor slot and model gate held by one streaming response.
+
+    Once the generation job is submitted, both are given back when the job
+    finishes rather than when the client stops reading, so a model swap
+    waits for a generation still running after a disconnect and the
+    executor's queue accounting keeps counting it. `close()` sets
+    `cancelled`, which the generation checks between tokens to stop early.
+
+    `close()` may be called from the stream and from the response's
+    background task; the slot is released exactly once.
+    """
+
+    def __init__(self, executor: InferenceExecutor, gate: ModelGate, priority: str = DEFAULT_PRIORITY):
+        self.executor = executor
+        self.gate = gate
+        self.priority = priority
+        self.cancelled = threading.Event()
+        self._lock = threading.Lock()
+        self._job: Optional[Future] = None
+        self._released = False
+
+    def submit(self, fn: Callable, deadline: Optional[float] = None) -> Optional[Future]:
+        """Run `fn` on the executor, or return None if the stream was already closed."""
+        with self._lock:
+            if self.cancelled.is_set():
+                return None
+            self._job = self.executor.submit(fn, priority=self.priority, deadline=deadline)
+        self._job.add_done_callback(lambda _: self._release())
+        return self._job
+
+    def close(self):
+        """Stop the generation, releasing now unless a submitted job has yet to finish."""
+        with self._lock:
+            self.cancelled.set()
+            if self._job is not None:
+                return
+        self._release()
+
+    def _release(self):
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        self.executor.release(self.priority)
+        self.gate.leave()
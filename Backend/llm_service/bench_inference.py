@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Benchmark the llm_service inference backends on this machine.
+
+Loads each requested backend with the given model, runs a fixed set of tutor
+style prompts through the same text-generation pipeline the service uses and
+reports per-request latency (p50/p95) and decode throughput in generated
+tokens per second. Needs only torch and transformers, so it runs on a plain
+Linux box without a GPU.
+
+Usage:
+    python bench_inference.py --backends transformers cpu-int8 --model Qwen/Qwen2.5-0.5B-Instruct
+    DEVICE=0 python bench_inference.py --backends transformers --model mistralai/Mistral-7B-Instruct-v0.2
+"""
+import argparse
+import os
+import statistics
+import time
+
+from app import backends
+
+PROMPTS = [
+    "A 5 kg block slides down a frictionless incline of 30 degrees. What is its acceleration?",
+    "I don't understand how to find the hidden mass in this problem, can you give me a hint?",
+    "Why does the period of a pendulum not depend on its mass?",
+    "How do I set up the energy conservation equation for a spring launcher?",
+]
+
+
+def percentile(values, pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1)))
+    return ordered[index]
+
+
+def build_prompt(llm_pipeline, question: str) -> str:
+    messages = [
+        {"role": "system", "content": "You are a helpful teaching assistant using Socratic questioning."},
+        {"role": "user", "content": question},
+    ]
+    if getattr(llm_pipeline.tokenizer, "chat_template", None):
+        return llm_pipeline.tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+    return f"<s>[INST] {messages[0]['content']}\n\n{question} [/INST]"
+
+
+def run_backend(backend: str, model: str, device: str, max_new_tokens: int, iterations: int, warmup: int):
+    # The CPU backend prefers CPU_MODEL_NAME, benchmark the model asked for instead
+    backends.CPU_MODEL_NAME = ""
+    start = time.perf_counter()
+    llm_pipeline = backends.load_pipeline(backend, model, device, os.getenv("MODEL_CACHE_DIR", "./model_cache"))
+    load_seconds = time.perf_counter() - start
+    if llm_pipeline.tokenizer.pad_token is None:
+        llm_pipeline.tokenizer.pad_token = llm_pipeline.tokenizer.eos_token
+
+    prompts = [build_prompt(llm_pipeline, question) for question in PROMPTS]
+    generation_kwargs = dict(
+        do_sample=False,
+        max_new_tokens=max_new_tokens,
+        pad_token_id=llm_pipeline.tokenizer.pad_token_id,
+        return_full_text=False
+    )
+
+    for i in range(warmup):
+        llm_pipeline(prompts[i % len(prompts)], **generation_kwargs)
+
+    latencies = []
+    generated_tokens = 0
+    for i in range(iterations):
+        prompt = prompts[i % len(prompts)]
+        start = time.perf_counter()
+        output = llm_pipeline(prompt, **generation_kwargs)
+        latencies.append(time.perf_counter() - start)
+        generated_tokens += len(llm_pipeline.tokenizer(output[0]["generated_text"], add_special_tokens=False)["input_ids"])
+
+    total = sum(latencies)
+    print(
+        f"{backends.resolve_backend(backend, device):<14} load {load_seconds:6.1f}s | "
+        f"p50 {percentile(latencies, 50) * 1000:8.0f}ms | p95 {percentile(latencies, 95) * 1000:8.0f}ms | "
+        f"{generated_tokens / total:7.1f} tokens/s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", default=["transformers", "cpu-int8"],
+                        help=f"backends to compare: auto, {', '.join(backends.BACKENDS)}")
+    parser.add_argument("--model", default="Qwen/Qwen2.5-0.5B-Instruct")
+    parser.add_argument("--device", default=os.getenv("DEVICE", "-1"), help='"0" for the first GPU, "-1" for CPU')
+    parser.add_argument("--max-new-tokens", type=int, default=64)
+    parser.add_argument("--iterations", type=int, default=8)
+    parser.add_argument("--warmup", type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"model: {args.model}  device: {args.device}  max_new_tokens: {args.max_new_tokens}  "
+          f"iterations: {args.iterations}\n")
+    for backend in args.backends:
+        run_backend(backend, args.model, args.device, args.max_new_tokens, args.iterations, args.warmup)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,31 +1,80 @@
 import httpx
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Tuple, AsyncIterator
 from datetime import datetime, timezone, UTC
 import json
-from redis import Redis
 import traceback
 import asyncio
-import requests
+import os
+from .http_clients import ServiceClients, SERVICE_TIMEOUTS
+from .llm_router import LLMRouter
+from .session_store import SessionStore, INITIAL_SESSION_TTL, SESSION_TTL
+from .test_cache import TestCache
+
+# Result persistence settings for finish_test
+PERSIST_TIMEOUT = float(os.getenv("PERSIST_TIMEOUT", "10"))
+PERSIST_RETRIES = int(os.getenv("PERSIST_RETRIES", "3"))
+PERSIST_RETRY_BACKOFF = float(os.getenv("PERSIST_RETRY_BACKOFF", "0.2"))
+# A 502 can arrive after the database service committed the write, so only
+# 503 (the request was not processed) is retried
+RETRYABLE_STATUS_CODES = {503}
+
+# Most recent earlier chat turns sent to the LLM, which trims them to its token budget
+CHAT_CONTEXT_TURNS = int(os.getenv("CHAT_CONTEXT_TURNS", "12"))
+# Time the LLM service has to start generating a reply before dropping it,
+# past the client timeout nobody is waiting for the reply anyway
+CHAT_DEADLINE_SECONDS = float(os.getenv("CHAT_DEADLINE_SECONDS", str(SERVICE_TIMEOUTS["llm"])))
+# Practice sessions fold older turns into a rolling summary once this many are unsummarized,
+# keeping the newest SUMMARY_KEEP_TURNS verbatim
+SUMMARY_ENABLED = os.getenv("SUMMARY_ENABLED", "true").strip().lower() in ("1", "true", "yes", "on")
+SUMMARY_TRIGGER_TURNS = int(os.getenv("SUMMARY_TRIGGER_TURNS", "12"))
+SUMMARY_KEEP_TURNS = int(os.getenv("SUMMARY_KEEP_TURNS", "6"))
+
+async def _iter_sse(response: httpx.Response) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    """Parse a server-sent event stream into (event, JSON data) pairs."""
+    event, data_lines = "message", []
+    async for line in response.aiter_lines():
+        if not line:
+            if data_lines:
+                yield event, json.loads("\n".join(data_lines))
+            event, data_lines = "message", []
+        elif line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data_lines.append(line[len("data:"):].strip())
+    if data_lines:
+        yield event, json.loads("\n".join(data_lines))
 
 class ConversationService:
     def __init__(
         self,
         llm_service_url: str,
         database_service_url: str,
-        redis_url: str = "redis://redis:6379"
+        redis_url: str = "redis://redis:6379",
+        service_clients: Optional[ServiceClients] = None,
+        test_cache: Optional[TestCache] = None,
+        llm_service_urls: Optional[List[str]] = None
     ):
-        """Initialize the ConversationService with service URLs and Redis connection."""
+        """Initialize the ConversationService with service URLs and Redis connection.
+        
+        With `llm_service_urls` requests are balanced over those llm-service
+        replicas instead of going to `llm_service_url`.
+        """
         self.llm_service_url = llm_service_url
         self.database_service_url = database_service_url
-        self.redis = Redis.from_url(redis_url, decode_responses=True)
+        self.clients = service_clients or ServiceClients()
+        self.llm_router = LLMRouter(llm_service_urls or [llm_service_url], self.clients)
+        self.test_cache = test_cache or TestCache(self.clients, database_service_url)
+        self.sessions = SessionStore(redis_url)
+        # Background summary updates, referenced until they finish
+        self._summary_tasks = set()
     
     def _get_session_key(self, user_id: str, test_id: str, question_id: str) -> str:
         """Generate Redis key for a specific test session."""
-        return f"test_session:{user_id}:{test_id}:{question_id}"
+        return SessionStore.session_key(user_id, test_id, question_id)
     
     def _get_test_key(self, user_id: str, test_id: str) -> str:
         """Generate Redis key for overall test data."""
-        return f"test:{user_id}:{test_id}" 
+        return SessionStore.test_key(user_id, test_id)
     
     def _ensure_timestamp(self, timestamp_value) -> str:
         """Ensure a timestamp is in ISO format string."""
@@ -49,15 +98,24 @@ class ConversationService:
         print(f"Warning: Invalid timestamp type: {type(timestamp_value)}")
         return datetime.now(UTC).isoformat()
     
-    async def start_test(self, user_id: int, test_id: int, test_code: str, list_question_ids: List[int], total_questions: int) -> Dict:
-        """Initialize a new test session."""
+    async def start_test(
+        self,
+        user_id: int,
+        test_id: int,
+        test_code: str,
+        list_question_ids: List[int],
+        total_questions: int,
+        answers: Optional[Dict[Any, str]] = None
+    ) -> Dict:
+        """Initialize a new test session.
+        
+        `answers` maps question ids to correct answers. When given it is
+        snapshotted into the session so submit_answer can grade locally.
+        """
         # Convert parameters to strings for consistent Redis keys
         user_id_str = str(user_id)
         test_id_str = str(test_id)
         
-        # Create session key
-        session_key = f"test:{user_id_str}:{test_id_str}"
-        
         # Convert question IDs to strings since the database stores them as integers
         str_question_ids = [str(qid) for qid in list_question_ids]
             
@@ -75,54 +133,99 @@ class ConversationService:
             "total_questions": total_questions,
             "total_time": 0
         }
+        if answers:
+            test_data["answer_key"] = {str(qid): answer for qid, answer in answers.items()}
     
         print(f"Initializing test session for user {user_id_str}, test {test_id_str} with {len(str_question_ids)} questions")
         
-        # Initialize session data for each question
-        for question_id in str_question_ids:
-            session_key_q = self._get_session_key(user_id_str, test_id_str, question_id)
-            if not self.redis.exists(session_key_q):
-                session_data = {
-                    "chat_history": [],
-                    "start_time": start_timestamp,
-                    "end_time": None,
-                    "hints_used": 0,
-                    "student_answer": None,
-                    "is_correct": False,
-                    "question_id": question_id,
-                    "test_id": test_id_str,
-                    "time_spent": 0
-                }
-                self.redis.setex(session_key_q, 2 * 60 * 60, json.dumps(session_data))
+        # Initialize session data for each question, keeping any that already exist
+        question_sessions = {
+            question_id: {
+                "chat_history": [],
+                "start_time": start_timestamp,
+                "end_time": None,
+                "hints_used": 0,
+                "student_answer": None,
+                "is_correct": False,
+                "question_id": question_id,
+                "test_id": test_id_str,
+                "time_spent": 0
+            }
+            for question_id in str_question_ids
+        }
         
-        # Store test data with 24 hour expiry
-        self.redis.setex(session_key, 2 * 60 * 60, json.dumps(test_data))
+        # Store test data and question sessions with 2 hour expiry in one round trip
+        await self.sessions.init_test(user_id_str, test_id_str, test_data, question_sessions, ttl=INITIAL_SESSION_TTL)
         return test_data
     
-    async def process_query(
-        self, 
-        query: str, 
+    async def _hidden_value_fast_path(self, test_id: int) -> bool:
+        """Whether the test answers hidden-value lookups without running the LLM."""
+        try:
+            test = await self.test_cache.get_by_id(test_id)
+        except Exception as e:
+            print(f"Could not load test {test_id} settings: {str(e)}")
+            return False
+        return bool(test.get("hiddenValueFastPath", False))
+
+    async def _banked_hint(
+        self,
+        query: str,
+        test_id: int,
+        question_id: int,
+        session_data: Dict[str, Any],
+        is_practice_exam: bool
+    ) -> Optional[str]:
+        """The next pregenerated hint for a hint request in a practice exam, if one is left.
+        
+        Each hint request moves one rung up the question's hint ladder; once the
+        ladder is used up the LLM answers live.
+        """
+        if not is_practice_exam or "hint" not in query.lower():
+            return None
+        try:
+            test = await self.test_cache.get_by_id(test_id)
+        except Exception as e:
+            print(f"Could not load test {test_id} hints: {str(e)}")
+            return None
+        question = next((q for q in test.get("questions", []) if str(q.get("id")) == str(question_id)), None)
+        hint_ladder = (question or {}).get("hint_ladder") or []
+        hints_used = session_data.get("hints_used", 0)
+        return hint_ladder[hints_used] if hints_used < len(hint_ladder) else None
+
+    async def _begin_turn(
+        self,
+        query: str,
         user_id: int,
         test_code: str,
         question_id: int,
         public_question: str,
         test_id: int,
-        is_practice_exam: bool = False
-    ) -> str:
-        """Process a user query and return a response."""
-        session_key = self._get_session_key(str(user_id), str(test_id), str(question_id))
-        test_key = self._get_test_key(str(user_id), str(test_id))
+        is_practice_exam: bool
+    ) -> Tuple[Dict[str, Any], bool, Dict[str, Any], Dict[str, Any]]:
+        """Load the question session and build the LLM request for a new user turn.
         
-        # Get session data
-        session_data = self.redis.get(session_key)
-        test_data = self.redis.get(test_key)
+        Returns the session data, whether the session is new, the user message
+        and the LLM request payload.
+        """
+        user_id_str = str(user_id)
+        test_id_str = str(test_id)
+        question_id_str = str(question_id)
+        
+        # Get session data with only the chat turns needed for the LLM context and
+        # the test data in one round trip, practice sessions send older turns as
+        # their summary instead
+        summarize = SUMMARY_ENABLED and is_practice_exam
+        session_data, test_data = await self.sessions.get_question_and_test(
+            user_id_str, test_id_str, question_id_str, history_limit=CHAT_CONTEXT_TURNS, after_summary=summarize
+        )
+        is_new_session = not session_data
 
         # If no session data exists, try to initialize from overall test data
         if not session_data:
             if not test_data:
                 # No test session either, initialize a new session
                 print("no session data found, initializing new session")
-                session_data = json.dumps({
+                session_data = {
                     "chat_history": [],
                     "start_time": self._ensure_timestamp(datetime.now(UTC).isoformat()),
                     "hints_used": 0,
@@ -130,16 +233,15 @@ class ConversationService:
                     "is_correct": False,
                     "question_id": question_id,
                     "test_id": test_id
-                })
+                }
             else:
-                # Initialize from test data
-                test_data_obj = json.loads(test_data)
-                if question_id not in test_data_obj.get("list_question_ids", []):
-                    test_data_obj["list_question_ids"].append(question_id)
-                    self.redis.setex(test_key, 24 * 60 * 60, json.dumps(test_data_obj))
+                # Initialize from test data, question ids are stored as strings
+                if question_id_str not in test_data.get("list_question_ids", []):
+                    test_data.setdefault("list_question_ids", []).append(question_id_str)
+                    await self.sessions.save_test(user_id_str, test_id_str, test_data, ttl=SESSION_TTL)
                 
                 # Create new session for this question
-                session_data = json.dumps({
+                session_data = {
                     "chat_history": [],
                     "start_time": self._ensure_timestamp(datetime.now(UTC).isoformat()),
                     "hints_used": 0,
@@ -147,70 +249,240 @@ class ConversationService:
                     "is_correct": False,
                     "question_id": question_id,
                     "test_id": test_id
-                })
-        
-        session_data = json.loads(session_data)
+                }
                 
         # Add user message to chat history
         print("adding user message to chat history")
-        session_data["chat_history"].append({
+        user_message = {
             "role": "user",
             "content": query,
             "timestamp": self._ensure_timestamp(datetime.now(UTC).isoformat())
-        })
+        }
+        session_data["chat_history"].append(user_message)
         print("\nchat history:", session_data["chat_history"])
         print()
         
-        # Get LLM response
-        print("making request to llm service")
-        async with httpx.AsyncClient(timeout=httpx.Timeout(120.0)) as client:
-            try:
-                response = await client.post(
-                    f"{self.llm_service_url}/generate",
-                    json={
-                        "query": query,
-                        "context": {
-                            "test_code": test_code,
-                            "test_id": test_id,
-                            "question_id": question_id,
-                            "user_id": user_id,
-                            "conversation_history": (
-                                session_data["chat_history"][-4:]
-                                if len(session_data["chat_history"]) > 4
-                                else session_data["chat_history"]
-                            ),
-                            "public_question": public_question,
-                            "isPracticeExam": is_practice_exam
-                        }
-                    }
-                )
-                response.raise_for_status()  
-                print("Request succeeded:", response.status_code)
-            except Exception as e:
-                print(f"Error in get_llm_response: {e}")
-                traceback.print_exc()
-                raise
-            if response.status_code != 200:
-                print(f"Failed to get response from LLM service: {response.text}")
-                raise ValueError(f"Failed to get response from LLM service: {response.text}")
-            
-        llm_response = response.json().get("response", "I'm sorry, I couldn't process your request.")
-        session_data["chat_history"].append({
+        payload = {
+            "query": query,
+            "context": {
+                "test_code": test_code,
+                "test_id": test_id,
+                "question_id": question_id,
+                "user_id": user_id,
+                # Earlier turns only, the current query is sent separately
+                "conversation_history": session_data["chat_history"][:-1][-CHAT_CONTEXT_TURNS:],
+                "public_question": public_question,
+                "isPracticeExam": is_practice_exam,
+                "hiddenValueFastPath": await self._hidden_value_fast_path(test_id),
+                # Time budget from now, the LLM service schedules exams ahead of practice
+                "deadline_ms": int(CHAT_DEADLINE_SECONDS * 1000)
+            }
+        }
+        if summarize and session_data.get("summary"):
+            payload["context"]["conversation_summary"] = session_data["summary"]
+        return session_data, is_new_session, user_message, payload
+    
+    async def _finish_turn(
+        self,
+        query: str,
+        user_id: int,
+        test_id: int,
+        question_id: int,
+        session_data: Dict[str, Any],
+        is_new_session: bool,
+        user_message: Dict[str, Any],
+        llm_response: str,
+        is_hidden_value_response: bool,
+        is_practice_exam: bool = False
+    ):
+        """Append the user and assistant turns to the session and update its summary when due."""
+        assistant_message = {
             "role": "assistant",
             "content": llm_response,
-            "isHiddenValueResponse": response.json().get("isHiddenValueResponse", False),
+            "isHiddenValueResponse": is_hidden_value_response,
             "timestamp": self._ensure_timestamp(datetime.now(UTC).isoformat())
-        })
+        }
+        
+        # New sessions need all their fields written, existing ones only what changed
+        updated_fields = dict(session_data) if is_new_session else {}
         
         # Increment hints used if this was a hint request
         if "hint" in query.lower():
-            session_data["hints_used"] += 1
+            updated_fields["hints_used"] = session_data.get("hints_used", 0) + 1
+        
+        # Append both turns to the chat and refresh the session (24 hour expiry)
+        await self.sessions.append_chat_messages(
+            str(user_id), str(test_id), str(question_id),
+            [user_message, assistant_message],
+            fields=updated_fields,
+            ttl=SESSION_TTL
+        )
+        
+        # The chat read was capped at CHAT_CONTEXT_TURNS, count every unsummarized turn plus the two just added
+        unsummarized_turns = session_data.get("unsummarized_turns", 0) + 2
+        if SUMMARY_ENABLED and is_practice_exam and unsummarized_turns > SUMMARY_TRIGGER_TURNS:
+            task = asyncio.create_task(self._update_summary(user_id, test_id, question_id))
+            self._summary_tasks.add(task)
+            task.add_done_callback(self._summary_tasks.discard)
+    
+    async def _update_summary(self, user_id: int, test_id: int, question_id: int):
+        """Fold the oldest unsummarized chat turns into the session's rolling summary.
+        
+        The LLM service extends the previous summary with the new turns only, so
+        each update costs the same however long the conversation has run.
+        """
+        ids = (str(user_id), str(test_id), str(question_id))
+        lock_token = await self.sessions.acquire_summary_lock(*ids)
+        if lock_token is None:
+            return
+        try:
+            summary, summarized_turns, messages = await self.sessions.get_turns_to_summarize(
+                *ids, keep=SUMMARY_KEEP_TURNS
+            )
+            if not messages:
+                return
+            async with self.llm_router.route() as attempt:
+                response = await self.clients.llm.post(
+                    f"{attempt.url}/summarize",
+                    json={
+                        "previous_summary": summary,
+                        "messages": [{"role": m.get("role"), "content": m.get("content", "")} for m in messages]
+                    }
+                )
+                attempt.status_code = response.status_code
+                response.raise_for_status()
+            await self.sessions.save_summary(*ids, response.json()["summary"], summarized_turns + len(messages))
+            print(f"Summarized {len(messages)} chat turns for question {question_id}")
+        except Exception as e:
+            # The turns stay unsummarized and are retried after the next turn
+            print(f"Error updating conversation summary: {str(e)}")
+        finally:
+            await self.sessions.release_summary_lock(*ids, lock_token)
+
+    async def process_query(
+        self, 
+        query: str, 
+        user_id: int,
+        test_code: str,
+        question_id: int,
+        public_question: str,
+        test_id: int,
+        is_practice_exam: bool = False
+    ) -> str:
+        """Process a user query and return a response."""
+        session_data, is_new_session, user_message, payload = await self._begin_turn(
+            query, user_id, test_code, question_id, public_question, test_id, is_practice_exam
+        )
         
-        # Update Redis with session data (24 hour expiry)
-        self.redis.setex(session_key, 24 * 60 * 60, json.dumps(session_data))
+        banked_hint = await self._banked_hint(query, test_id, question_id, session_data, is_practice_exam)
+        if banked_hint is not None:
+            await self._finish_turn(
+                query, user_id, test_id, question_id, session_data, is_new_session, user_message,
+                banked_hint, False, is_practice_exam
+            )
+            return banked_hint
+        
+        # Get LLM response
+        print("making request to llm service")
+        client = self.clients.llm
+        try:
+            # Turns of one question session go to the same replica while it has capacity
+            session_key = SessionStore.session_key(str(user_id), str(test_id), str(question_id))
+            async with self.llm_router.route(session_key) as attempt:
+                response = await client.post(f"{attempt.url}/generate", json=payload)
+                attempt.status_code = response.status_code
+                response.raise_for_status()  
+            print("Request succeeded:", response.status_code)
+        except Exception as e:
+            print(f"Error in get_llm_response: {e}")
+            traceback.print_exc()
+            raise
+        if response.status_code != 200:
+            print(f"Failed to get response from LLM service: {response.text}")
+            raise ValueError(f"Failed to get response from LLM service: {response.text}")
+        
+        llm_response = response.json().get("response", "I'm sorry, I couldn't process your request.")
+        await self._finish_turn(
+            query, user_id, test_id, question_id, session_data, is_new_session, user_message,
+            llm_response, response.json().get("isHiddenValueResponse", False), is_practice_exam
+        )
         
         return llm_response
     
+    async def stream_query(
+        self, 
+        query: str, 
+        user_id: int,
+        test_code: str,
+        question_id: int,
+        public_question: str,
+        test_id: int,
+        is_practice_exam: bool = False
+    ) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """Process a user query, yielding (event, data) pairs as the LLM streams its response.
+        
+        Token chunks are yielded as ("token", {"token": ...}). The turn is saved to
+        the session once the LLM sends its final response, which is then yielded
+        as ("done", {...}). Failures are yielded as ("error", {"detail": ...}) and
+        leave the session unchanged.
+        """
+        session_data, is_new_session, user_message, payload = await self._begin_turn(
+            query, user_id, test_code, question_id, public_question, test_id, is_practice_exam
+        )
+        
+        banked_hint = await self._banked_hint(query, test_id, question_id, session_data, is_practice_exam)
+        if banked_hint is not None:
+            yield "token", {"token": banked_hint}
+            await self._finish_turn(
+                query, user_id, test_id, question_id, session_data, is_new_session, user_message,
+                banked_hint, False, is_practice_exam
+            )
+            yield "done", {"response": banked_hint, "isHiddenValueResponse": False}
+            return
+        
+        print("making streaming request to llm service")
+        final = None
+        session_key = SessionStore.session_key(str(user_id), str(test_id), str(question_id))
+        try:
+            async with self.llm_router.route(session_key) as attempt, self.clients.llm.stream(
+                "POST", f"{attempt.url}/generate/stream", json=payload
+            ) as response:
+                attempt.status_code = response.status_code
+                if response.status_code != 200:
+                    await response.aread()
+                    print(f"Failed to get response from LLM service: {response.text}")
+                    error = {
+                        "detail": f"Failed to get response from LLM service: {response.text}",
+                        "status_code": response.status_code
+                    }
+                    if "Retry-After" in response.headers:
+                        error["retry_after"] = response.headers["Retry-After"]
+                    yield "error", error
+                    return
+                async for event, data in _iter_sse(response):
+                    if event == "done":
+                        final = data
+                    elif event == "error":
+                        yield "error", data
+                        return
+                    else:
+                        yield "token", data
+        except httpx.HTTPError as e:
+            print(f"Error streaming from llm service: {e}")
+            yield "error", {"detail": f"LLM service error: {str(e)}"}
+            return
+        
+        if final is None:
+            yield "error", {"detail": "LLM stream ended before the response was complete"}
+            return
+        
+        llm_response = final.get("response", "I'm sorry, I couldn't process your request.")
+        await self._finish_turn(
+            query, user_id, test_id, question_id, session_data, is_new_session, user_message,
+            llm_response, final.get("isHiddenValueResponse", False), is_practice_exam
+        )
+        yield "done", {"response": llm_response, "isHiddenValueResponse": final.get("isHiddenValueResponse", False)}
+    
     async def submit_answer(
         self,
         user_id: int,
@@ -220,91 +492,83 @@ class ConversationService:
         answer: str
     ) -> Dict:
         """Submit an answer for a question."""
-        async with httpx.AsyncClient() as client:
-            try:
-                # Convert IDs to strings for consistent handling
-                user_id_str = str(user_id)
-                question_id_str = str(question_id)
-                
-                # Get the actual question to verify the answer
-                question_response = await client.get(
+        try:
+            # Convert IDs to strings for consistent handling
+            user_id_str = str(user_id)
+            question_id_str = str(question_id)
+            
+            # Resolve test_id from the session, falling back to the test cache
+            test_id_str = await self.sessions.get_test_id(user_id_str, test_code)
+            if test_id_str is None:
+                test_id_str = str((await self.test_cache.get_by_code(test_code)).get("id"))
+            
+            # Get session and test data
+            session_data, test_data = await self.sessions.get_question_and_test(
+                user_id_str, test_id_str, question_id_str
+            )
+            
+            # Grade against the answer snapshotted at start_test, or ask the database
+            correct_answer = (test_data or {}).get("answer_key", {}).get(question_id_str)
+            if correct_answer is None:
+                question_response = await self.clients.database.get(
                     f"{self.database_service_url}/questions/{question_id}"
                 )
                 question_response.raise_for_status()
-                question_data = question_response.json()
-                correct_answer = question_data.get("answer", "").strip()
-                
-                # Test if answer is correct (simple string comparison for now)
-                # In a production system, you'd want more sophisticated answer validation
-                is_correct = answer.strip() == correct_answer
-                
-                # Get test_id from test_code
-                test_response = await client.get(
-                    f"{self.database_service_url}/tests/by-code/{test_code}"
-                )
-                test_response.raise_for_status()
-                test_data = test_response.json()
-                test_id = test_data.get("id")
-                test_id_str = str(test_id)
-                
-                # Get session and test data
-                session_key = self._get_session_key(user_id_str, test_id_str, question_id_str)
-                test_key = self._get_test_key(user_id_str, test_id_str)
-                
-                session_data_str = self.redis.get(session_key)
-                test_data_str = self.redis.get(test_key)
-                
-                
-                session_data = json.loads(session_data_str)
-                test_data = json.loads(test_data_str)
-                
-                
-                # Update session data
-                session_data["student_answer"] = answer
-                session_data["is_correct"] = is_correct
-                session_data["end_time"] = self._ensure_timestamp(datetime.now(UTC).isoformat())
-                
-                # Calculate time spent if start_time exists
-                if "start_time" in session_data:
-                    try:
-                        start = datetime.fromisoformat(session_data["start_time"].replace('Z', '+00:00'))
-                        end = datetime.fromisoformat(session_data["end_time"].replace('Z', '+00:00'))
-                        session_data["time_spent"] = int((end - start).total_seconds())
-                    except (ValueError, TypeError):
-                        session_data["time_spent"] = 0
-                
-                # Update test data
-                if question_id_str not in test_data.get("completed_questions", []):
-                    test_data.setdefault("completed_questions", []).append(question_id_str)
-                
-                # Make sure the question ID is in the list_question_ids
-                if question_id_str not in test_data.get("list_question_ids", []):
-                    test_data.setdefault("list_question_ids", []).append(question_id_str)
-                
-                # Calculate progress
-                completed_count = len(test_data.get("completed_questions", []))
-                total_count = test_data.get("total_questions", len(test_data.get("list_question_ids", [])))
-                if total_count > 0:
-                    progress = (completed_count / total_count) * 100
-                else:
-                    progress = 0
-                test_data["progress"] = progress
-                
-                # Store updated data
-                self.redis.setex(session_key, 24 * 60 * 60, json.dumps(session_data))
-                self.redis.setex(test_key, 24 * 60 * 60, json.dumps(test_data))
-                
-                return {
-                    "is_correct": is_correct,
-                    "correct_answer": correct_answer,
-                    "session_data": session_data,
-                    "progress": progress
-                }
+                correct_answer = question_response.json().get("answer", "")
+            correct_answer = correct_answer.strip()
+            
+            # Test if answer is correct (simple string comparison for now)
+            # In a production system, you'd want more sophisticated answer validation
+            is_correct = answer.strip() == correct_answer
+            
+            # Update session data
+            session_data["student_answer"] = answer
+            session_data["is_correct"] = is_correct
+            session_data["end_time"] = self._ensure_timestamp(datetime.now(UTC).isoformat())
+            
+            # Calculate time spent if start_time exists
+            if "start_time" in session_data:
+                try:
+                    start = datetime.fromisoformat(session_data["start_time"].replace('Z', '+00:00'))
+                    end = datetime.fromisoformat(session_data["end_time"].replace('Z', '+00:00'))
+                    session_data["time_spent"] = int((end - start).total_seconds())
+                except (ValueError, TypeError):
+                    session_data["time_spent"] = 0
+            
+            # Update test data
+            if question_id_str not in test_data.get("completed_questions", []):
+                test_data.setdefault("completed_questions", []).append(question_id_str)
+            
+            # Make sure the question ID is in the list_question_ids
+            if question_id_str not in test_data.get("list_question_ids", []):
+                test_data.setdefault("list_question_ids", []).append(question_id_str)
+            
+            # Calculate progress
+            completed_count = len(test_data.get("completed_questions", []))
+            total_count = test_data.get("total_questions", len(test_data.get("list_question_ids", [])))
+            if total_count > 0:
+                progress = (completed_count / total_count) * 100
+            else:
+                progress = 0
+            test_data["progress"] = progress
             
-            except Exception as e:
-                print(f"Error in submit_answer: {e}")
-                traceback.print_exc()
-                raise e
+            # Store updated data
+            await self.sessions.save_question_session(
+                user_id_str, test_id_str, question_id_str, session_data, ttl=SESSION_TTL
+            )
+            await self.sessions.save_test(user_id_str, test_id_str, test_data, ttl=SESSION_TTL)
+            
+            return {
+                "is_correct": is_correct,
+                "correct_answer": correct_answer,
+                "session_data": session_data,
+                "progress": progress
+            }
+        
+        except Exception as e:
+            print(f"Error in submit_answer: {e}")
+            traceback.print_exc()
+            raise e
     
     async def finish_test(self, user_id: str, test_id: str, request_data: Optional[Dict] = None):
         """Finish a test session by creating a test result with question results."""
@@ -312,9 +576,7 @@ class ConversationService:
             request_data = {}
 
         # Get test session
-        session_key = f"test:{user_id}:{test_id}"
-        session_data_str = self.redis.get(session_key)
-        session_data = json.loads(session_data_str) if session_data_str else {
+        session_data = await self.sessions.get_test(str(user_id), str(test_id)) or {
             "start_time": datetime.now(UTC).isoformat(),
             "list_question_ids": [],
             "test_code": request_data.get("test_code", "")
@@ -331,13 +593,10 @@ class ConversationService:
         all_questions = []
         total_time = 0
         
-        # Retrieve and process each question session
-        for question_id in list_question_ids:
-            q_session_key = self._get_session_key(str(user_id), str(test_id), str(question_id))
-            q_session_data_str = self.redis.get(q_session_key)
-            
-            if q_session_data_str:
-                q_data = json.loads(q_session_data_str)
+        # Retrieve every question session in one round trip and process them
+        question_sessions = await self.sessions.get_question_sessions(str(user_id), str(test_id), list_question_ids)
+        for q_data in question_sessions:
+            if q_data:
                 all_questions.append(q_data)
                 total_time += q_data.get('time_spent', 0)
                 if q_data.get('is_correct'):
@@ -359,40 +618,40 @@ class ConversationService:
             "end_time": test_end_time
         }
         
+        # Attach every question result and its chat so the whole result is written in one call
+        test_result_data["question_results"] = [
+            {
+                "question_id": question.get('question_id'),
+                "start_time": question.get('start_time'),
+                "end_time": question.get('end_time') or datetime.now(UTC).isoformat(),
+                "student_answer": question.get('student_answer', ''),
+                "isCorrect": question.get('is_correct', False),
+                "time_spent": question.get('time_spent', 0),
+                "chat_messages": [
+                    {
+                        "sender": "student" if message.get("role") == "user" else "ai",
+                        "content": message.get("content", ""),
+                        "timestamp": message.get("timestamp")
+                    }
+                    for message in question.get("chat_history", [])
+                ]
+            }
+            for question in all_questions
+        ]
+        
         try:
-            # Create the test result
-            test_result_response = requests.post(
-                f"{self.database_service_url}/test-results/",
-                json=test_result_data
+            # Create the test result and its question results
+            test_result_response = await self._post_with_retries(
+                f"{self.database_service_url}/test-results/bulk",
+                test_result_data
             )
-            test_result_response.raise_for_status()
             test_result = test_result_response.json()
             test_result_id = test_result.get("id")
             
-            # Process question results
-            for question in all_questions:
-                # Format timestamps
-                start_time = question.get('start_time')
-                end_time = question.get('end_time')
-                
-                question_result = {
-                    "question_id": question.get('question_id'),
-                    "start_time": start_time,
-                    "end_time": end_time or datetime.now(UTC).isoformat(),
-                    "student_answer": question.get('student_answer', ''),
-                    "isCorrect": question.get('is_correct', False),
-                    "time_spent": question.get('time_spent', 0)
-                }
-                
-                requests.post(
-                    f"{self.database_service_url}/test-results/{test_result_id}/questions/",
-                    json=question_result
-                )
-            
             # Clean up the session
-            self.redis.delete(session_key)
-            for question_id in list_question_ids:
-                self.redis.delete(self._get_session_key(str(user_id), str(test_id), str(question_id)))
+            await self.sessions.delete_test(
+                str(user_id), str(test_id), list_question_ids, test_code=test_result_data["test_code"]
+            )
             
             # Prepare complete result to return
             result = {
@@ -407,50 +666,44 @@ class ConversationService:
             
             return result
             
-        except requests.exceptions.RequestException as e:
+        except httpx.HTTPError as e:
             print(f"Error creating test result: {str(e)}")
             return {"error": f"Failed to save test result: {str(e)}"}
     
-    def get_conversation_history(
+    async def _post_with_retries(
+        self,
+        url: str,
+        payload: Dict,
+        timeout: float = PERSIST_TIMEOUT,
+        retries: int = PERSIST_RETRIES
+    ) -> httpx.Response:
+        """POST to the database service, retrying connection failures and 503 responses.
+        
+        Only failures where the request cannot have been processed are retried,
+        so a retry never writes the same result twice.
+        """
+        retries = max(0, retries)
+        for attempt in range(retries + 1):
+            try:
+                response = await self.clients.database.post(url, json=payload, timeout=timeout)
+                if response.status_code not in RETRYABLE_STATUS_CODES or attempt == retries:
+                    response.raise_for_status()
+                    return response
+                print(f"Database service returned {response.status_code} for {url}, retrying ({attempt + 1}/{retries})")
+            except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout) as e:
+                if attempt == retries:
+                    raise
+                print(f"Error posting to {url}: {str(e)}, retrying ({attempt + 1}/{retries})")
+            await asyncio.sleep(PERSIST_RETRY_BACKOFF * (2 ** attempt))
+        # The last attempt returns or raises
+        raise RuntimeError(f"No attempt made to post to {url}")
+    
+    async def get_conversation_history(
         self,
         user_id: int,
         test_code: str,
         question_index: int
     ) -> List[Dict]:
         """Get the conversation history for a specific question."""
-        session_key = self._get_session_key(str(user_id), test_code, str(question_index))
-        session_data = json.loads(self.redis.get(session_key) or "{}")
+        session_data = await self.sessions.get_question_session(str(user_id), test_code, str(question_index)) or {}
         return session_data.get("chat_history", [])
-    
-    def _save_question_result(self, test_result_id, question):
-        """Save an individual question result."""
-        try:
-            # Ensure timestamps are valid
-            start_time = self._ensure_timestamp(question.get('start_time'))
-            end_time = self._ensure_timestamp(question.get('end_time'))
-            
-            question_result = {
-                "question_id": question.get('question_id'),
-                "start_time": start_time,
-                "end_time": end_time,
-                "student_answer": question.get('student_answer', ''),
-                "isCorrect": question.get('is_correct', False),
-                "time_spent": question.get('time_spent', 0)
-            }
-            
-            print(f"Saving question result for test {test_result_id}, question {question.get('question_id')}")
-            
-            response = requests.post(
-                f"{self.database_service_url}/test-results/{test_result_id}/questions/",
-                json=question_result
-            )
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            print(f"Error saving question result: {str(e)}")
-            if hasattr(e, 'response') and hasattr(e.response, 'text'):
-                print(f"Response error detail: {e.response.text}")
-            return None
-        except Exception as e:
-            print(f"Unexpected error saving question result: {str(e)}")
-            return None 
\ No newline at end of file
@@ -0,0 +1,130 @@
+import httpx
+import os
+from typing import Dict, Any, Optional
+
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.getenv(name, str(default)))
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.getenv(name, str(default)))
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    return os.getenv(name, str(default)).strip().lower() in ("1", "true", "yes", "on")
+
+
+# Pool configuration shared by every downstream service
+HTTP_MAX_CONNECTIONS = _env_int("HTTP_MAX_CONNECTIONS", 100)
+HTTP_MAX_KEEPALIVE_CONNECTIONS = _env_int("HTTP_MAX_KEEPALIVE_CONNECTIONS", 20)
+HTTP_KEEPALIVE_EXPIRY = _env_float("HTTP_KEEPALIVE_EXPIRY", 30.0)
+HTTP_CONNECT_TIMEOUT = _env_float("HTTP_CONNECT_TIMEOUT", 5.0)
+HTTP_POOL_TIMEOUT = _env_float("HTTP_POOL_TIMEOUT", 10.0)
+HTTP2_ENABLED = _env_bool("HTTP2_ENABLED", False)
+
+# Read/write timeouts per downstream service (seconds)
+SERVICE_TIMEOUTS = {
+    "database": _env_float("DATABASE_SERVICE_TIMEOUT", 10.0),
+    "vector": _env_float("VECTOR_SERVICE_TIMEOUT", 30.0),
+    "llm": _env_float("LLM_SERVICE_TIMEOUT", 120.0),
+}
+
+
+def _http2_available() -> bool:
+    """HTTP/2 needs the optional `h2` package (pip install httpx[http2])."""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class ServiceClients:
+    """One pooled httpx.AsyncClient per downstream service.
+
+    The clients are opened by the app lifespan and shared by every request so
+    keep-alive connections to database-service, vector-service and llm-service
+    are reused instead of paying TCP setup on each call.
+    """
+
+    def __init__(
+        self,
+        timeouts: Optional[Dict[str, float]] = None,
+        max_connections: int = HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections: int = HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry: float = HTTP_KEEPALIVE_EXPIRY,
+        http2: bool = HTTP2_ENABLED
+    ):
+        self.timeouts = dict(SERVICE_TIMEOUTS, **(timeouts or {}))
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry
+        )
+        if http2 and not _http2_available():
+            print("Warning: HTTP2_ENABLED is set but the 'h2' package is not installed, falling back to HTTP/1.1")
+            http2 = False
+        self.http2 = http2
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+
+    def _create_client(self, service: str) -> httpx.AsyncClient:
+        timeout = httpx.Timeout(
+            self.timeouts[service],
+            connect=HTTP_CONNECT_TIMEOUT,
+            pool=HTTP_POOL_TIMEOUT
+        )
+        return httpx.AsyncClient(timeout=timeout, limits=self.limits, http2=self.http2)
+
+    def get(self, service: str) -> httpx.AsyncClient:
+        """Return the pooled client for a service, creating it on first use."""
+        if service not in self.timeouts:
+            raise KeyError(f"Unknown downstream service: {service}")
+        client = self._clients.get(service)
+        if client is None or client.is_closed:
+            client = self._create_client(service)
+            self._clients[service] = client
+        return client
+
+    @property
+    def database(self) -> httpx.AsyncClient:
+        return self.get("database")
+
+    @property
+    def vector(self) -> httpx.AsyncClient:
+        return self.get("vector")
+
+    @property
+    def llm(self) -> httpx.AsyncClient:
+        return self.get("llm")
+
+    async def start(self):
+        """Open a client for every configured service."""
+        for service in self.timeouts:
+            self.get(service)
+
+    async def aclose(self):
+        """Close every client and drop its pooled connections."""
+        for client in self._clients.values():
+            await client.aclose()
+        self._clients.clear()
+
+    def pool_stats(self) -> Dict[str, Any]:
+        """Report connection pool occupancy for each downstream service."""
+        stats = {}
+        for service, client in self._clients.items():
+            # httpx does not expose the pool publicly, read it from the transport
+            pool = getattr(client._transport, "_pool", None)
+            connections = list(getattr(pool, "connections", []))
+            idle = sum(1 for conn in connections if conn.is_idle())
+            stats[service] = {
+                "connections": len(connections),
+                "active": len(connections) - idle,
+                "idle": idle,
+                "max_connections": self.limits.max_connections,
+                "max_keepalive_connections": self.limits.max_keepalive_connections,
+                "timeout": self.timeouts[service],
+                "http2": self.http2,
+                "closed": client.is_closed
+            }
+        return stats
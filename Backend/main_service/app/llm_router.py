@@ -0,0 +1,228 @@
+import asyncio
+import os
+import random
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import httpx
+
+from .http_clients import ServiceClients
+
+# Comma-separated llm-service replicas, LLM_SERVICE_URL is used when unset
+LLM_SERVICE_URLS = os.getenv("LLM_SERVICE_URLS", "")
+# Consecutive failures after which a replica is taken out of rotation, and for how long
+LLM_EJECT_AFTER_FAILURES = int(os.getenv("LLM_EJECT_AFTER_FAILURES", "3"))
+LLM_EJECT_SECONDS = float(os.getenv("LLM_EJECT_SECONDS", "30"))
+# Seconds between /ready probes of every replica, 0 disables probing
+LLM_HEALTH_INTERVAL = float(os.getenv("LLM_HEALTH_INTERVAL", "10"))
+# A session stays on its replica unless that replica has this many more
+# requests in flight than the least loaded one
+LLM_AFFINITY_MAX_EXTRA = int(os.getenv("LLM_AFFINITY_MAX_EXTRA", "4"))
+LLM_AFFINITY_MAX_ENTRIES = int(os.getenv("LLM_AFFINITY_MAX_ENTRIES", "10000"))
+# Responses that count against a replica's health, 503 (busy) and 504 (deadline) do not
+UNHEALTHY_STATUS_CODES = {500, 502}
+# Recent latencies kept per replica for percentiles
+LATENCY_WINDOW = 512
+
+
+def parse_urls(urls: str) -> List[str]:
+    return [url.strip().rstrip("/") for url in urls.split(",") if url.strip()]
+
+
+class LLMReplica:
+    """One llm-service replica with its load and health counters."""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.in_flight = 0
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.ejections = 0
+        self.ejected_until = 0.0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def healthy(self, now: float) -> bool:
+        return now >= self.ejected_until
+
+    def stats(self, now: float) -> Dict[str, Any]:
+        latencies = sorted(self.latencies)
+
+        def percentile(pct: float) -> float:
+            if not latencies:
+                return 0.0
+            return latencies[min(len(latencies) - 1, round(pct / 100 * (len(latencies) - 1)))] * 1000
+
+        return {
+            "healthy": self.healthy(now),
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "failures": self.failures,
+            "ejections": self.ejections,
+            "latency_p50_ms": percentile(50),
+            "latency_p95_ms": percentile(95),
+            "latency_max_ms": latencies[-1] * 1000 if latencies else 0.0
+        }
+
+
+class RouteAttempt:
+    """A request routed to `replica`; set `status_code` once the response arrives."""
+    __slots__ = ("replica", "status_code")
+
+    def __init__(self, replica: LLMReplica):
+        self.replica = replica
+        self.status_code: Optional[int] = None
+
+    @property
+    def url(self) -> str:
+        return self.replica.url
+
+
+class LLMRouter:
+    """Spreads llm-service requests over replicas by least outstanding requests.
+
+    Each request goes to the healthy replica with the fewest requests in
+    flight. Requests carrying an affinity key (the question session) return
+    to the replica that served the key before, keeping its prompt prefix
+    cache warm, as long as that replica is not much busier than the least
+    loaded one.
+
+    A replica is ejected for `eject_seconds` after `eject_after` consecutive
+    connection or protocol errors or 500/502 responses, or as soon as a
+    /ready probe fails; a successful probe brings it back. Read timeouts do
+    not count, a long generation on a busy replica is not a failure. If every replica is ejected,
+    requests still go to the least loaded one.
+    """
+
+    def __init__(
+        self,
+        urls: List[str],
+        service_clients: ServiceClients,
+        eject_after: int = LLM_EJECT_AFTER_FAILURES,
+        eject_seconds: float = LLM_EJECT_SECONDS,
+        health_interval: float = LLM_HEALTH_INTERVAL,
+        affinity_max_extra: int = LLM_AFFINITY_MAX_EXTRA,
+        affinity_max_entries: int = LLM_AFFINITY_MAX_ENTRIES
+    ):
+        if not urls:
+            raise ValueError("At least one llm-service URL is required")
+        self.replicas = [LLMReplica(url) for url in urls]
+        self.clients = service_clients
+        self.eject_after = eject_after
+        self.eject_seconds = eject_seconds
+        self.health_interval = health_interval
+        self.affinity_max_extra = affinity_max_extra
+        self.affinity_max_entries = affinity_max_entries
+        self._affinity: "OrderedDict[str, LLMReplica]" = OrderedDict()
+        self._prober: Optional[asyncio.Task] = None
+        self.affinity_hits = 0
+        self.affinity_misses = 0
+
+    def pick(self, affinity_key: Optional[str] = None) -> LLMReplica:
+        """Choose the replica for a request."""
+        now = time.monotonic()
+        candidates = [replica for replica in self.replicas if replica.healthy(now)] or self.replicas
+        least = min(replica.in_flight for replica in candidates)
+
+        if affinity_key is not None:
+            replica = self._affinity.get(affinity_key)
+            if replica in candidates and replica.in_flight <= least + self.affinity_max_extra:
+                self._affinity.move_to_end(affinity_key)
+                self.affinity_hits += 1
+                return replica
+            self.affinity_misses += 1
+
+        # Break ties at random so idle replicas share the load
+        replica = random.choice([replica for replica in candidates if replica.in_flight == least])
+        if affinity_key is not None:
+            self._affinity[affinity_key] = replica
+            self._affinity.move_to_end(affinity_key)
+            while len(self._affinity) > self.affinity_max_entries:
+                self._affinity.popitem(last=False)
+        return replica
+
+    @asynccontextmanager
+    async def route(self, affinity_key: Optional[str] = None) -> AsyncIterator[RouteAttempt]:
+        """Route one request, tracking it as in flight on the chosen replica until the block exits."""
+        attempt = RouteAttempt(self.pick(affinity_key))
+        replica = attempt.replica
+        replica.in_flight += 1
+        replica.requests += 1
+        started = time.monotonic()
+        failed = False
+        try:
+            yield attempt
+        except (httpx.ReadTimeout, httpx.WriteTimeout, httpx.PoolTimeout):
+            # A slow generation or a full local pool is not a broken replica
+            raise
+        except httpx.TransportError:
+            failed = True
+            raise
+        finally:
+            replica.in_flight -= 1
+            replica.latencies.append(time.monotonic() - started)
+            if failed or attempt.status_code in UNHEALTHY_STATUS_CODES:
+                self._record_failure(replica)
+            else:
+                replica.consecutive_failures = 0
+
+    def _record_failure(self, replica: LLMReplica):
+        replica.failures += 1
+        replica.consecutive_failures += 1
+        if replica.consecutive_failures >= self.eject_after:
+            self._eject(replica)
+
+    def _eject(self, replica: LLMReplica):
+        if replica.healthy(time.monotonic()):
+            replica.ejections += 1
+            print(f"Ejecting llm-service replica {replica.url} for {self.eject_seconds}s")
+        replica.ejected_until = time.monotonic() + self.eject_seconds
+
+    async def check_health(self):
+        """Probe every replica's /ready once, ejecting or reinstating it."""
+        async def probe(replica: LLMReplica):
+            try:
+                response = await self.clients.llm.get(f"{replica.url}/ready", timeout=5)
+                healthy = response.status_code == 200
+            except httpx.HTTPError:
+                healthy = False
+            if healthy:
+                replica.ejected_until = 0.0
+                replica.consecutive_failures = 0
+            else:
+                self._eject(replica)
+
+        await asyncio.gather(*(probe(replica) for replica in self.replicas))
+
+    async def _probe_loop(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            try:
+                await self.check_health()
+            except Exception as e:
+                print(f"llm-service health probe failed: {e}")
+
+    async def start(self):
+        """Start periodic health probes when there is more than one replica to choose from."""
+        if self._prober is None and self.health_interval > 0 and len(self.replicas) > 1:
+            self._prober = asyncio.create_task(self._probe_loop())
+
+    async def aclose(self):
+        if self._prober is not None:
+            self._prober.cancel()
+            try:
+                await self._prober
+            except asyncio.CancelledError:
+                pass
+            self._prober = None
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        lookups = self.affinity_hits + self.affinity_misses
+        return {
+            "replicas": {replica.url: replica.stats(now) for replica in self.replicas},
+            "affinity_entries": len(self._affinity),
+            "affinity_hit_rate": self.affinity_hits / lookups if lookups else 0.0
+        }
@@ -5,10 +5,16 @@ import httpx
 import os
 from datetime import datetime
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+from contextlib import asynccontextmanager
+from collections import OrderedDict
+import asyncio
 from .conversation_service import ConversationService
+from .http_clients import ServiceClients
+from .llm_router import LLM_SERVICE_URLS, parse_urls
+from .test_cache import TestCache, TEST_CACHE_USE_REDIS
 from dotenv import load_dotenv
 import json
-import requests
 
 load_dotenv()
 
@@ -16,9 +22,28 @@ load_dotenv()
 DATABASE_SERVICE_URL = os.getenv("DATABASE_SERVICE_URL", "http://database-service:8001")
 VECTOR_SERVICE_URL = os.getenv("VECTOR_SERVICE_URL", "http://vector-service:8002")
 LLM_SERVICE_URL = os.getenv("LLM_SERVICE_URL", "http://llm-service:8003")
+# Pregenerate a hint ladder for every question of new practice exams
+HINT_BANK_ENABLED = os.getenv("HINT_BANK_ENABLED", "true").strip().lower() in ("1", "true", "yes", "on")
+# Generating hints for a whole test can take longer than a chat reply
+HINT_BANK_TIMEOUT = float(os.getenv("HINT_BANK_TIMEOUT", "600"))
 REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379")
 
-app = FastAPI(title="Socratic Main Service")
+# Pooled HTTP clients shared by every endpoint and the conversation service
+service_clients = ServiceClients()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open the downstream connection pools on startup and drain them on shutdown."""
+    await service_clients.start()
+    await test_cache.start()
+    await convo_service.llm_router.start()
+    yield
+    await convo_service.llm_router.aclose()
+    await test_cache.aclose()
+    await service_clients.aclose()
+    await convo_service.sessions.aclose()
+
+app = FastAPI(title="Socratic Main Service", lifespan=lifespan)
 
 # Update CORS middleware to support both local development and containerized environments
 app.add_middleware(
@@ -104,6 +129,8 @@ class TestCreate(BaseModel):
     name: str
     code: str
     isPracticeExam: bool = False
+    # Answer hidden-value lookups from a template instead of the LLM
+    hiddenValueFastPath: bool = False
     questions: List[Question]
 
 class TestResponse(BaseModel): # questions now contain 'id' field as well
@@ -111,7 +138,10 @@ class TestResponse(BaseModel): # questions now contain 'id' field as well
     test_name: str
     code: str
     isPracticeExam: bool = False
+    hiddenValueFastPath: bool = False
     questions: List[Dict[str, Any]]
+    ingestion: Optional[Dict[str, Any]] = None
+    hint_bank: Optional[Dict[str, Any]] = None
 
 class AnswerSubmission(BaseModel):
     user_id: int
@@ -132,86 +162,104 @@ class TestSessionStart(BaseModel):
     question_ids: List[int]
     total_questions: int
 
+# Vector ingestion status of recently created tests, keyed by test code
+MAX_INGESTION_JOBS = 256
+ingestion_jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+# Hint bank generation status of recent tests, keyed by test code, tracked apart from ingestion
+MAX_HINT_JOBS = int(os.getenv("MAX_HINT_JOBS", "256"))
+hint_jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+# Keep references to fire-and-forget tasks so they are not garbage collected
+background_tasks = set()
+
 # Initialize services
+test_cache = TestCache(
+    service_clients,
+    DATABASE_SERVICE_URL,
+    redis_url=REDIS_URL if TEST_CACHE_USE_REDIS else None
+)
+
 convo_service = ConversationService(
     llm_service_url=LLM_SERVICE_URL,
     database_service_url=DATABASE_SERVICE_URL,
-    redis_url=REDIS_URL
+    redis_url=REDIS_URL,
+    service_clients=service_clients,
+    test_cache=test_cache,
+    llm_service_urls=parse_urls(LLM_SERVICE_URLS)
 )
 
 # Authentication endpoints
 @app.post("/api/auth/student/register")
 async def register_student(student: StudentCreate):
     """Register a new student through the API Gateway pattern."""
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.post(
-                f"{DATABASE_SERVICE_URL}/auth/student/register",
-                json=student.model_dump()
-            )
-            response.raise_for_status()  # Raise exception for HTTP error responses
-            return response.json()
-        except httpx.HTTPStatusError as e:
-            # Forward the exact error from the database service
-            error_detail = e.response.json().get("detail", str(e))
-            status_code = e.response.status_code
-            raise HTTPException(status_code=status_code, detail=error_detail)
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Registration error: {str(e)}")
+    client = service_clients.database
+    try:
+        response = await client.post(
+            f"{DATABASE_SERVICE_URL}/auth/student/register",
+            json=student.model_dump()
+        )
+        response.raise_for_status()  # Raise exception for HTTP error responses
+        return response.json()
+    except httpx.HTTPStatusError as e:
+        # Forward the exact error from the database service
+        error_detail = e.response.json().get("detail", str(e))
+        status_code = e.response.status_code
+        raise HTTPException(status_code=status_code, detail=error_detail)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Registration error: {str(e)}")
 
 @app.post("/api/auth/teacher/register")
 async def register_teacher(teacher: TeacherCreate):
     """Register a new teacher through the API Gateway pattern."""
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.post(
-                f"{DATABASE_SERVICE_URL}/auth/teacher/register",
-                json=teacher.model_dump()
-            )
-            response.raise_for_status()
-            return response.json()
-        except httpx.HTTPStatusError as e:
-            error_detail = e.response.json().get("detail", str(e))
-            status_code = e.response.status_code
-            raise HTTPException(status_code=status_code, detail=error_detail)
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Registration error: {str(e)}")
+    client = service_clients.database
+    try:
+        response = await client.post(
+            f"{DATABASE_SERVICE_URL}/auth/teacher/register",
+            json=teacher.model_dump()
+        )
+        response.raise_for_status()
+        return response.json()
+    except httpx.HTTPStatusError as e:
+        error_detail = e.response.json().get("detail", str(e))
+        status_code = e.response.status_code
+        raise HTTPException(status_code=status_code, detail=error_detail)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Registration error: {str(e)}")
 
 @app.post("/api/auth/login", response_model=TokenResponse)
 async def login(login_data: UserLogin):
     """Login through the API Gateway pattern."""
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.post(
-                f"{DATABASE_SERVICE_URL}/auth/login",
-                json=login_data.model_dump()
-            )
-            response.raise_for_status()
-            return response.json()
-        except httpx.HTTPStatusError as e:
-            error_detail = e.response.json().get("detail", str(e))
-            status_code = e.response.status_code
-            raise HTTPException(status_code=status_code, detail=error_detail)
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Login error: {str(e)}")
+    client = service_clients.database
+    try:
+        response = await client.post(
+            f"{DATABASE_SERVICE_URL}/auth/login",
+            json=login_data.model_dump()
+        )
+        response.raise_for_status()
+        return response.json()
+    except httpx.HTTPStatusError as e:
+        error_detail = e.response.json().get("detail", str(e))
+        status_code = e.response.status_code
+        raise HTTPException(status_code=status_code, detail=error_detail)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Login error: {str(e)}")
 
 @app.post("/api/auth/refresh", response_model=TokenResponse)
 async def refresh_token(refresh: RefreshToken):
     """Refresh authentication token through the API Gateway pattern."""
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.post(
-                f"{DATABASE_SERVICE_URL}/auth/refresh",
-                json=refresh.model_dump()
-            )
-            response.raise_for_status()
-            return response.json()
-        except httpx.HTTPStatusError as e:
-            error_detail = e.response.json().get("detail", str(e))
-            status_code = e.response.status_code
-            raise HTTPException(status_code=status_code, detail=error_detail)
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Token refresh error: {str(e)}")
+    client = service_clients.database
+    try:
+        response = await client.post(
+            f"{DATABASE_SERVICE_URL}/auth/refresh",
+            json=refresh.model_dump()
+        )
+        response.raise_for_status()
+        return response.json()
+    except httpx.HTTPStatusError as e:
+        error_detail = e.response.json().get("detail", str(e))
+        status_code = e.response.status_code
+        raise HTTPException(status_code=status_code, detail=error_detail)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Token refresh error: {str(e)}")
 
 @app.get("/api/auth/student/me")
 async def get_student_profile(request: Request):
@@ -220,20 +268,20 @@ async def get_student_profile(request: Request):
     if not authorization:
         raise HTTPException(status_code=401, detail="Authorization header is required")
     
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(
-                f"{DATABASE_SERVICE_URL}/auth/student/me",
-                headers={"Authorization": authorization}
-            )
-            response.raise_for_status()
-            return response.json()
-        except httpx.HTTPStatusError as e:
-            error_detail = e.response.json().get("detail", str(e))
-            status_code = e.response.status_code
-            raise HTTPException(status_code=status_code, detail=error_detail)
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Profile error: {str(e)}")
+    client = service_clients.database
+    try:
+        response = await client.get(
+            f"{DATABASE_SERVICE_URL}/auth/student/me",
+            headers={"Authorization": authorization}
+        )
+        response.raise_for_status()
+        return response.json()
+    except httpx.HTTPStatusError as e:
+        error_detail = e.response.json().get("detail", str(e))
+        status_code = e.response.status_code
+        raise HTTPException(status_code=status_code, detail=error_detail)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Profile error: {str(e)}")
 
 @app.get("/api/auth/teacher/me")
 async def get_teacher_profile(request: Request):
@@ -242,26 +290,35 @@ async def get_teacher_profile(request: Request):
     if not authorization:
         raise HTTPException(status_code=401, detail="Authorization header is required")
     
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(
-                f"{DATABASE_SERVICE_URL}/auth/teacher/me",
-                headers={"Authorization": authorization}
-            )
-            response.raise_for_status()
-            return response.json()
-        except httpx.HTTPStatusError as e:
-            error_detail = e.response.json().get("detail", str(e))
-            status_code = e.response.status_code
-            raise HTTPException(status_code=status_code, detail=error_detail)
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Profile error: {str(e)}")
+    client = service_clients.database
+    try:
+        response = await client.get(
+            f"{DATABASE_SERVICE_URL}/auth/teacher/me",
+            headers={"Authorization": authorization}
+        )
+        response.raise_for_status()
+        return response.json()
+    except httpx.HTTPStatusError as e:
+        error_detail = e.response.json().get("detail", str(e))
+        status_code = e.response.status_code
+        raise HTTPException(status_code=status_code, detail=error_detail)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Profile error: {str(e)}")
 
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
     return {"status": "healthy"}
 
+@app.get("/stats")
+async def get_stats():
+    """Report gateway runtime statistics such as connection pool occupancy."""
+    return {
+        "http_pools": service_clients.pool_stats(),
+        "test_cache": test_cache.stats(),
+        "llm_replicas": convo_service.llm_router.stats()
+    }
+
 @app.post("/chat")
 async def chat(query: ChatQuery):
     """Process a chat query"""
@@ -278,129 +335,251 @@ async def chat(query: ChatQuery):
         )
         print("main service response\n:", response)
         return {"response": response}
+    except httpx.HTTPStatusError as e:
+        # Pass LLM overload through so clients can back off
+        if e.response.status_code == 503:
+            headers = {"Retry-After": e.response.headers["Retry-After"]} if "Retry-After" in e.response.headers else None
+            raise HTTPException(status_code=503, detail="The tutor is busy, please try again shortly", headers=headers)
+        if e.response.status_code == 504:
+            raise HTTPException(status_code=504, detail="The tutor took too long to respond, please try again")
+        raise HTTPException(status_code=500, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
+@app.post("/chat/stream")
+async def chat_stream(query: ChatQuery):
+    """Process a chat query, relaying the response as server-sent events while it is generated.
+    
+    Sends a `data` event per token chunk, then a `done` event with the full
+    response once it has been saved to the session, or an `error` event.
+    """
+    print("streaming chat query recieved in the backend", query)
+    
+    async def events():
+        try:
+            async for event, data in convo_service.stream_query(
+                query.query, 
+                query.user_id, 
+                query.test_code, 
+                query.question_id,
+                query.public_question,
+                query.test_id,
+                query.isPracticeExam
+            ):
+                prefix = "" if event == "token" else f"event: {event}\n"
+                yield f"{prefix}data: {json.dumps(data)}\n\n"
+        except Exception as e:
+            print(f"Error streaming chat response: {str(e)}")
+            yield f"event: error\ndata: {json.dumps({'detail': str(e)})}\n\n"
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+    
 @app.post("/store-teaching-material")
 async def store_teaching_material(teaching_material: TeachingMaterial):
     """Store a teaching material in the vector database."""
-    async with httpx.AsyncClient() as client:
-        try:
-            await client.post(
-                f"{VECTOR_SERVICE_URL}/store_teaching_material",
+    client = service_clients.vector
+    try:
+        await client.post(
+            f"{VECTOR_SERVICE_URL}/store_teaching_material",
+            json={
+                "topic": teaching_material.topic,
+                "subject": teaching_material.subject,
+                "source": teaching_material.source,
+                "content": teaching_material.content
+            }
+        )
+        return {"message": "Teaching material stored successfully"}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def ingest_test_vectors(
+    status: Dict[str, Any],
+    test_code: str,
+    test_id: int,
+    questions: List[Dict[str, Any]]
+) -> Dict[str, Any]:
+    """Store every problem of a test and its hidden values in the vector service with one call.
+    
+    Progress and errors are recorded in `status`.
+    """
+    payload = {
+        "problems": [
+            {
+                "problem_id": f"{test_id}_{question['id']}",
+                "public_question": question["public_question"],
+                "metadata": {
+                    "test_code": test_code,
+                    "question_id": question["id"],
+                    "answer": question["answer"],
+                    "subject": question.get("subject"),
+                    "topic": question.get("topic"),
+                    "hidden_values": question.get("hidden_values") or {}
+                },
+                "hidden_values": [
+                    f"{name} = {value}" for name, value in (question.get("hidden_values") or {}).items()
+                ]
+            }
+            for question in questions
+        ]
+    }
+    try:
+        response = await service_clients.vector.post(f"{VECTOR_SERVICE_URL}/problems/batch", json=payload)
+        response.raise_for_status()
+        result = response.json()
+        status.update(result)
+        status["status"] = "partial" if result.get("errors") else "completed"
+    except Exception as e:
+        print(f"Error ingesting test {test_code} into vector service: {str(e)}")
+        status["status"] = "failed"
+        status["errors"] = [str(e)]
+    status["finished_at"] = datetime.now().isoformat()
+    return status
+
+async def generate_hint_bank(
+    status: Dict[str, Any],
+    test_code: str,
+    test_id: int,
+    questions: List[Dict[str, Any]]
+) -> Dict[str, Any]:
+    """Generate a hint ladder for every question of a test with one batched LLM call and store them.
+    
+    Progress and errors are recorded in `status`.
+    """
+    status["status"] = "running"
+    try:
+        async with convo_service.llm_router.route() as attempt:
+            response = await service_clients.llm.post(
+                f"{attempt.url}/hints",
                 json={
-                    "topic": teaching_material.topic,
-                    "subject": teaching_material.subject,
-                    "source": teaching_material.source,
-                    "content": teaching_material.content
-                }
+                    "questions": [
+                        {
+                            "question_id": question["id"],
+                            "public_question": question["public_question"],
+                            "teacher_instructions": question.get("teacher_instructions")
+                        }
+                        for question in questions
+                    ]
+                },
+                timeout=HINT_BANK_TIMEOUT
             )
-            return {"message": "Teaching material stored successfully"}
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=str(e))
+            attempt.status_code = response.status_code
+            response.raise_for_status()
+        hint_ladders = response.json()["hint_ladders"]
+        
+        store_response = await service_clients.database.put(
+            f"{DATABASE_SERVICE_URL}/questions/hint-ladders",
+            json={"hint_ladders": hint_ladders}
+        )
+        store_response.raise_for_status()
+        # Sessions read the ladders from the cached test
+        await test_cache.invalidate(code=test_code, test_id=test_id)
+        status["questions"] = len(hint_ladders)
+        status["status"] = "completed"
+    except Exception as e:
+        print(f"Error generating hint bank for test {test_code}: {str(e)}")
+        status["status"] = "failed"
+        status["errors"] = [str(e)]
+    status["finished_at"] = datetime.now().isoformat()
+    return status
+
+def start_hint_bank(test_code: str, test_id: int, questions: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Run generate_hint_bank in the background and return its status."""
+    status = {"test_id": test_id, "status": "pending", "errors": []}
+    hint_jobs[test_code] = status
+    while len(hint_jobs) > MAX_HINT_JOBS:
+        hint_jobs.popitem(last=False)
+    task = asyncio.create_task(generate_hint_bank(status, test_code, test_id, questions))
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return status
 
 @app.post("/tests", response_model=TestResponse)
-async def create_test(test: TestCreate):
-    """Create a new test with questions and store embeddings."""
-    print("hello world")
-    print(test)
-    async with httpx.AsyncClient() as client:
-        try:
-            # 1. Create test in database
-            test_base = {
+async def create_test(test: TestCreate, wait_for_ingestion: bool = False):
+    """Create a new test with questions and store embeddings.
+    
+    The test, its questions and their links are written by database-service in
+    one transaction. Vector ingestion is one batched call that runs in the
+    background unless `wait_for_ingestion` is set; its status is returned in
+    `ingestion` and from GET /tests/{code}/ingestion. Practice exams also get
+    a hint bank generated in the background, see GET /tests/{code}/hints.
+    """
+    print(f"Creating test {test.code} with {len(test.questions)} questions")
+    try:
+        # 1. Create test, questions and test-question links in database
+        test_response = await service_clients.database.post(
+            f"{DATABASE_SERVICE_URL}/tests/bulk",
+            json={
                 "test_name": test.name,
                 "code": test.code,
-                "isPracticeExam": test.isPracticeExam
+                "isPracticeExam": test.isPracticeExam,
+                "hiddenValueFastPath": test.hiddenValueFastPath,
+                "questions": [question.model_dump() for question in test.questions]
             }
-            
-            test_response = await client.post(
-                f"{DATABASE_SERVICE_URL}/tests",
-                json=test_base
-            )
-            test_response.raise_for_status()
-            test_data = test_response.json()
-            test_id = test_data["id"]
-            
-            # 2. Create questions and store embeddings
-            questions = []
-            for idx, question in enumerate(test.questions):
-                # Create question in database
-                print("storing a test question in database", question.public_question)
-                question_response = await client.post(
-                    f"{DATABASE_SERVICE_URL}/create-question",
-                    json={
-                        "public_question": question.public_question,
-                        "hidden_values": question.hidden_values,
-                        "answer": question.answer,
-                        "formula": question.formula,
-                        "teacher_instructions": question.teacher_instructions,
-                        "hint_level": question.hint_level,
-                        "subject": question.subject,
-                        "topic": question.topic
-                    }
-                )
-                question_response.raise_for_status()
-                question_data = question_response.json()
-                question_id = question_data["id"]
-                
-                # Create test-question relationship
-                print("storing a test-question relationship in database", test_id, question_id)
-                await client.post(
-                    f"{DATABASE_SERVICE_URL}/test-questions",
-                    json={
-                        "test_id": test_id,
-                        "question_id": question_id,
-                        "position": idx
-                    }
-                )
-                
-                # Store entire problem in vector service
-                print("storing an entire problem in vector service", question.public_question)
-                await client.post(
-                    f"{VECTOR_SERVICE_URL}/problems/",
-                    json={
-                        "problem_id": f"{test_id}_{question_id}",
-                        "public_question": question.public_question,
-                        "metadata": {
-                            "test_code": test.code,
-                            "question_id": question_id,
-                            "answer": question.answer,
-                            "subject": question.subject,
-                            "topic": question.topic,
-                            "hidden_values": question.hidden_values
-                        }
-                    }
-                )
-
-                # store individual hidden values in vector service
-                for hidden_value in question.hidden_values:
-                    print("storing one hidden value in vector service as a document", hidden_value, question.hidden_values[hidden_value])
-                    await client.post(
-                        f"{VECTOR_SERVICE_URL}/store_hidden_value",
-                        json={
-                            "problem_id": f"{test_id}_{question_id}",
-                            "hidden_value": f"{hidden_value} = {question.hidden_values[hidden_value]}"
-                        }
-                    )
-                
-                questions.append(question_data)
-            
-            # 3. Get complete test with questions
-            complete_test = await client.get(
-                f"{DATABASE_SERVICE_URL}/tests/{test_id}"
-            )
-            complete_test.raise_for_status()
-            test_data = complete_test.json()
-            
-            # Add questions to response
-            test_data["questions"] = questions
-            
-            return test_data
-            
-        except httpx.HTTPError as e:
-            raise HTTPException(status_code=500, detail=f"Service error: {str(e)}")
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Internal error: {str(e)}")
+        )
+        test_response.raise_for_status()
+        test_data = test_response.json()
+        test_id = test_data["id"]
+        
+        # Drop any cached copy of a test previously stored under this code
+        await test_cache.invalidate(code=test.code, test_id=test_id)
+        
+        # 2. Store problems and hidden values in the vector service
+        status = {"test_id": test_id, "status": "pending", "errors": []}
+        ingestion_jobs[test.code] = status
+        while len(ingestion_jobs) > MAX_INGESTION_JOBS:
+            ingestion_jobs.popitem(last=False)
+        if wait_for_ingestion:
+            await ingest_test_vectors(status, test.code, test_id, test_data["questions"])
+        else:
+            task = asyncio.create_task(ingest_test_vectors(status, test.code, test_id, test_data["questions"]))
+            background_tasks.add(task)
+            task.add_done_callback(background_tasks.discard)
+        
+        test_data["ingestion"] = dict(status)
+        
+        # 3. Pregenerate hints for practice exams
+        if HINT_BANK_ENABLED and test.isPracticeExam and test_data["questions"]:
+            test_data["hint_bank"] = dict(start_hint_bank(test.code, test_id, test_data["questions"]))
+        return test_data
+        
+    except httpx.HTTPStatusError as e:
+        error_detail = e.response.json().get("detail", str(e))
+        raise HTTPException(status_code=e.response.status_code, detail=error_detail)
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=500, detail=f"Service error: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal error: {str(e)}")
+
+@app.get("/tests/{code}/ingestion")
+async def get_test_ingestion(code: str):
+    """Report the vector ingestion status of a test created by this gateway."""
+    if code not in ingestion_jobs:
+        raise HTTPException(status_code=404, detail="No ingestion job found for this test")
+    return ingestion_jobs[code]
+        
+@app.post("/tests/{code}/hints")
+async def create_test_hints(code: str):
+    """(Re)generate the hint bank of a test in the background."""
+    if hint_jobs.get(code, {}).get("status") in ("pending", "running"):
+        return hint_jobs[code]
+    try:
+        test = await test_cache.get_by_code(code)
+    except httpx.HTTPStatusError as e:
+        raise HTTPException(status_code=e.response.status_code, detail=e.response.json().get("detail", str(e)))
+    if not test.get("questions"):
+        raise HTTPException(status_code=400, detail="Test has no questions")
+    return dict(start_hint_bank(code, test["id"], test["questions"]))
+
+@app.get("/tests/{code}/hints")
+async def get_test_hints(code: str):
+    """Report the hint bank generation status of a test."""
+    if code not in hint_jobs:
+        raise HTTPException(status_code=404, detail="No hint bank job found for this test")
+    return hint_jobs[code]
         
 @app.post("/submit-answer")
 async def submit_answer(submission: AnswerSubmission):
@@ -435,11 +614,8 @@ async def finish_test(request: TestFinishRequest):
         
         # Get test ID from test code if not provided
         if not request.test_id:
-            async with httpx.AsyncClient() as client:
-                test_response = await client.get(f"{DATABASE_SERVICE_URL}/tests/by-code/{request.test_code}")
-                test_response.raise_for_status()
-                test_data = test_response.json()
-                test_id = test_data["id"]
+            test_data = await test_cache.get_by_code(request.test_code)
+            test_id = test_data["id"]
         else:
             test_id = request.test_id
             
@@ -476,109 +652,129 @@ async def finish_test(request: TestFinishRequest):
         print(f"Error finishing test: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/tests/{code}", response_model=TestResponse)
+def student_question(question: Dict[str, Any]) -> Dict[str, Any]:
+    """A question as sent to students, without the hint bank that is revealed one hint at a time in chat."""
+    return {field: value for field, value in question.items() if field != "hint_ladder"}
+
+@app.get("/tests/{code}", response_model=TestResponse, response_model_exclude={"hint_bank"})
 async def get_test(code: str, user_id: Optional[str] = None):
     """Get a test by its code and initialize a test session if user_id is provided."""
-    async with httpx.AsyncClient() as client:
-        try:
-            # Get test from database - now includes questions
-            test_response = await client.get(f"{DATABASE_SERVICE_URL}/tests/by-code/{code}")
-            test_response.raise_for_status()
-            test = test_response.json()
-            
-            if not test:
-                raise HTTPException(status_code=404, detail="Test not found")
-            
-            # Initialize test session in Redis if user_id is provided
-            if user_id:
-                try:
-                    # Extract question IDs
-                    question_ids = [q["id"] for q in test["questions"]]
-                    
-                    # Log the initialization attempt
-                    print(f"Starting test session for user_id: {user_id}, test_id: {test['id']}, with {len(question_ids)} questions")
-                    
-                    # Start test session
-                    await convo_service.start_test(
-                        user_id=user_id,
-                        test_id=test["id"],
-                        test_code=code,
-                        list_question_ids=question_ids,
-                        total_questions=len(question_ids)
-                    )
-                    print(f"Test session initialized successfully")
-                except Exception as e:
-                    print(f"Error initializing test session: {str(e)}")
-                    # Continue even if session initialization fails - the test can still be rendered
-            
-            return test
-            
-        except httpx.HTTPException as e:
-            raise HTTPException(status_code=e.response.status_code, detail=f"Service error: {str(e)}")
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Internal error: {str(e)}")
+    try:
+        # Get test (with questions) from the cache or the database
+        test = await test_cache.get_by_code(code)
+        
+        if not test:
+            raise HTTPException(status_code=404, detail="Test not found")
+        
+        # Initialize test session in Redis if user_id is provided
+        if user_id:
+            try:
+                # Extract question IDs
+                question_ids = [q["id"] for q in test["questions"]]
+                
+                # Log the initialization attempt
+                print(f"Starting test session for user_id: {user_id}, test_id: {test['id']}, with {len(question_ids)} questions")
+                
+                # Start test session
+                await convo_service.start_test(
+                    user_id=user_id,
+                    test_id=test["id"],
+                    test_code=code,
+                    list_question_ids=question_ids,
+                    total_questions=len(question_ids),
+                    answers={q["id"]: q["answer"] for q in test["questions"]}
+                )
+                print(f"Test session initialized successfully")
+            except Exception as e:
+                print(f"Error initializing test session: {str(e)}")
+                # Continue even if session initialization fails - the test can still be rendered
+        
+        return {**test, "questions": [student_question(question) for question in test["questions"]]}
+        
+    except httpx.HTTPStatusError as e:
+        raise HTTPException(status_code=e.response.status_code, detail=f"Service error: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal error: {str(e)}")
 
 @app.get("/tests/{code}/questions/{index}")
 async def get_question(code: str, index: int):
     """Get a question from a test."""
-    async with httpx.AsyncClient() as client:
-        try:
-            # Get test with questions already included
-            test_response = await client.get(f"{DATABASE_SERVICE_URL}/tests/by-code/{code}")
-            test_response.raise_for_status()
-            test = test_response.json()
-            
-            if not test:
-                raise HTTPException(status_code=404, detail="Test not found")
-            
-            # Get questions from the test response
-            questions = test["questions"]
-            
-            # Get specific question
-            if index < 0 or index >= len(questions):
-                raise HTTPException(status_code=404, detail="Question not found")
-            
-            return questions[index]
-            
-        except httpx.HTTPError as e:
-            raise HTTPException(status_code=500, detail=f"Service error: {str(e)}")
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Internal error: {str(e)}")
+    try:
+        # Get test with questions already included
+        test = await test_cache.get_by_code(code)
+        
+        if not test:
+            raise HTTPException(status_code=404, detail="Test not found")
+        
+        # Get questions from the test response
+        questions = test["questions"]
+        
+        # Get specific question
+        if index < 0 or index >= len(questions):
+            raise HTTPException(status_code=404, detail="Question not found")
+        
+        return student_question(questions[index])
+        
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=500, detail=f"Service error: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal error: {str(e)}")
+
+def _question_id_from_search_result(result: Dict[str, Any]) -> Optional[int]:
+    """Extract the database question id from a vector search hit.
+    
+    Problems are stored as "{test_id}_{question_id}"; older entries may carry
+    the question id in their metadata instead.
+    """
+    question_id = (result.get("metadata") or {}).get("question_id")
+    if question_id is None:
+        question_id = str(result.get("id", "")).rsplit("_", 1)[-1]
+    try:
+        return int(question_id)
+    except (TypeError, ValueError):
+        return None
 
 @app.post("/similar-questions")
 async def find_similar_questions(query: str, n_results: int = 5):
     """Find similar questions using vector similarity search."""
-    async with httpx.AsyncClient() as client:
-        try:
-            # Search vector service
-            search_response = await client.post(
-                f"{VECTOR_SERVICE_URL}/search",
-                json={"query": query, "n_results": n_results}
-            )
-            search_response.raise_for_status()
-            results = search_response.json()
-            
-            # Get full question details from database
-            detailed_results = []
-            for result in results:
-                question_id = result["metadata"]["question_id"]
-                question_response = await client.get(
-                    f"{DATABASE_SERVICE_URL}/questions/{question_id}"
-                )
-                question_response.raise_for_status()
-                question_data = question_response.json()
-                
-                detailed_results.append({
-                    **question_data,
-                    "similarity_score": 1 - result["distance"]  # Convert distance to similarity
-                })
-            
-            return detailed_results
-            
-        except httpx.HTTPError as e:
-            raise HTTPException(status_code=500, detail=f"Service error: {str(e)}")
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Internal error: {str(e)}")
+    client = service_clients.database
+    try:
+        # Search vector service
+        search_response = await service_clients.vector.post(
+            f"{VECTOR_SERVICE_URL}/search",
+            params={"query": query, "n_results": n_results}
+        )
+        search_response.raise_for_status()
+        results = search_response.json()
+        
+        # The same question can be stored under several tests, keep its best hit
+        scores = {}
+        for result in results:
+            question_id = _question_id_from_search_result(result)
+            if question_id is not None and question_id not in scores:
+                scores[question_id] = result["similarity_score"]
+        if not scores:
+            return []
+        
+        # Get full question details from database in one request
+        questions_response = await client.get(
+            f"{DATABASE_SERVICE_URL}/questions",
+            params={"ids": ",".join(str(question_id) for question_id in scores)}
+        )
+        questions_response.raise_for_status()
+        questions = {question["id"]: question for question in questions_response.json()}
+        
+        # Keep the similarity order of the search results
+        return [
+            {**questions[question_id], "similarity_score": score}
+            for question_id, score in scores.items()
+            if question_id in questions
+        ]
+        
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=500, detail=f"Service error: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal error: {str(e)}")
 
 @app.post("/start-test")
 async def start_test(request: TestSessionStart):
@@ -594,8 +790,7 @@ async def start_test(request: TestSessionStart):
         result["total_questions"] = request.total_questions
         
         # Update Redis with the modified test data
-        test_key = convo_service._get_test_key(request.user_id, request.test_id)
-        convo_service.redis.setex(test_key, 24 * 60 * 60, json.dumps(result))
+        await convo_service.sessions.save_test(str(request.user_id), str(request.test_id), result)
         
         return result
     except Exception as e:
@@ -0,0 +1,449 @@
+from redis.asyncio import Redis, BlockingConnectionPool
+from typing import Dict, Any, Optional, List, Iterable, Tuple
+import json
+import os
+import secrets
+
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "50"))
+REDIS_POOL_TIMEOUT = float(os.getenv("REDIS_POOL_TIMEOUT", "5"))
+
+# TTL applied when a test session is first created
+INITIAL_SESSION_TTL = 2 * 60 * 60
+# TTL applied whenever a session is updated during the test
+SESSION_TTL = 24 * 60 * 60
+# Seconds a conversation summary update may hold its lock
+SUMMARY_LOCK_TTL = 60
+
+# Creates each question session hash only if it does not exist yet.
+# ARGV: ttl, then for every key a field count followed by field/value pairs.
+INIT_SESSIONS_SCRIPT = """
+local ttl = ARGV[1]
+local pos = 2
+local created = 0
+for _, key in ipairs(KEYS) do
+    local n = tonumber(ARGV[pos])
+    pos = pos + 1
+    if redis.call('EXISTS', key) == 0 then
+        redis.call('HSET', key, unpack(ARGV, pos, pos + n - 1))
+        redis.call('EXPIRE', key, ttl)
+        created = created + 1
+    end
+    pos = pos + n
+end
+return created
+"""
+
+# Deletes a lock only while it still holds the caller's token.
+# KEYS: lock key. ARGV: token.
+RELEASE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+# Moves a question session from its legacy JSON string into the hash and chat
+# list, keeping the legacy key's expiry. Skipped if the hash already exists or
+# the string changed since it was read.
+# KEYS: legacy key, session hash, chat list.
+# ARGV: legacy value, field count, field/value pairs, then chat messages.
+MIGRATE_SESSION_SCRIPT = """
+if redis.call('EXISTS', KEYS[2]) == 1 or redis.call('GET', KEYS[1]) ~= ARGV[1] then
+    return 0
+end
+local ttl = redis.call('TTL', KEYS[1])
+local n = tonumber(ARGV[2])
+redis.call('DEL', KEYS[3])
+redis.call('HSET', KEYS[2], unpack(ARGV, 3, 2 + n))
+if #ARGV > 2 + n then
+    redis.call('RPUSH', KEYS[3], unpack(ARGV, 3 + n, #ARGV))
+end
+if ttl > 0 then
+    redis.call('EXPIRE', KEYS[2], ttl)
+    redis.call('EXPIRE', KEYS[3], ttl)
+end
+redis.call('DEL', KEYS[1])
+return 1
+"""
+
+
+def _encode_fields(data: Dict[str, Any]) -> Dict[str, str]:
+    """JSON-encode scalar session fields for a Redis hash, leaving out the chat."""
+    return {field: json.dumps(value) for field, value in data.items() if field != "chat_history"}
+
+
+def _decode_fields(fields: Dict[str, str]) -> Dict[str, Any]:
+    return {field: json.loads(value) for field, value in fields.items()}
+
+
+class SessionStore:
+    """Async Redis store for test and per-question session data.
+
+    Keys:
+        test:{user_id}:{test_id}                                 overall test data (JSON)
+        test_code:{user_id}:{test_code}                          test id for a test code
+        question_session:{user_id}:{test_id}:{question_id}       per-question scalar fields (hash)
+        question_session:{user_id}:{test_id}:{question_id}:chat  per-question chat turns (list)
+        question_session:{user_id}:{test_id}:{question_id}:summary_lock
+
+    Question sessions used to be JSON strings under `test_session:`. A read
+    that finds no session hash converts a legacy string it finds into the
+    hash and chat list and deletes it, so tests in progress keep their chat
+    and answers.
+
+    Chat turns are appended with RPUSH, so a new turn never rewrites the
+    history that came before it. The session hash may also hold a rolling
+    `summary` of the oldest `summarized_turns` chat turns.
+    """
+
+    def __init__(
+        self,
+        redis_url: str,
+        max_connections: int = REDIS_MAX_CONNECTIONS,
+        pool_timeout: float = REDIS_POOL_TIMEOUT
+    ):
+        # A blocking pool makes bursts wait for a free connection instead of failing
+        self.pool = BlockingConnectionPool.from_url(
+            redis_url,
+            decode_responses=True,
+            max_connections=max_connections,
+            timeout=pool_timeout
+        )
+        self.redis = Redis(connection_pool=self.pool)
+        self._init_sessions = self.redis.register_script(INIT_SESSIONS_SCRIPT)
+        self._release_lock = self.redis.register_script(RELEASE_LOCK_SCRIPT)
+        self._migrate_session = self.redis.register_script(MIGRATE_SESSION_SCRIPT)
+
+    @staticmethod
+    def session_key(user_id: str, test_id: str, question_id: str) -> str:
+        """Generate Redis key for a specific test session."""
+        return f"question_session:{user_id}:{test_id}:{question_id}"
+
+    @staticmethod
+    def legacy_session_key(user_id: str, test_id: str, question_id: str) -> str:
+        """Generate Redis key of a question session stored as a JSON string."""
+        return f"test_session:{user_id}:{test_id}:{question_id}"
+
+    @staticmethod
+    def chat_key(user_id: str, test_id: str, question_id: str) -> str:
+        """Generate Redis key for the chat turns of a specific test session."""
+        return f"question_session:{user_id}:{test_id}:{question_id}:chat"
+
+    @staticmethod
+    def summary_lock_key(user_id: str, test_id: str, question_id: str) -> str:
+        """Generate Redis key held while the conversation summary of a session is updated."""
+        return f"question_session:{user_id}:{test_id}:{question_id}:summary_lock"
+
+    @staticmethod
+    def test_key(user_id: str, test_id: str) -> str:
+        """Generate Redis key for overall test data."""
+        return f"test:{user_id}:{test_id}"
+
+    @staticmethod
+    def test_code_key(user_id: str, test_code: str) -> str:
+        """Generate Redis key mapping a test code to the test id of a user's session."""
+        return f"test_code:{user_id}:{test_code}"
+
+    def _queue_test_write(self, pipe, user_id: str, test_id: str, data: Dict[str, Any], ttl: int):
+        pipe.set(self.test_key(user_id, test_id), json.dumps(data), ex=ttl)
+        if data.get("test_code"):
+            pipe.set(self.test_code_key(user_id, data["test_code"]), test_id, ex=ttl)
+
+    async def get_test(self, user_id: str, test_id: str) -> Optional[Dict[str, Any]]:
+        """Load overall test data, or None if the test session does not exist."""
+        value = await self.redis.get(self.test_key(user_id, test_id))
+        return json.loads(value) if value else None
+
+    async def get_test_id(self, user_id: str, test_code: str) -> Optional[str]:
+        """Resolve a test code to the test id of the user's session, or None if unknown."""
+        return await self.redis.get(self.test_code_key(user_id, test_code))
+
+    async def save_test(self, user_id: str, test_id: str, data: Dict[str, Any], ttl: int = SESSION_TTL):
+        """Store overall test data with the given expiry."""
+        pipe = self.redis.pipeline(transaction=False)
+        self._queue_test_write(pipe, user_id, test_id, data, ttl)
+        await pipe.execute()
+
+    async def _migrate_legacy_sessions(self, user_id: str, test_id: str, question_ids: List[str]) -> bool:
+        """Convert legacy JSON-string sessions of these questions, returning whether any were found."""
+        legacy_keys = [self.legacy_session_key(user_id, test_id, question_id) for question_id in question_ids]
+        values = await self.redis.mget(legacy_keys)
+        if not any(values):
+            return False
+
+        pipe = self.redis.pipeline(transaction=False)
+        for question_id, legacy_key, value in zip(question_ids, legacy_keys, values):
+            if not value:
+                continue
+            data = json.loads(value)
+            fields = _encode_fields(data) or {"question_id": json.dumps(question_id)}
+            args = [value, len(fields) * 2]
+            for field, field_value in fields.items():
+                args.extend([field, field_value])
+            args.extend(json.dumps(message) for message in data.get("chat_history") or [])
+            keys = [legacy_key, self.session_key(user_id, test_id, question_id), self.chat_key(user_id, test_id, question_id)]
+            await self._migrate_session(keys=keys, args=args, client=pipe)
+        await pipe.execute()
+        return True
+
+    def _queue_session_read(
+        self,
+        pipe,
+        user_id: str,
+        test_id: str,
+        question_id: str,
+        history_limit: Optional[int],
+        after_summary: bool
+    ) -> int:
+        """Queue the reads of a question session, returning how many results they produce."""
+        chat_key = self.chat_key(user_id, test_id, question_id)
+        pipe.hgetall(self.session_key(user_id, test_id, question_id))
+        if history_limit == 0:
+            return 1
+        start = 0 if history_limit is None else -history_limit
+        pipe.lrange(chat_key, start, -1)
+        if not after_summary:
+            return 2
+        pipe.llen(chat_key)
+        return 3
+
+    @staticmethod
+    def _parse_session(results: List[Any], after_summary: bool) -> Optional[Dict[str, Any]]:
+        if not results[0]:
+            return None
+        session_data = _decode_fields(results[0])
+        chat = results[1] if len(results) > 1 else []
+        if after_summary and len(results) > 2:
+            unsummarized = max(0, results[2] - session_data.get("summarized_turns", 0))
+            session_data["unsummarized_turns"] = unsummarized
+            chat = chat[len(chat) - min(len(chat), unsummarized):]
+        session_data["chat_history"] = [json.loads(message) for message in chat]
+        return session_data
+
+    async def get_question_and_test(
+        self,
+        user_id: str,
+        test_id: str,
+        question_id: str,
+        history_limit: Optional[int] = 0,
+        after_summary: bool = False
+    ) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        """Load a question session and the test data in one round trip.
+
+        The chat is read as in get_question_session; by default it is skipped.
+        """
+        async def read():
+            pipe = self.redis.pipeline(transaction=False)
+            count = self._queue_session_read(pipe, user_id, test_id, question_id, history_limit, after_summary)
+            pipe.get(self.test_key(user_id, test_id))
+            return count, await pipe.execute()
+
+        count, results = await read()
+        if not results[0] and await self._migrate_legacy_sessions(user_id, test_id, [question_id]):
+            count, results = await read()
+
+        test_value = results[count]
+        return self._parse_session(results[:count], after_summary), json.loads(test_value) if test_value else None
+
+    async def get_question_session(
+        self,
+        user_id: str,
+        test_id: str,
+        question_id: str,
+        history_limit: Optional[int] = None,
+        after_summary: bool = False
+    ) -> Optional[Dict[str, Any]]:
+        """Load the session for a single question, or None if it does not exist.
+
+        `history_limit` bounds the chat read to the newest N turns; None reads
+        the whole chat and 0 skips it. With `after_summary` the turns already
+        folded into the session summary are left out, and `unsummarized_turns`
+        counts all the turns after them, however many `history_limit` read.
+        """
+        async def read():
+            pipe = self.redis.pipeline(transaction=False)
+            self._queue_session_read(pipe, user_id, test_id, question_id, history_limit, after_summary)
+            return await pipe.execute()
+
+        results = await read()
+        if not results[0] and await self._migrate_legacy_sessions(user_id, test_id, [question_id]):
+            results = await read()
+        return self._parse_session(results, after_summary)
+
+    async def save_question_session(
+        self,
+        user_id: str,
+        test_id: str,
+        question_id: str,
+        data: Dict[str, Any],
+        ttl: int = SESSION_TTL
+    ):
+        """Store the scalar fields of a question session and refresh its expiry.
+
+        Any `chat_history` in `data` is ignored, use append_chat_messages for chat turns.
+        """
+        session_key = self.session_key(user_id, test_id, question_id)
+        pipe = self.redis.pipeline(transaction=False)
+        fields = _encode_fields(data)
+        if fields:
+            pipe.hset(session_key, mapping=fields)
+        pipe.expire(session_key, ttl)
+        pipe.expire(self.chat_key(user_id, test_id, question_id), ttl)
+        await pipe.execute()
+
+    async def append_chat_messages(
+        self,
+        user_id: str,
+        test_id: str,
+        question_id: str,
+        messages: List[Dict[str, Any]],
+        fields: Optional[Dict[str, Any]] = None,
+        ttl: int = SESSION_TTL
+    ):
+        """Append chat turns and optionally update scalar fields in one round trip."""
+        session_key = self.session_key(user_id, test_id, question_id)
+        chat_key = self.chat_key(user_id, test_id, question_id)
+        pipe = self.redis.pipeline(transaction=False)
+        if messages:
+            pipe.rpush(chat_key, *[json.dumps(message) for message in messages])
+        if fields:
+            pipe.hset(session_key, mapping=_encode_fields(fields))
+        pipe.expire(session_key, ttl)
+        pipe.expire(chat_key, ttl)
+        await pipe.execute()
+
+    async def get_turns_to_summarize(
+        self,
+        user_id: str,
+        test_id: str,
+        question_id: str,
+        keep: int
+    ) -> Tuple[str, int, List[Dict[str, Any]]]:
+        """Load the session summary, the number of turns it covers and the turns
+        after those, except the newest `keep`."""
+        chat_key = self.chat_key(user_id, test_id, question_id)
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hmget(self.session_key(user_id, test_id, question_id), ["summary", "summarized_turns"])
+        pipe.llen(chat_key)
+        (summary, summarized_turns), length = await pipe.execute()
+
+        summary = json.loads(summary) if summary else ""
+        summarized_turns = json.loads(summarized_turns) if summarized_turns else 0
+        end = length - keep
+        if end <= summarized_turns:
+            return summary, summarized_turns, []
+        messages = await self.redis.lrange(chat_key, summarized_turns, end - 1)
+        return summary, summarized_turns, [json.loads(message) for message in messages]
+
+    async def save_summary(
+        self,
+        user_id: str,
+        test_id: str,
+        question_id: str,
+        summary: str,
+        summarized_turns: int
+    ):
+        """Store the rolling conversation summary and the number of chat turns it covers."""
+        await self.redis.hset(
+            self.session_key(user_id, test_id, question_id),
+            mapping=_encode_fields({"summary": summary, "summarized_turns": summarized_turns})
+        )
+
+    async def acquire_summary_lock(self, user_id: str, test_id: str, question_id: str) -> Optional[str]:
+        """Claim the summary update of a session, returning the lock token or None if another update holds it."""
+        key = self.summary_lock_key(user_id, test_id, question_id)
+        token = secrets.token_hex(16)
+        if await self.redis.set(key, token, nx=True, ex=SUMMARY_LOCK_TTL):
+            return token
+        return None
+
+    async def release_summary_lock(self, user_id: str, test_id: str, question_id: str, token: str):
+        """Release the lock if it is still ours; it may have expired and been claimed by another update."""
+        await self._release_lock(keys=[self.summary_lock_key(user_id, test_id, question_id)], args=[token])
+
+    async def init_test(
+        self,
+        user_id: str,
+        test_id: str,
+        test_data: Dict[str, Any],
+        question_sessions: Dict[str, Dict[str, Any]],
+        ttl: int = INITIAL_SESSION_TTL
+    ):
+        """Store test data and create any missing question sessions.
+
+        Question sessions are created only if absent so a session that already
+        exists (e.g. the student reloaded the test) keeps its chat history and
+        answer. Legacy JSON-string sessions are converted first.
+        """
+        await self._migrate_legacy_sessions(user_id, test_id, list(question_sessions))
+        keys = []
+        args = [ttl]
+        for question_id, data in question_sessions.items():
+            keys.append(self.session_key(user_id, test_id, question_id))
+            fields = _encode_fields(data)
+            args.append(len(fields) * 2)
+            for field, value in fields.items():
+                args.extend([field, value])
+
+        pipe = self.redis.pipeline(transaction=False)
+        if keys:
+            await self._init_sessions(keys=keys, args=args, client=pipe)
+        self._queue_test_write(pipe, user_id, test_id, test_data, ttl)
+        await pipe.execute()
+
+    async def get_question_sessions(
+        self,
+        user_id: str,
+        test_id: str,
+        question_ids: Iterable[str]
+    ) -> List[Optional[Dict[str, Any]]]:
+        """Load several question sessions with their chat in one round trip, in the given order.
+
+        Missing sessions cost two more round trips to convert any legacy ones.
+        """
+        question_ids = [str(question_id) for question_id in question_ids]
+        if not question_ids:
+            return []
+
+        async def read():
+            pipe = self.redis.pipeline(transaction=False)
+            for question_id in question_ids:
+                pipe.hgetall(self.session_key(user_id, test_id, question_id))
+                pipe.lrange(self.chat_key(user_id, test_id, question_id), 0, -1)
+            return await pipe.execute()
+
+        results = await read()
+        missing = [question_id for question_id, fields in zip(question_ids, results[0::2]) if not fields]
+        if missing and await self._migrate_legacy_sessions(user_id, test_id, missing):
+            results = await read()
+
+        sessions = []
+        for fields, chat in zip(results[0::2], results[1::2]):
+            if not fields:
+                sessions.append(None)
+                continue
+            session_data = _decode_fields(fields)
+            session_data["chat_history"] = [json.loads(message) for message in chat]
+            sessions.append(session_data)
+        return sessions
+
+    async def delete_test(
+        self,
+        user_id: str,
+        test_id: str,
+        question_ids: Iterable[str],
+        test_code: Optional[str] = None
+    ):
+        """Remove the test data and every question session belonging to it with one UNLINK."""
+        keys = [self.test_key(user_id, test_id)]
+        if test_code:
+            keys.append(self.test_code_key(user_id, test_code))
+        for question_id in question_ids:
+            keys.append(self.session_key(user_id, test_id, str(question_id)))
+            keys.append(self.chat_key(user_id, test_id, str(question_id)))
+            keys.append(self.legacy_session_key(user_id, test_id, str(question_id)))
+        await self.redis.unlink(*keys)
+
+    async def aclose(self):
+        """Close the client and release pooled connections."""
+        await self.redis.aclose()
+        await self.pool.disconnect()
@@ -0,0 +1,270 @@
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+
+from redis.asyncio import Redis
+
+from .http_clients import ServiceClients
+
+TEST_CACHE_TTL = float(os.getenv("TEST_CACHE_TTL", "60"))
+TEST_CACHE_MAX_ENTRIES = int(os.getenv("TEST_CACHE_MAX_ENTRIES", "512"))
+TEST_CACHE_USE_REDIS = os.getenv("TEST_CACHE_USE_REDIS", "false").strip().lower() in ("1", "true", "yes", "on")
+TEST_CACHE_REDIS_TTL = int(os.getenv("TEST_CACHE_REDIS_TTL", "300"))
+
+# Replicas publish invalidated cache keys on this channel
+INVALIDATION_CHANNEL = "test_cache:invalidate"
+# Backoff between attempts to resubscribe after the invalidation channel fails
+INVALIDATION_RETRY_SECONDS = 1.0
+INVALIDATION_RETRY_MAX_SECONDS = 30.0
+
+
+class TestCache:
+    """TTL/LRU cache of tests (with their questions) fetched from database-service.
+
+    Entries are keyed by test code and by test id. With a Redis URL the cache is
+    shared between gateway replicas: fills are written to Redis, and
+    invalidations are published so every replica drops its local copy. A
+    replica that loses its subscription resubscribes and drops every local
+    entry, since invalidations published in between never reach it.
+
+    Cached tests are shared between requests and must be treated as read-only.
+    """
+
+    def __init__(
+        self,
+        service_clients: ServiceClients,
+        database_service_url: str,
+        redis_url: Optional[str] = None,
+        ttl: float = TEST_CACHE_TTL,
+        max_entries: int = TEST_CACHE_MAX_ENTRIES,
+        redis_ttl: int = TEST_CACHE_REDIS_TTL
+    ):
+        self.clients = service_clients
+        self.database_service_url = database_service_url
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.redis_ttl = redis_ttl
+        self.redis = Redis.from_url(redis_url, decode_responses=True) if redis_url else None
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        # Concurrent misses for the same key share one database fetch
+        self._inflight: Dict[str, asyncio.Future] = {}
+        # Bumped by every invalidation; keys invalidated while loads are in flight
+        # map to the generation they were invalidated at, so those loads are not cached
+        self._generation = 0
+        self._invalidated: Dict[str, int] = {}
+        # Loads that started before the whole cache was dropped are not cached either
+        self._cleared_at = 0
+        self._listener: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.misses = 0
+        self.redis_hits = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _code_key(code: str) -> str:
+        return f"test_cache:code:{code}"
+
+    @staticmethod
+    def _id_key(test_id) -> str:
+        return f"test_cache:id:{test_id}"
+
+    def _test_keys(self, test: Dict[str, Any]) -> List[str]:
+        return [self._code_key(test["code"]), self._id_key(test["id"])]
+
+    def _get_local(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, test = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return test
+
+    def _is_stale(self, test: Dict[str, Any], generation: int) -> bool:
+        """Whether `test` was invalidated after a load that started at `generation`."""
+        return generation < self._cleared_at or any(
+            self._invalidated.get(key, 0) > generation
+            for key in self._test_keys(test)
+        )
+
+    def _put_local(self, test: Dict[str, Any]):
+        expires_at = time.monotonic() + self.ttl
+        for key in self._test_keys(test):
+            self._entries[key] = (expires_at, test)
+            self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def _load(self, key: str, path: str) -> Dict[str, Any]:
+        """Fetch a test and cache it, unless it was invalidated while it was being fetched."""
+        generation = self._generation
+        if self.redis is not None:
+            try:
+                value = await self.redis.get(key)
+                if value:
+                    self.redis_hits += 1
+                    test = json.loads(value)
+                    if not self._is_stale(test, generation):
+                        self._put_local(test)
+                    return test
+            except Exception as e:
+                print(f"Test cache: Redis read failed, falling back to database: {str(e)}")
+
+        response = await self.clients.database.get(f"{self.database_service_url}{path}")
+        response.raise_for_status()
+        test = response.json()
+        if self._is_stale(test, generation):
+            return test
+        self._put_local(test)
+
+        if self.redis is not None:
+            try:
+                value = json.dumps(test)
+                pipe = self.redis.pipeline(transaction=False)
+                pipe.setex(self._code_key(test["code"]), self.redis_ttl, value)
+                pipe.setex(self._id_key(test["id"]), self.redis_ttl, value)
+                await pipe.execute()
+            except Exception as e:
+                print(f"Test cache: Redis write failed: {str(e)}")
+        return test
+
+    async def _get(self, key: str, path: str) -> Dict[str, Any]:
+        test = self._get_local(key)
+        if test is not None:
+            self.hits += 1
+            return test
+
+        self.misses += 1
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            test = await self._load(key, path)
+            future.set_result(test)
+            return test
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved when nobody else was waiting on it
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+            if not self._inflight:
+                self._invalidated.clear()
+
+    async def get_by_code(self, code: str) -> Dict[str, Any]:
+        """Return the test with the given code, raising httpx.HTTPStatusError if it does not exist."""
+        return await self._get(self._code_key(code), f"/tests/by-code/{code}")
+
+    async def get_by_id(self, test_id: int) -> Dict[str, Any]:
+        """Return the test with the given id, raising httpx.HTTPStatusError if it does not exist."""
+        return await self._get(self._id_key(test_id), f"/tests/{test_id}")
+
+    def _with_siblings(self, keys: List[str], tests) -> List[str]:
+        """`keys` plus the code and id keys of every test in `tests`."""
+        keys = list(keys)
+        for test in tests:
+            keys.extend(key for key in self._test_keys(test) if key not in keys)
+        return keys
+
+    def _drop_local(self, keys: List[str]) -> List[str]:
+        """Drop `keys` and the sibling key of any test cached under them, returning every key dropped."""
+        keys = self._with_siblings(keys, [self._entries[key][1] for key in keys if key in self._entries])
+        self._generation += 1
+        for key in keys:
+            if self._inflight:
+                self._invalidated[key] = self._generation
+            if self._entries.pop(key, None) is not None:
+                self.invalidations += 1
+        return keys
+
+    def _drop_all(self):
+        self._generation += 1
+        self._cleared_at = self._generation
+        self._entries.clear()
+
+    async def invalidate(self, code: Optional[str] = None, test_id: Optional[int] = None):
+        """Drop a test from this replica, from Redis, and from every other replica."""
+        keys = []
+        if code is not None:
+            keys.append(self._code_key(code))
+        if test_id is not None:
+            keys.append(self._id_key(test_id))
+        if not keys:
+            return
+        if self.redis is not None:
+            try:
+                # The shared copy names the sibling key when this replica has no local one
+                values = await self.redis.mget(keys)
+                keys = self._with_siblings(keys, [json.loads(value) for value in values if value])
+            except Exception as e:
+                print(f"Test cache: Redis read failed during invalidation: {str(e)}")
+        keys = self._drop_local(keys)
+
+        if self.redis is not None:
+            try:
+                await self.redis.unlink(*keys)
+                await self.redis.publish(INVALIDATION_CHANNEL, json.dumps(keys))
+            except Exception as e:
+                print(f"Test cache: Redis invalidation failed: {str(e)}")
+
+    async def _listen_for_invalidations(self):
+        """Drop keys invalidated by other replicas, resubscribing whenever the connection fails."""
+        backoff = INVALIDATION_RETRY_SECONDS
+        while True:
+            pubsub = self.redis.pubsub()
+            try:
+                await pubsub.subscribe(INVALIDATION_CHANNEL)
+                # Anything published while unsubscribed was missed
+                self._drop_all()
+                backoff = INVALIDATION_RETRY_SECONDS
+                async for message in pubsub.listen():
+                    if message.get("type") == "message":
+                        self._drop_local(json.loads(message["data"]))
+            except Exception as e:
+                print(f"Test cache: invalidation channel failed, resubscribing in {backoff:.0f}s: {str(e)}")
+            finally:
+                try:
+                    await pubsub.aclose()
+                except Exception:
+                    pass
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, INVALIDATION_RETRY_MAX_SECONDS)
+
+    async def start(self):
+        """Start listening for invalidations published by other replicas."""
+        if self.redis is not None and self._listener is None:
+            self._listener = asyncio.create_task(self._listen_for_invalidations())
+
+    async def aclose(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._listener = None
+        if self.redis is not None:
+            await self.redis.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "redis_hits": self.redis_hits,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "redis_backed": self.redis is not None
+        }
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for test session setup and teardown in Redis.
+
+Compares the per-question round trips that start_test/finish_test used to make
+on JSON-string sessions (EXISTS + SETEX per question, GET per question, DELETE
+per question) with the pipelined SessionStore operations for tests of 10, 50
+and 200 questions: init_test creates the missing session hashes with one Lua
+script call in the same pipeline as the test data write, get_question_sessions
+reads every hash (HGETALL) and chat list (LRANGE) in one pipeline, and
+delete_test removes the hashes, chat lists and test data with one UNLINK.
+
+Usage:
+    REDIS_URL=redis://localhost:6379 python bench_session_pipeline.py --iterations 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+from app.session_store import SessionStore, INITIAL_SESSION_TTL
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+QUESTION_COUNTS = [10, 50, 200]
+USER_ID = "bench_user"
+TEST_ID = "bench_test"
+
+
+def _legacy_key(question_id: str) -> str:
+    """Key of a question session in the old JSON-string layout."""
+    return f"test_session:{USER_ID}:{TEST_ID}:{question_id}"
+
+
+def _session(question_id: str) -> dict:
+    return {
+        "chat_history": [],
+        "start_time": "2025-01-01T00:00:00+00:00",
+        "end_time": None,
+        "hints_used": 0,
+        "student_answer": None,
+        "is_correct": False,
+        "question_id": question_id,
+        "test_id": TEST_ID,
+        "time_spent": 0
+    }
+
+
+async def per_key_setup(store: SessionStore, question_ids):
+    for question_id in question_ids:
+        key = _legacy_key(question_id)
+        if not await store.redis.exists(key):
+            await store.redis.setex(key, INITIAL_SESSION_TTL, json.dumps(_session(question_id)))
+    await store.redis.setex(store.test_key(USER_ID, TEST_ID), INITIAL_SESSION_TTL, json.dumps({}))
+
+
+async def per_key_teardown(store: SessionStore, question_ids):
+    for question_id in question_ids:
+        await store.redis.get(_legacy_key(question_id))
+    await store.redis.delete(store.test_key(USER_ID, TEST_ID))
+    for question_id in question_ids:
+        await store.redis.delete(_legacy_key(question_id))
+
+
+async def pipelined_setup(store: SessionStore, question_ids):
+    sessions = {question_id: _session(question_id) for question_id in question_ids}
+    await store.init_test(USER_ID, TEST_ID, {}, sessions)
+
+
+async def pipelined_teardown(store: SessionStore, question_ids):
+    await store.get_question_sessions(USER_ID, TEST_ID, question_ids)
+    await store.delete_test(USER_ID, TEST_ID, question_ids)
+
+
+async def measure(store: SessionStore, setup, teardown, question_ids, iterations: int):
+    setup_total = teardown_total = 0.0
+    for _ in range(iterations):
+        start = time.perf_counter()
+        await setup(store, question_ids)
+        setup_total += time.perf_counter() - start
+
+        start = time.perf_counter()
+        await teardown(store, question_ids)
+        teardown_total += time.perf_counter() - start
+    return setup_total / iterations * 1000, teardown_total / iterations * 1000
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=20)
+    args = parser.parse_args()
+
+    store = SessionStore(REDIS_URL)
+    print(f"Redis: {REDIS_URL}  iterations: {args.iterations}\n")
+    print(f"{'questions':>9} | {'mode':<10} | {'start_test (ms)':>15} | {'finish_test (ms)':>16}")
+    print("-" * 60)
+    for count in QUESTION_COUNTS:
+        question_ids = [str(i) for i in range(count)]
+        for label, setup, teardown in (
+            ("per-key", per_key_setup, per_key_teardown),
+            ("pipelined", pipelined_setup, pipelined_teardown),
+        ):
+            setup_ms, teardown_ms = await measure(store, setup, teardown, question_ids, args.iterations)
+            print(f"{count:>9} | {label:<10} | {setup_ms:>15.2f} | {teardown_ms:>16.2f}")
+    await store.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
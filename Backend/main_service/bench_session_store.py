@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Benchmark the Redis session layer used by /chat and /submit-answer.
+
+Compares the old pattern (synchronous redis.Redis calls inside async handlers)
+with the async SessionStore under concurrent students. Each simulated request
+performs the same Redis traffic as the real handler and awaits a fake
+downstream call, so the difference shows how much the blocking client
+serializes the event loop.
+
+Usage:
+    REDIS_URL=redis://localhost:6379 python bench_session_store.py --students 200 --requests 5
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+from redis import Redis
+
+from app.session_store import SessionStore, SESSION_TTL
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+BENCH_PREFIX = "bench"
+# The old layout stores sessions as JSON strings, the store uses hashes and chat lists
+SYNC_TEST_ID = f"{BENCH_PREFIX}_sync"
+ASYNC_TEST_ID = f"{BENCH_PREFIX}_async"
+
+
+def _session(question_id: str) -> dict:
+    return {
+        "chat_history": [{"role": "user", "content": "what is the mass?"}] * 4,
+        "start_time": "2025-01-01T00:00:00+00:00",
+        "hints_used": 0,
+        "student_answer": None,
+        "is_correct": False,
+        "question_id": question_id,
+        "test_id": SYNC_TEST_ID
+    }
+
+
+def _test_data(question_ids) -> dict:
+    return {"list_question_ids": question_ids, "completed_questions": [], "total_questions": len(question_ids)}
+
+
+async def blocking_chat(redis: Redis, user: str, downstream_latency: float):
+    """Old /chat: sync GET session, GET test, await LLM, sync SETEX."""
+    session_key = f"test_session:{user}:{SYNC_TEST_ID}:1"
+    test_key = f"test:{user}:{SYNC_TEST_ID}"
+    session = json.loads(redis.get(session_key))
+    redis.get(test_key)
+    await asyncio.sleep(downstream_latency)
+    session["chat_history"].append({"role": "assistant", "content": "ok"})
+    redis.setex(session_key, SESSION_TTL, json.dumps(session))
+
+
+async def blocking_submit(redis: Redis, user: str, downstream_latency: float):
+    """Old /submit-answer: await DB lookups, sync GET x2, sync SETEX x2."""
+    session_key = f"test_session:{user}:{SYNC_TEST_ID}:1"
+    test_key = f"test:{user}:{SYNC_TEST_ID}"
+    await asyncio.sleep(downstream_latency)
+    session = json.loads(redis.get(session_key))
+    test = json.loads(redis.get(test_key))
+    session["student_answer"] = "42"
+    redis.setex(session_key, SESSION_TTL, json.dumps(session))
+    redis.setex(test_key, SESSION_TTL, json.dumps(test))
+
+
+async def async_chat(store: SessionStore, user: str, downstream_latency: float):
+    """New /chat: bounded chat read, await LLM, append the new turns."""
+    await store.get_question_session(user, ASYNC_TEST_ID, "1", history_limit=4)
+    await store.get_test(user, ASYNC_TEST_ID)
+    await asyncio.sleep(downstream_latency)
+    await store.append_chat_messages(
+        user, ASYNC_TEST_ID, "1",
+        [{"role": "user", "content": "what is the mass?"}, {"role": "assistant", "content": "ok"}]
+    )
+
+
+async def async_submit(store: SessionStore, user: str, downstream_latency: float):
+    """New /submit-answer: same traffic through the async store."""
+    await asyncio.sleep(downstream_latency)
+    session = await store.get_question_session(user, ASYNC_TEST_ID, "1", history_limit=0)
+    test = await store.get_test(user, ASYNC_TEST_ID)
+    session["student_answer"] = "42"
+    await store.save_question_session(user, ASYNC_TEST_ID, "1", session)
+    await store.save_test(user, ASYNC_TEST_ID, test)
+
+
+async def run(label: str, handler, client, students: int, requests: int, downstream_latency: float):
+    async def student(idx: int):
+        for _ in range(requests):
+            await handler(client, f"student{idx}", downstream_latency)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(student(i) for i in range(students)))
+    elapsed = time.perf_counter() - start
+    total = students * requests
+    print(f"{label:<28} {total:>6} requests in {elapsed:6.2f}s  -> {total / elapsed:8.1f} req/s")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--students", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=5, help="requests per student")
+    parser.add_argument("--latency", type=float, default=0.05, help="simulated downstream latency (s)")
+    args = parser.parse_args()
+
+    sync_redis = Redis.from_url(REDIS_URL, decode_responses=True)
+    store = SessionStore(REDIS_URL)
+
+    # Seed one session per student
+    for i in range(args.students):
+        user = f"student{i}"
+        sync_redis.setex(f"test_session:{user}:{SYNC_TEST_ID}:1", SESSION_TTL, json.dumps(_session("1")))
+        sync_redis.setex(f"test:{user}:{SYNC_TEST_ID}", SESSION_TTL, json.dumps(_test_data(["1"])))
+        session = _session("1")
+        await store.init_test(user, ASYNC_TEST_ID, _test_data(["1"]), {"1": session}, ttl=SESSION_TTL)
+        await store.append_chat_messages(user, ASYNC_TEST_ID, "1", session["chat_history"])
+
+    print(f"Redis: {REDIS_URL}  students: {args.students}  requests/student: {args.requests}  "
+          f"downstream latency: {args.latency * 1000:.0f}ms\n")
+    await run("/chat (sync redis)", blocking_chat, sync_redis, args.students, args.requests, args.latency)
+    await run("/chat (async store)", async_chat, store, args.students, args.requests, args.latency)
+    await run("/submit-answer (sync redis)", blocking_submit, sync_redis, args.students, args.requests, args.latency)
+    await run("/submit-answer (async store)", async_submit, store, args.students, args.requests, args.latency)
+
+    # Clean up benchmark keys
+    for key in sync_redis.scan_iter(f"*:{BENCH_PREFIX}*"):
+        sync_redis.delete(key)
+    sync_redis.close()
+    await store.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -19,6 +19,9 @@ HIDDEN_VALUES_COLLECTION = "hidden_values"
 TEACHING_MATERIALS_COLLECTION = "teaching_materials"
 PROBLEMS_COLLECTION = "problems"
 
+# Hidden values below this similarity to the query are not returned
+HIDDEN_VALUE_MIN_SIMILARITY = 0.40
+
 class VectorDatabase:
     _instance = None
     _lock = Lock()
@@ -92,6 +95,45 @@ class VectorDatabase:
         # Add document to Chroma
         self.problems.add_documents([document])
 
+    def store_problems_batch(self, problems: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Store many problems and their hidden values with one add per collection.
+        
+        Each problem is a dict with problem_id, public_question, metadata and
+        hidden_values (a list of strings). Problems and hidden values are stored
+        independently so a failure in one collection is reported, not fatal.
+        """
+        problem_documents = [
+            Document(
+                page_content=problem["public_question"],
+                metadata={
+                    "problem_id": problem["problem_id"],
+                    "topic": (problem.get("metadata") or {}).get("topic") or "",
+                    "subject": (problem.get("metadata") or {}).get("subject") or ""
+                }
+            )
+            for problem in problems
+        ]
+        hidden_value_documents = [
+            Document(page_content=hidden_value, metadata={"problem_id": problem["problem_id"]})
+            for problem in problems
+            for hidden_value in problem.get("hidden_values", [])
+        ]
+        
+        result = {"stored_problems": 0, "stored_hidden_values": 0, "errors": []}
+        if problem_documents:
+            try:
+                self.problems.add_documents(problem_documents)
+                result["stored_problems"] = len(problem_documents)
+            except Exception as e:
+                result["errors"].append(f"problems: {str(e)}")
+        if hidden_value_documents:
+            try:
+                self.hidden_values.add_documents(hidden_value_documents)
+                result["stored_hidden_values"] = len(hidden_value_documents)
+            except Exception as e:
+                result["errors"].append(f"hidden_values: {str(e)}")
+        return result
+
     def store_teaching_material(self, topic: str, content: str, metadata: Dict[str, Any]):
         """Store a teaching material with its embedding."""
         document = Document(
@@ -125,7 +167,7 @@ class VectorDatabase:
         for doc, score in results:
             similarity = 1 - (score / 2)  # Convert distance to similarity score
             # Only include results with at least 70% similarity
-            if similarity >= 0.40:
+            if similarity >= HIDDEN_VALUE_MIN_SIMILARITY:
                 print(f"Hidden value query: '{query}', Similarity score: {similarity}")
                 hidden_values.append(doc.page_content)
         
@@ -230,5 +272,70 @@ class VectorDatabase:
         
         return formatted_results
 
+    def get_problem_metadata(self, problem_id: str) -> Dict[str, Any]:
+        """Get the topic and subject of a problem by metadata lookup, without a similarity search."""
+        result = self.problems.get(where={"problem_id": problem_id}, limit=1, include=["metadatas"])
+        metadatas = result.get("metadatas") or []
+        if metadatas:
+            return {
+                "topic": metadatas[0].get("topic", ""),
+                "subject": metadatas[0].get("subject", "")
+            }
+        return {"topic": "", "subject": ""}
+
+    def retrieve_context(
+        self,
+        problem_id: str,
+        query: str,
+        materials_limit: int = 3,
+        return_embedding: bool = False
+    ) -> Dict[str, Any]:
+        """Gather everything the LLM needs for a query with a single query embedding.
+
+        Returns the best hidden value for the problem (if similar enough), the
+        problem's topic and subject, and, when no hidden value matched, the
+        teaching materials for that topic closest to the query. With
+        `return_embedding` the query embedding is included for callers that
+        cache by query similarity.
+        """
+        embedding = self.embeddings.embed_query(query)
+
+        hidden_value = None
+        results = self.hidden_values.similarity_search_by_vector_with_relevance_scores(
+            embedding,
+            k=1,
+            filter={"problem_id": problem_id}
+        )
+        for doc, score in results:
+            similarity = 1 - (score / 2)  # Convert distance to similarity score
+            if similarity >= HIDDEN_VALUE_MIN_SIMILARITY:
+                print(f"Hidden value query: '{query}', Similarity score: {similarity}")
+                hidden_value = doc.page_content
+
+        problem = self.get_problem_metadata(problem_id)
+
+        materials = []
+        if hidden_value is None and materials_limit > 0:
+            results = self.teaching_materials.similarity_search_by_vector_with_relevance_scores(
+                embedding,
+                k=materials_limit,
+                filter={"topic": problem["topic"]} if problem["topic"] else None
+            )
+            for doc, score in results:
+                materials.append({
+                    "content": doc.page_content,
+                    "metadata": {k: v for k, v in doc.metadata.items() if k not in ["topic", "created_at"]},
+                    "similarity": 1 - (score / 2)
+                })
+
+        return {
+            "hidden_value": hidden_value,
+            "has_hidden_values": hidden_value is not None,
+            "topic": problem["topic"],
+            "subject": problem["subject"],
+            "materials": materials,
+            "query_embedding": list(embedding) if return_embedding else None
+        }
+
 # Create a singleton instance
 vector_db = VectorDatabase()
@@ -33,11 +33,39 @@ class StoreProblemRequest(BaseModel):
     public_question: str
     metadata: Optional[Dict[str, Any]] = {}
 
+class BatchProblem(BaseModel):
+    problem_id: str
+    public_question: str
+    metadata: Optional[Dict[str, Any]] = {}
+    hidden_values: List[str] = []
+
+class StoreProblemsBatchRequest(BaseModel):
+    problems: List[BatchProblem]
+
+class StoreProblemsBatchResponse(BaseModel):
+    stored_problems: int
+    stored_hidden_values: int
+    errors: List[str] = []
+
 class StoreTeachingMaterialRequest(BaseModel):
     topic: str
     content: str
     metadata: Optional[Dict[str, Any]] = {}
 
+class RetrieveContextRequest(BaseModel):
+    query: str
+    problem_id: str
+    materials_limit: int = 3
+    return_embedding: bool = False
+
+class RetrieveContextResponse(BaseModel):
+    hidden_value: Optional[str] = None
+    has_hidden_values: bool = False
+    topic: str = ""
+    subject: str = ""
+    materials: List[Dict[str, Any]] = []
+    query_embedding: Optional[List[float]] = None
+
 class SearchResponse(BaseModel):
     results: List[Dict[str, Any]]
 
@@ -53,6 +81,17 @@ async def store_problem(request: StoreProblemRequest):
     )
     return {"message": "Problem stored successfully"}
 
+@app.post("/problems/batch", response_model=StoreProblemsBatchResponse)
+def store_problems_batch(request: StoreProblemsBatchRequest):
+    """Store many problems and their hidden values in one call.
+    
+    Declared sync so the embedding work runs in the threadpool instead of
+    blocking the event loop.
+    """
+    print(f"storing {len(request.problems)} problems in vector service")
+    result = vector_db.store_problems_batch([problem.model_dump() for problem in request.problems])
+    return StoreProblemsBatchResponse(**result)
+
 @app.post("/store_hidden_value")
 async def store_hidden_value(request: StoreHiddenValueRequest):
     """Store a hidden value in the vector database."""
@@ -102,6 +141,19 @@ async def search_hidden_values(request: HiddenValueRequest):
         has_hidden_values=len(hidden_values) > 0
     )
 
+@app.post("/retrieve_context", response_model=RetrieveContextResponse)
+def retrieve_context(request: RetrieveContextRequest):
+    """Return the hidden-value match, problem topic and teaching materials for a query in one call."""
+    try:
+        return RetrieveContextResponse(**vector_db.retrieve_context(
+            problem_id=request.problem_id,
+            query=request.query,
+            materials_limit=request.materials_limit,
+            return_embedding=request.return_embedding
+        ))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.post("/search_materials", response_model=MaterialSearchResponse)
 async def search_materials(request: MaterialSearchRequest):
     """Search for relevant teaching materials and resources."""
@@ -0,0 +1,28 @@
+"""Add hint_ladder column to Question model
+
+Revision ID: 4e8b2f6c9d13
+Revises: 9c3e5d1a7b42
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4e8b2f6c9d13'
+down_revision: Union[str, None] = '9c3e5d1a7b42'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('questions', sa.Column('hint_ladder', sa.JSON(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('questions', 'hint_ladder')
@@ -0,0 +1,28 @@
+"""Add hiddenValueFastPath column to Test model
+
+Revision ID: 9c3e5d1a7b42
+Revises: f1968f9f941a
+Create Date: 2026-10-17 09:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9c3e5d1a7b42'
+down_revision: Union[str, None] = 'f1968f9f941a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('tests', sa.Column('hiddenValueFastPath', sa.Boolean(), nullable=True, server_default=sa.false()))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('tests', 'hiddenValueFastPath')